@@ -241,6 +241,26 @@ production_api_operations = {
                     "GET"
                 ]
             },
+            "/production-api/v1/claim-products": {
+                'function': "place available products into queued status for a job and list them",
+                'comments': 'processing_location and job_name are required, record_limit, for_user, priority, product_types and encode_urls are as for products',
+                'methods': [
+                    "POST"
+                ]
+            },
+            "/production-api/v1/pipeline": {
+                'function': "list the stages of order handling, their cadence, timeout and last run",
+                'methods': [
+                    "GET"
+                ]
+            },
+            "/production-api/v1/pipeline/<stage>": {
+                'function': "show a stage of order handling (GET) or run it now (POST)",
+                'methods': [
+                    "GET",
+                    "POST"
+                ]
+            },
             "/production-api/v1/<orderid>/<productid>": {
                 'function': "update product status, completed file locations, etc",
                 'comments': 'sceneids should be delivered in the product_ids parameter, comma separated if more than one',
@@ -0,0 +1,132 @@
+""" Identity map for domain objects loaded during a unit of work """
+
+import threading
+from contextlib import contextmanager
+
+_current = threading.local()
+
+
+class IdentityMap(object):
+    """
+    Domain objects keyed by class and id, so a row loaded once in a unit
+    of work is the same object every time it is asked for again
+    """
+
+    def __init__(self):
+        self._objects = {}
+
+    def __len__(self):
+        return len(self._objects)
+
+    def get(self, cls, id):
+        """
+        :param cls: domain class, Scene, Order or User
+        :param id: database id
+        :return: the object loaded for that row, None if it hasn't been
+        """
+        return self._objects.get((cls, id))
+
+    def merge(self, obj):
+        """
+        Register an object just loaded from the database
+
+        If its row is already mapped, the mapped object takes the fresh
+        column values, other than those it has unsaved changes to, and is
+        returned in place of obj, so every holder of it sees the same state
+
+        :param obj: domain object with an id
+        :return: the mapped object
+        """
+        key = (type(obj), obj.id)
+        held = self._objects.get(key)
+        if held is None:
+            self._objects[key] = obj
+            return obj
+
+        if hasattr(held, 'merge_from'):
+            held.merge_from(obj)
+        else:
+            held.__dict__.update(obj.__dict__)
+        return held
+
+    def evict(self, cls, ids):
+        """
+        Forget the objects loaded for rows changed behind their back, so
+        the next find() reads them again
+        :param cls: domain class
+        :param ids: database ids
+        """
+        for id in ids:
+            self._objects.pop((cls, id), None)
+
+    def clear(self):
+        self._objects.clear()
+
+
+def current():
+    """
+    The identity map of the session open on this thread
+    :return: IdentityMap, None outside of a session
+    """
+    return getattr(_current, 'map', None)
+
+
+def merge(obj):
+    """
+    Register obj with the session open on this thread, if any
+    :param obj: domain object with an id
+    :return: the mapped object, obj itself outside of a session
+    """
+    imap = current()
+    if imap is None or getattr(obj, 'id', None) is None:
+        return obj
+    return imap.merge(obj)
+
+
+def get(cls, id):
+    """
+    :param cls: domain class
+    :param id: database id
+    :return: the mapped object, None if not loaded or outside of a session
+    """
+    imap = current()
+    if imap is None:
+        return None
+    return imap.get(cls, id)
+
+
+def evict(cls, ids):
+    """
+    Drop rows updated in the database directly, such as by a bulk update,
+    from the session open on this thread, if any
+    :param cls: domain class
+    :param ids: database ids
+    """
+    imap = current()
+    if imap is not None:
+        imap.evict(cls, ids)
+
+
+@contextmanager
+def session():
+    """
+    Scope an identity map to the with block, on this thread
+
+    Inside it find() by id is answered from objects already loaded and
+    where() hands back the already loaded object for a row, refreshed
+    from the query.  Nested sessions share the outermost map
+
+        with identity.session():
+            scenes = Scene.where({'status': 'submitted'})
+            Scene.prefetch_orders(scenes)
+    """
+    outer = current()
+    if outer is not None:
+        yield outer
+        return
+
+    _current.map = IdentityMap()
+    try:
+        yield _current.map
+    finally:
+        _current.map = None
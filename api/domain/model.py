@@ -0,0 +1,117 @@
+""" Base for domain objects holding a row of a table """
+
+import copy
+
+# stands in for a column whose database value isn't known
+_UNSAVED = object()
+
+
+def _snapshot(val):
+    # values edited in place, like product_opts, are kept as a copy
+    return copy.deepcopy(val) if isinstance(val, (dict, list)) else val
+
+
+class Model(object):
+    """
+    A row of a table, held in __slots__ rather than a per instance
+    __dict__, so tens of thousands of them stay small
+
+    Keeps the column values last loaded from or written to the database,
+    so save() can write only the columns changed since.  A row loaded
+    with only some of its columns leaves the slots of the others unset
+    """
+
+    __slots__ = ('_saved',)
+
+    # every column of the row, each gets a slot
+    columns = ()
+    # columns save() writes back, in the order they are kept
+    save_columns = ()
+
+    def __repr__(self):
+        return '{0}: {1}'.format(type(self).__name__, self.as_dict())
+
+    def __getstate__(self):
+        # __slots__ objects have no __dict__ to pickle
+        return dict((name, object.__getattribute__(self, name))
+                    for name in self._slot_names() if self.loaded(name))
+
+    def __setstate__(self, state):
+        for name, val in state.iteritems():
+            setattr(self, name, val)
+
+    @classmethod
+    def _slot_names(cls):
+        return [name for klass in cls.__mro__
+                for name in getattr(klass, '__slots__', ())]
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        Build an object from a database row, without going through
+        __init__, so columns the query didn't select stay unloaded
+
+        :param row: dict of column: value
+        :return: object of cls
+        """
+        obj = cls.__new__(cls)
+        for col, val in row.iteritems():
+            setattr(obj, col, val)
+        cols = [c for c in cls.save_columns if c in row]
+        obj._mark_saved(None if len(cols) == len(cls.save_columns) else cols)
+        return obj
+
+    def loaded(self, name):
+        """
+        :param name: column or slot name
+        :return: True if the value is held, without loading it
+        """
+        try:
+            object.__getattribute__(self, name)
+            return True
+        except AttributeError:
+            return False
+
+    def as_dict(self):
+        """
+        :return: dict of column: value, for the columns that are loaded
+        """
+        return dict((col, object.__getattribute__(self, col)) for col in self.columns
+                    if self.loaded(col))
+
+    def merge_from(self, other):
+        """
+        Take the column values another copy of the same row was loaded
+        with, as what the database holds.  Columns changed here and not
+        yet saved keep their changes
+        :param other: object of the same class
+        """
+        changed = set(self.changed())
+        cols = [col for col in self.columns if other.loaded(col) and col not in changed]
+        for col in cols:
+            setattr(self, col, getattr(other, col))
+        self._mark_saved([col for col in cols if col in self.save_columns])
+
+    def _mark_saved(self, cols=None):
+        """
+        Record cols, or every saved column, as holding what the database does
+        :param cols: column names, defaults to save_columns
+        """
+        if cols is None:
+            self._saved = tuple(_snapshot(getattr(self, col)) for col in self.save_columns)
+            return
+
+        saved = getattr(self, '_saved', None) or (_UNSAVED,) * len(self.save_columns)
+        cols = set(cols)
+        self._saved = tuple(_snapshot(getattr(self, col)) if col in cols else was
+                            for col, was in zip(self.save_columns, saved))
+
+    def changed(self):
+        """
+        Columns changed since the row was loaded or last saved, columns
+        never loaded haven't changed
+        :return: list of column names
+        """
+        saved = getattr(self, '_saved', None) or (_UNSAVED,) * len(self.save_columns)
+        return [col for col, was in zip(self.save_columns, saved)
+                if self.loaded(col) and (was is _UNSAVED or getattr(self, col) != was)]
@@ -6,7 +6,8 @@ import copy
 from api.util.dbconnect import DBConnectException, db_instance
 import psycopg2.extensions as db_extns
 from api.domain.scene import Scene, SceneException
-from api.domain import sensor, format_sql_params
+from api.domain import sensor, format_sql_params, identity
+from api.domain.model import Model
 from api.system.logger import ilogger as logger
 from psycopg2.extras import Json
 
@@ -15,7 +16,7 @@ class OrderException(Exception):
     pass
 
 
-class Order(object):
+class Order(Model):
     """ Class for interacting with the ordering_order table """
 
     base_sql = ('SELECT * '
@@ -25,6 +26,19 @@ class Order(object):
     valid_statuses = ('complete', 'queued', 'oncache', 'onorder', 'purged',
                       'processing', 'error', 'unavailable', 'submitted')
 
+    columns = ('id', 'orderid', 'status', 'order_source', 'order_type',
+               'product_options', 'product_opts', 'initial_email_sent',
+               'completion_email_sent', 'note', 'completion_date', 'order_date',
+               'user_id', 'ee_order_id', 'email', 'priority')
+
+    __slots__ = columns
+
+    save_columns = ('orderid', 'status', 'order_source',
+                    'product_options', 'product_opts', 'order_type',
+                    'initial_email_sent', 'completion_email_sent',
+                    'note', 'completion_date', 'order_date', 'user_id',
+                    'ee_order_id', 'email', 'priority')
+
     def __init__(self, id=None, orderid=None, status=None, order_source=None,
                  order_type=None, product_options=None,
                  product_opts=None, initial_email_sent=None,
@@ -81,8 +95,10 @@ class Order(object):
                 else:
                     self.id = None
 
-    def __repr__(self):
-        return 'Order: {}'.format(self.__dict__)
+        # a row passed in by id is what the database holds, one looked up
+        # by orderid has nothing known to be saved yet
+        if id:
+            self._mark_saved()
 
     @classmethod
     def create(cls, params):
@@ -212,7 +228,7 @@ class Order(object):
                 for i in db:
                     od = dict(i)
                     obj = Order(**od)
-                    ret.append(obj)
+                    ret.append(identity.merge(obj))
         except DBConnectException as e:
             logger.debug('Error order where: {}\n'
                          'sql: {}'.format(e.message, log_sql))
@@ -229,6 +245,9 @@ class Order(object):
         :return: a single Order object
         """
         if isinstance(id, int):
+            held = identity.get(Order, id)
+            if held is not None:
+                return held
             found = cls.where({'id': id})
         elif isinstance(id, basestring):
             found = cls.where({'orderid': str(id)})
@@ -468,50 +487,57 @@ class Order(object):
     def save(self):
         """
         Upsert self to the database
-        """
-        sql = ('INSERT INTO ordering_order %s VALUES %s '
-               'ON CONFLICT (orderid) '
-               'DO UPDATE '
-               'SET %s = %s')
-
-        attr_tup = ('orderid', 'status', 'order_source',
-                    'product_options', 'product_opts', 'order_type',
-                    'initial_email_sent', 'completion_email_sent',
-                    'note', 'completion_date', 'order_date', 'user_id',
-                    'ee_order_id', 'email', 'priority')
-
-        vals = tuple(self.__getattribute__(v)
-                     if v != 'product_opts'
-                     else json.dumps(self.__getattribute__(v))
-                     for v in attr_tup)
 
-        cols = '({})'.format(','.join(attr_tup))
+        An order already in the database only has its changed columns
+        written, and those are refreshed from what the UPDATE returns
+        """
+        if self.id is None:
+            cols = self.save_columns
+            sql = ('INSERT INTO ordering_order ({0}) VALUES ({1}) '
+                   'ON CONFLICT (orderid) '
+                   'DO UPDATE SET {2} '
+                   'RETURNING id, {0}'
+                   .format(', '.join(cols), ', '.join(['%s'] * len(cols)),
+                           ', '.join('{0} = EXCLUDED.{0}'.format(c) for c in cols)))
+            key = ()
+        else:
+            cols = self.changed()
+            if not cols:
+                return
+            sql = ('UPDATE ordering_order SET {0} WHERE id = %s RETURNING id, {1}'
+                   .format(', '.join('{0} = %s'.format(c) for c in cols),
+                           ', '.join(cols)))
+            key = (self.id,)
+
+        vals = tuple(getattr(self, c)
+                     if c != 'product_opts'
+                     else json.dumps(getattr(self, c))
+                     for c in cols)
 
         log_sql = ''
         try:
             with db_instance() as db:
-                log_sql = db.cursor.mogrify(sql, (db_extns.AsIs(cols),
-                                                  vals,
-                                                  db_extns.AsIs(cols),
-                                                  vals))
-                db.execute(sql, (db_extns.AsIs(cols), vals,
-                                 db_extns.AsIs(cols), vals))
+                log_sql = db.cursor.mogrify(sql, vals + key)
+                db.execute(sql, vals + key)
                 db.commit()
 
                 logger.info('Saved updates to order id: {}\n'
                             'order.id: {}\nsql: {}\nargs: {}'
                             .format(self.orderid, self.id, log_sql,
-                                    zip(attr_tup, vals)))
+                                    zip(cols, vals)))
+                new = db[0]
         except DBConnectException as e:
             logger.debug('Error saving order: {}\nsql: {}'
                          .format(e.message, log_sql))
 
             raise OrderException(e)
+        except IndexError:
+            raise OrderException('Order id {} not found to save'.format(self.id))
 
-        new = Order.find(self.id)
-
-        for att in attr_tup:
-            self.__setattr__(att, new.__getattribute__(att))
+        self.id = new['id']
+        for col in cols:
+            setattr(self, col, new[col])
+        self._mark_saved(cols)
 
     def update(self, att, val):
         """
@@ -534,17 +560,20 @@ class Order(object):
         except DBConnectException as e:
             logger.debug('Error updating order: {}\nSQL: {}'
                          .format(e.message, log_sql))
-
-        self.__setattr__(att, val)
+            self.__setattr__(att, val)
+        else:
+            self.__setattr__(att, val)
+            self._mark_saved([att])
 
         return self.__getattribute__(att)
 
-    def scenes(self, sql_dict=None):
+    def scenes(self, sql_dict=None, columns=None):
         """
         Retrieve a list of Scene objects related to this
         initialized Order object
 
         :param sql_dict: dictionary object for sql parameters
+        :param columns: scene columns to select, as for Scene.where
         :return: list of Scene objects
         """
         if sql_dict:
@@ -552,7 +581,7 @@ class Order(object):
         else:
             sql_dict = {'order_id': self.id}
 
-        return Scene.where(sql_dict)
+        return Scene.where(sql_dict, columns)
 
     def scene_status_count(self, status=None):
         sql = "select count(id) from ordering_scene where order_id = %s"
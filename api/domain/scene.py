@@ -3,7 +3,9 @@
 from api.util.dbconnect import DBConnectException, db_instance
 import psycopg2.extensions as db_extns
 from api.system.logger import ilogger as logger
-from api.domain import format_sql_params
+from api.domain import format_sql_params, identity
+from api.domain.model import Model
+from api.domain.scene_log import SceneLog, SceneLogException
 import datetime
 
 
@@ -11,16 +13,48 @@ class SceneException(Exception):
     pass
 
 
-class Scene(object):
+class Scene(Model):
     """
     Class for interacting with the ordering_scene table
     and holding specific scene information
     """
 
-    base_sql = ('SELECT * '
+    columns = ('id', 'name', 'note', 'order_id', 'product_distro_location',
+               'product_dload_url', 'cksum_distro_location', 'cksum_download_url',
+               'status', 'processing_location', 'completion_date',
+               'log_file_contents', 'ee_unit_id', 'tram_order_id', 'sensor_type',
+               'job_name', 'retry_after', 'retry_limit', 'retry_count',
+               'reported_orphan', 'orphaned', 'download_size',
+               'failed_lta_status_update')
+
+    # large columns left out of queries unless asked for, and loaded on
+    # first use
+    deferred = ('log_file_contents',)
+    # kept compressed in ordering_scene_log rather than ordering_scene
+    side_logged = ('log_file_contents',)
+
+    base_sql = ('SELECT id, name, note, order_id, product_distro_location, '
+                'product_dload_url, cksum_distro_location, cksum_download_url, '
+                'status, processing_location, completion_date, '
+                'ee_unit_id, tram_order_id, sensor_type, '
+                'job_name, retry_after, retry_limit, retry_count, '
+                'reported_orphan, orphaned, download_size, '
+                'failed_lta_status_update '
                 'FROM ordering_scene '
                 'WHERE ')
 
+    # _order is the parent Order, once prefetch_orders() has loaded it
+    __slots__ = columns + ('_order',)
+
+    save_columns = ('status', 'cksum_download_url', 'log_file_contents',
+                    'processing_location', 'retry_after', 'job_name',
+                    'note', 'retry_count', 'sensor_type',
+                    'product_dload_url', 'tram_order_id',
+                    'completion_date', 'ee_unit_id', 'retry_limit',
+                    'cksum_distro_location', 'product_distro_location',
+                    'reported_orphan', 'orphaned', 'failed_lta_status_update',
+                    'download_size')
+
     def __init__(self, id=None, name=None, note=None, order_id=None,
                  product_distro_location=None, product_dload_url=None,
                  cksum_distro_location=None, cksum_download_url=None,
@@ -99,8 +133,73 @@ class Scene(object):
                 else:
                     self.id = None
 
-    def __repr__(self):
-        return 'Scene: {}'.format(self.__dict__)
+        # a row passed in by id is what the database holds, one looked up
+        # by name has nothing known to be saved yet
+        if id:
+            self._mark_saved()
+
+    def __getattr__(self, name):
+        # only reached for a slot that was never set, a column the query
+        # that built this scene didn't select
+        if name not in self.columns or not self.loaded('id'):
+            raise AttributeError(name)
+
+        if name in self.deferred:
+            cols = [name]
+        else:
+            cols = [c for c in self.columns
+                    if c not in self.deferred and not self.loaded(c)]
+        self._load(cols)
+        return object.__getattribute__(self, name)
+
+    def _load(self, cols):
+        if 'log_file_contents' in cols:
+            try:
+                self.log_file_contents = SceneLog.get(self.id)
+            except SceneLogException as e:
+                raise SceneException(e)
+            self._mark_saved(['log_file_contents'])
+            cols = [c for c in cols if c != 'log_file_contents']
+            if not cols:
+                return
+
+        sql = 'SELECT {0} FROM ordering_scene WHERE id = %s'.format(', '.join(cols))
+
+        log_sql = ''
+        try:
+            with db_instance() as db:
+                log_sql = db.cursor.mogrify(sql, (self.id,))
+                db.select(sql, (self.id,))
+                row = db[0]
+        except DBConnectException as e:
+            logger.debug('Error loading scene columns: {}\n'
+                         'sql: {}'.format(e.message, log_sql))
+            raise SceneException(e)
+        except IndexError:
+            raise SceneException('Scene id {} not found to load {}'
+                                 .format(self.id, ', '.join(cols)))
+
+        for col in cols:
+            setattr(self, col, row[col])
+        self._mark_saved([c for c in cols if c in self.save_columns])
+
+    @classmethod
+    def _select_sql(cls, columns=None):
+        """
+        :param columns: columns to select, defaults to every column but
+         the deferred ones.  id is always selected
+        :return: SELECT ... WHERE, for format_sql_params
+        """
+        if columns is None:
+            return cls.base_sql
+
+        unknown = set(columns) - set(cls.columns)
+        if unknown:
+            raise SceneException('{0} are not ordering_scene columns'
+                                 .format(', '.join(sorted(unknown))))
+
+        cols = ['id'] + [c for c in columns if c != 'id' and c not in cls.side_logged]
+        return 'SELECT {0} FROM ordering_scene WHERE '.format(', '.join(cols))
 
     @classmethod
     def get(cls, col_name, scene_name, orderid):
@@ -202,18 +301,24 @@ class Scene(object):
             raise SceneException(e.message)
 
     @classmethod
-    def where(cls, params):
+    def where(cls, params, columns=None, stream=False):
         """
         Query for a particular row in the ordering_scene table
 
+        Columns not selected are loaded on first use
+
         :param params: dictionary of column: value parameter to select on
+        :param columns: columns to select, defaults to all but the
+         deferred ones
+        :param stream: fetch the rows from a server side cursor, so a
+         large match is never held as raw rows and Scenes at once
         :return: list of matching Scene objects
         """
         if not isinstance(params, dict):
             raise SceneException('Where arguments must be '
                                  'passed as a dictionary')
 
-        sql, values = format_sql_params(cls.base_sql, params)
+        sql, values = format_sql_params(cls._select_sql(columns), params)
 
         ret = []
         log_sql = ''
@@ -221,11 +326,10 @@ class Scene(object):
             with db_instance() as db:
                 log_sql = db.cursor.mogrify(sql, values)
                 logger.info('scene.py where sql: {}'.format(log_sql))
-                db.select(sql, values)
+                db.select(sql, values, stream=stream)
                 for i in db:
-                    sd = dict(i)
-                    obj = Scene(**sd)
-                    ret.append(obj)
+                    obj = Scene.from_row(dict(i))
+                    ret.append(identity.merge(obj))
         except DBConnectException as e:
             logger.debug('Error retrieving scenes: {}\n'
                          'sql: {}'.format(e.message, log_sql))
@@ -241,14 +345,14 @@ class Scene(object):
             return None
 
     @classmethod
-    def find(cls, ids):
+    def find(cls, ids, columns=None):
         """
         Retrieve scene objects by id
         :param ids: list of scene ids, or single scene id
+        :param columns: columns to select, as for where()
         :return: list
         """
-        sql = '{} id IN %s;'.format(cls.base_sql)
-        resp = list()
+        sql = '{} id IN %s;'.format(cls._select_sql(columns))
         if not isinstance(ids, list) and not isinstance(ids, int):
             raise SceneException("a list of integers, or a single integer, "
                                  "are the only valid arguments for Scene.find()")
@@ -263,14 +367,19 @@ class Scene(object):
             _single = True
             ids = [ids]
 
-        with db_instance() as db:
-            db.select(sql, [tuple(ids)])
+        # scenes already loaded in this session don't need the round trip
+        held = dict((i, identity.get(Scene, i)) for i in ids)
+        missing = [i for i in ids if held[i] is None]
+
+        if missing:
+            with db_instance() as db:
+                db.select(sql, [tuple(missing)])
 
-        if db:
             for i in db:
-                sd = dict(i)
-                obj = Scene(**sd)
-                resp.append(obj)
+                obj = identity.merge(Scene.from_row(dict(i)))
+                held[obj.id] = obj
+
+        resp = [held[i] for i in ids if held.get(i) is not None]
 
         if _single:
             return resp[0]
@@ -291,6 +400,17 @@ class Scene(object):
         if not isinstance(updates, dict):
             raise TypeError('Scene.bulk_update updates should be a dict')
 
+        if 'log_file_contents' in updates:
+            updates = dict(updates)
+            log = updates.pop('log_file_contents')
+            try:
+                SceneLog.store(dict((i, log) for i in ids))
+            except SceneLogException as e:
+                raise SceneException(e)
+            if not updates:
+                identity.evict(Scene, ids)
+                return True
+
         sql = 'UPDATE ordering_scene SET %s = %s WHERE id in %s'
 
         fields = '({})'.format(','.join(updates.keys()))
@@ -313,6 +433,8 @@ class Scene(object):
                          .format(e.message, log_sql))
             raise SceneException(e)
 
+        # scenes loaded earlier in the session no longer match their rows
+        identity.evict(Scene, ids)
         return True
 
     def update(self, att, val):
@@ -324,6 +446,17 @@ class Scene(object):
         :param val: new value
         :return: updated value from self
         """
+        if att in self.side_logged:
+            try:
+                SceneLog.store({self.id: val})
+            except SceneLogException as e:
+                logger.debug('Error updating scene log: {}'.format(e))
+                self.__setattr__(att, val)
+            else:
+                self.__setattr__(att, val)
+                self._mark_saved([att])
+            return self.__getattribute__(att)
+
         sql = 'update ordering_scene set %s = %s where id = %s'
 
         log_sql = ''
@@ -337,59 +470,112 @@ class Scene(object):
         except DBConnectException as e:
             logger.debug('Error updating scene: {}\nSQL: {}'
                          .format(e.message, log_sql))
-
-        self.__setattr__(att, val)
+            self.__setattr__(att, val)
+        else:
+            self.__setattr__(att, val)
+            self._mark_saved([att])
 
         return self.__getattribute__(att)
 
     def save(self):
         """
-        Save the current configuration of the scene object to the DB
+        Save the changed columns of the scene object to the DB
+
+        The written columns are refreshed from what the UPDATE returns,
+        the rest of the row isn't read back.  The processing log is kept
+        in ordering_scene_log, see SceneLog
         """
-        sql = 'UPDATE ordering_scene SET %s = %s WHERE id = %s'
+        cols = self.changed()
 
-        attr_tup = ('status', 'cksum_download_url', 'log_file_contents',
-                    'processing_location', 'retry_after', 'job_name',
-                    'note', 'retry_count', 'sensor_type',
-                    'product_dload_url', 'tram_order_id',
-                    'completion_date', 'ee_unit_id', 'retry_limit',
-                    'cksum_distro_location', 'product_distro_location',
-                    'reported_orphan', 'orphaned', 'failed_lta_status_update',
-                    'download_size')
+        logs = [c for c in cols if c in self.side_logged]
+        if logs:
+            try:
+                SceneLog.store({self.id: self.log_file_contents})
+            except SceneLogException as e:
+                raise SceneException(e)
+            self._mark_saved(logs)
+            cols = [c for c in cols if c not in logs]
 
-        vals = tuple(self.__getattribute__(v) for v in attr_tup)
-        cols = '({})'.format(','.join(attr_tup))
+        if not cols:
+            return
+
+        sql = ('UPDATE ordering_scene SET {0} WHERE id = %s RETURNING {1}'
+               .format(', '.join('{0} = %s'.format(c) for c in cols),
+                       ', '.join(cols)))
+        vals = tuple(getattr(self, c) for c in cols)
 
         log_sql = ''
         try:
             with db_instance() as db:
-                log_sql = db.cursor.mogrify(sql, (db_extns.AsIs(cols),
-                                                  vals, self.id))
+                log_sql = db.cursor.mogrify(sql, vals + (self.id,))
 
-                db.execute(sql, (db_extns.AsIs(cols), vals, self.id))
+                db.execute(sql, vals + (self.id,))
                 db.commit()
                 logger.info('\n*** Saved updates to scene id: {}, name:{}\n'
                             'sql: {}\n args: {}\n***'
-                            .format(self.id, self.name,
-                                    log_sql, zip(attr_tup, vals)))
+                            .format(self.id, self.as_dict().get('name'),
+                                    log_sql, zip(cols, vals)))
+                new = db[0]
         except DBConnectException as e:
             logger.debug("Error saving scene: {}\n"
                          "sql: {}".format(e.message, log_sql))
             raise SceneException(e)
+        except IndexError:
+            raise SceneException('Scene id {} not found to save'.format(self.id))
+
+        for col in cols:
+            setattr(self, col, new[col])
+        self._mark_saved(cols)
+
+    @classmethod
+    def prefetch_orders(cls, scenes):
+        """
+        Load the parent Order of each scene in one query, so order_attr()
+        is answered without going back to the database per scene
+
+        Orders already loaded in this session are reused
 
-        new = Scene.where({'id': self.id})[0]
+        :param scenes: list of Scene objects
+        :return: dict of order id: Order
+        """
+        from api.domain.order import Order, OrderException
+
+        orders = {}
+        for s in scenes:
+            order = getattr(s, '_order', None) or identity.get(Order, s.order_id)
+            if order is not None:
+                orders[s.order_id] = order
+
+        missing = set(s.order_id for s in scenes) - set(orders)
+        if missing:
+            try:
+                found = Order.where({'id': tuple(missing)})
+            except OrderException as e:
+                raise SceneException(e)
+            orders.update((o.id, o) for o in found)
+
+        for s in scenes:
+            s._order = orders.get(s.order_id)
 
-        for att in attr_tup:
-            self.__setattr__(att, new.__getattribute__(att))
+        return orders
 
     def order_attr(self, col):
         """
         Select the column value from the ordering_order table for this
         specific scene
 
+        Answered from the parent Order when prefetch_orders() or the
+        session has already loaded it
+
         :param col: column to select on
         :return: value
         """
+        from api.domain.order import Order
+
+        order = getattr(self, '_order', None) or identity.get(Order, self.order_id)
+        if order is not None and col in order.columns:
+            return getattr(order, col)
+
         sql = ('SELECT %s '
                'FROM ordering_scene JOIN ordering_order '
                'ON ordering_order.id = ordering_scene.order_id '
@@ -0,0 +1,200 @@
+""" Holds domain objects for scene processing logs """
+
+import datetime
+import zlib
+
+import psycopg2
+
+from api.util.dbconnect import DBConnectException, db_instance
+from api.providers.configuration.configuration_provider import ConfigurationProvider
+from api.system.logger import ilogger as logger
+
+config = ConfigurationProvider()
+
+
+class SceneLogException(Exception):
+    pass
+
+
+class SceneLog(object):
+    """
+    Class for interacting with the ordering_scene_log table, which keeps
+    the processing log of each scene zlib compressed, out of the way of
+    the ordering_scene rows everything else scans
+
+    Logs over log.max_bytes (default 1MB) are cut down to their head and
+    the rest of the limit from their tail, where processing errors end up
+    """
+
+    # share of a truncated log kept from its start
+    head_fraction = 0.25
+    marker = '\n\n[... {0} bytes of log dropped ...]\n\n'
+
+    @staticmethod
+    def limits():
+        """
+        :return: tuple(log.max_bytes, log.compress_level), defaults
+         1MB and 6
+        """
+        max_bytes, level = config.get(['log.max_bytes', 'log.compress_level'])
+        return int(max_bytes or 1048576), int(level or 6)
+
+    @classmethod
+    def truncate(cls, text, max_bytes):
+        """
+        Cut a log down to max_bytes, keeping its head and tail
+
+        :param text: log contents
+        :param max_bytes: most bytes to keep
+        :return: tuple(text, True if anything was dropped)
+        """
+        if len(text) <= max_bytes:
+            return text, False
+
+        head = int(max_bytes * cls.head_fraction)
+        tail = max(max_bytes - head, 0)
+        dropped = len(text) - head - tail
+        return ''.join((text[:head], cls.marker.format(dropped),
+                        text[len(text) - tail:])), True
+
+    @classmethod
+    def store(cls, logs, overwrite=True):
+        """
+        Compress and save the logs of many scenes in one statement, an
+        empty or None log deletes what was kept for its scene
+
+        :param logs: dict of scene id: log contents
+        :param overwrite: replace logs already kept, otherwise leave them
+        :return: True
+        """
+        if not logs:
+            return True
+
+        max_bytes, level = cls.limits()
+        now = datetime.datetime.now()
+
+        rows, cleared = [], []
+        for scene_id, text in logs.iteritems():
+            if not text:
+                cleared.append(scene_id)
+                continue
+            if isinstance(text, unicode):
+                text = text.encode('utf-8')
+            size = len(text)
+            text, truncated = cls.truncate(text, max_bytes)
+            rows.append((scene_id, psycopg2.Binary(zlib.compress(text, level)),
+                         size, truncated, now))
+
+        sql = ('INSERT INTO ordering_scene_log '
+               '(scene_id, log, size, truncated, updated) VALUES {0} '
+               'ON CONFLICT (scene_id) DO {1}')
+        conflict = ('UPDATE SET log = EXCLUDED.log, size = EXCLUDED.size, '
+                    'truncated = EXCLUDED.truncated, updated = EXCLUDED.updated'
+                    if overwrite else 'NOTHING')
+
+        log_sql = ''
+        try:
+            with db_instance() as db:
+                if rows:
+                    values = ','.join(db.cursor.mogrify('(%s, %s, %s, %s, %s)', row)
+                                      for row in rows)
+                    log_sql = sql.format('[{0} rows]'.format(len(rows)), conflict)
+                    db.execute(sql.format(values, conflict))
+                if cleared and overwrite:
+                    log_sql = db.cursor.mogrify('DELETE FROM ordering_scene_log '
+                                                'WHERE scene_id IN %s', (tuple(cleared),))
+                    db.execute(log_sql)
+                db.commit()
+        except DBConnectException as e:
+            logger.debug('Error storing scene logs: {}\nSQL: {}'
+                         .format(e.message, log_sql))
+            raise SceneLogException(e)
+
+        return True
+
+    @classmethod
+    def clear(cls, scene_ids):
+        """
+        Drop the logs kept for scenes
+        :param scene_ids: list of scene ids
+        :return: True
+        """
+        return cls.store(dict((i, None) for i in scene_ids))
+
+    @classmethod
+    def _compressed(cls, scene_ids):
+        """
+        Compressed logs of many scenes, pulled from the server a few rows
+        at a time so only the logs being worked on are held in memory
+        :param scene_ids: list of scene ids
+        :return: generator of tuple(scene id, compressed log)
+        """
+        if not scene_ids:
+            return
+
+        sql = ('SELECT scene_id, log FROM ordering_scene_log '
+               'WHERE scene_id IN %s')
+
+        log_sql = ''
+        try:
+            with db_instance() as db:
+                log_sql = db.cursor.mogrify(sql, (tuple(scene_ids),))
+                db.select(sql, (tuple(scene_ids),), stream=True, itersize=16)
+                for row in db:
+                    yield row['scene_id'], str(row['log'])
+        except (DBConnectException, psycopg2.Error) as e:
+            logger.debug('Error retrieving scene logs: {}\nSQL: {}'
+                         .format(e.message, log_sql))
+            raise SceneLogException(e)
+
+    @staticmethod
+    def stream(compressed, chunk_size=65536):
+        """
+        Decompress a log a chunk at a time
+
+        :param compressed: zlib compressed log
+        :param chunk_size: most bytes per chunk
+        :return: generator of str
+        """
+        decomp = zlib.decompressobj()
+        data = compressed
+        while data:
+            chunk = decomp.decompress(data, chunk_size)
+            if chunk:
+                yield chunk
+            data = decomp.unconsumed_tail
+        rest = decomp.flush()
+        if rest:
+            yield rest
+
+    @classmethod
+    def read(cls, scene_ids, tail=None):
+        """
+        Logs of many scenes, in one query
+
+        :param scene_ids: list of scene ids
+        :param tail: keep only the last tail bytes of each log, which is
+         all that is held in memory while it is decompressed
+        :return: dict of scene id: log contents, '' for scenes without one
+        """
+        ret = dict((i, '') for i in scene_ids)
+        # each log is decompressed, and cut down to its tail, as its row
+        # comes in, rather than once they have all been fetched
+        for scene_id, compressed in cls._compressed(scene_ids):
+            if tail is None:
+                ret[scene_id] = ''.join(cls.stream(compressed))
+                continue
+
+            kept = ''
+            for chunk in cls.stream(compressed):
+                kept = (kept + chunk)[-tail:] if tail > 0 else ''
+            ret[scene_id] = kept
+        return ret
+
+    @classmethod
+    def get(cls, scene_id):
+        """
+        :param scene_id: scene id
+        :return: the scene's log contents, '' if none is kept
+        """
+        return cls.read([scene_id])[scene_id]
@@ -0,0 +1,175 @@
+""" Holds domain objects for the tram order poll schedule """
+
+import datetime
+
+from api.util.dbconnect import DBConnectException, db_instance
+from api.system.logger import ilogger as logger
+
+
+class TramPollException(Exception):
+    pass
+
+
+class TramPoll(object):
+    """
+    Class for interacting with the ordering_tram_poll table, which keeps
+    when each outstanding tram order should next be asked about
+    """
+
+    base_sql = ('SELECT * '
+                'FROM ordering_tram_poll ')
+
+    # unit statuses that move a waiting scene out of onorder
+    finished = frozenset(['R', 'C'])
+    # LTA is working on the unit, keep polling at the current rate
+    in_process = frozenset(['I'])
+
+    def __init__(self, tram_order_id=None, first_seen=None, last_polled=None,
+                 polls=0, quiet_polls=0, next_poll_at=None):
+        """
+        Initialize the TramPoll object with all the information for it
+        from the database
+
+        :param tram_order_id: LTA tram order
+        :param first_seen: when a scene was first found onorder with it
+        :param last_polled: when LTA was last asked for its status
+        :param polls: how many times LTA has been asked for its status
+        :param quiet_polls: polls in a row that moved none of its scenes
+        :param next_poll_at: when it is next due to be polled
+        """
+        self.tram_order_id = tram_order_id
+        self.first_seen = first_seen
+        self.last_polled = last_polled
+        self.polls = polls
+        self.quiet_polls = quiet_polls
+        self.next_poll_at = next_poll_at
+
+    def __repr__(self):
+        return 'TramPoll: {}'.format(self.__dict__)
+
+    @staticmethod
+    def interval(age, quiet_polls, base=300, ceiling=21600, age_fraction=0.1):
+        """
+        Seconds to wait before polling a tram order again
+
+        Doubles with every poll in a row that moved none of the order's
+        scenes, and is never less than age_fraction of the order's age,
+        so an order that has sat at LTA for days isn't asked about every
+        few minutes
+
+        :param age: seconds since the order was first seen
+        :param quiet_polls: polls in a row that moved none of its scenes
+        :param base: seconds to wait after a poll that moved scenes
+        :param ceiling: most seconds to ever wait
+        :param age_fraction: share of the order's age to wait at least
+        :return: float
+        """
+        wait = max(base * 2 ** min(quiet_polls, 16), age * age_fraction)
+        return float(min(wait, ceiling))
+
+    @classmethod
+    def due(cls, waiting, now=None):
+        """
+        Bring the schedule in line with the outstanding tram orders and
+        return the ones due to be polled
+
+        Orders not seen before are due straight away, orders no longer
+        in waiting are dropped from the schedule
+
+        :param waiting: dict of tram_order_id: number of onorder scenes
+         waiting on it
+        :param now: datetime to schedule against, defaults to now
+        :return: list of TramPoll, those with the most scenes waiting
+         first, then the longest overdue
+        """
+        now = now or datetime.datetime.now()
+        tram_ids = list(waiting.keys())
+
+        log_sql = ''
+        try:
+            with db_instance() as db:
+                if tram_ids:
+                    sql = ('DELETE FROM ordering_tram_poll '
+                           'WHERE tram_order_id <> ALL(%s)')
+                    log_sql = db.cursor.mogrify(sql, (tram_ids,))
+                    db.execute(sql, (tram_ids,))
+
+                    sql = ('INSERT INTO ordering_tram_poll '
+                           '(tram_order_id, first_seen, next_poll_at) '
+                           'SELECT t, %s, %s FROM unnest(%s) t '
+                           'ON CONFLICT (tram_order_id) DO NOTHING')
+                    log_sql = db.cursor.mogrify(sql, (now, now, tram_ids))
+                    db.execute(sql, (now, now, tram_ids))
+                else:
+                    log_sql = 'DELETE FROM ordering_tram_poll'
+                    db.execute(log_sql)
+
+                sql = cls.base_sql + 'WHERE next_poll_at <= %s'
+                log_sql = db.cursor.mogrify(sql, (now,))
+                db.select(sql, (now,))
+                db.commit()
+        except DBConnectException as e:
+            logger.debug('Error scheduling tram polls: {}\nSQL: {}'
+                         .format(e.message, log_sql))
+            raise TramPollException(e)
+
+        polls = [TramPoll(**dict(row)) for row in db]
+        polls.sort(key=lambda p: (-waiting.get(p.tram_order_id, 0),
+                                  p.next_poll_at, p.tram_order_id))
+        return polls
+
+    @classmethod
+    def record(cls, polled, now=None, **schedule):
+        """
+        Schedule the next poll for each of the tram orders just polled
+
+        A poll that moved any waiting scene resets the backoff, one that
+        found units in process keeps the current rate, anything else
+        backs off further
+
+        :param polled: list of tuple(TramPoll, set of unit statuses
+         returned for its waiting scenes)
+        :param now: datetime the polls were made, defaults to now
+        :param schedule: base, ceiling and age_fraction for interval()
+        :return: True
+        """
+        if not polled:
+            return True
+
+        now = now or datetime.datetime.now()
+
+        rows = []
+        for poll, statuses in polled:
+            if statuses & cls.finished:
+                quiet = 0
+            elif statuses & cls.in_process:
+                quiet = poll.quiet_polls
+            else:
+                quiet = poll.quiet_polls + 1
+
+            age = (now - (poll.first_seen or now)).total_seconds()
+            wait = cls.interval(age, quiet, **schedule)
+            rows.append((poll.tram_order_id, quiet,
+                         now + datetime.timedelta(seconds=wait)))
+
+        sql = ('UPDATE ordering_tram_poll p '
+               'SET last_polled = %s, polls = p.polls + 1, '
+               'quiet_polls = v.quiet_polls, next_poll_at = v.next_poll_at '
+               'FROM (VALUES {0}) AS v (tram_order_id, quiet_polls, next_poll_at) '
+               'WHERE p.tram_order_id = v.tram_order_id')
+
+        log_sql = ''
+        try:
+            with db_instance() as db:
+                values = ','.join(db.cursor.mogrify('(%s, %s, %s)', row)
+                                  for row in rows)
+                sql = sql.format(values)
+                log_sql = db.cursor.mogrify(sql, (now,))
+                db.execute(sql, (now,))
+                db.commit()
+        except DBConnectException as e:
+            logger.debug('Error recording tram polls: {}\nSQL: {}'
+                         .format(e.message, log_sql))
+            raise TramPollException(e)
+
+        return True
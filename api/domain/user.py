@@ -6,7 +6,7 @@ import datetime
 from passlib.hash import pbkdf2_sha256
 from validate_email import validate_email
 
-from api.domain import format_sql_params
+from api.domain import format_sql_params, identity
 from api.domain.order import Order
 from api.domain.scene import Scene
 from api.external.ers import ERSApi, ERSApiException
@@ -153,7 +153,7 @@ class User(object):
                 for i in db:
                     obj = User(i["username"], i["email"], i["first_name"],
                                i["last_name"], i["contactid"])
-                    ret.append(obj)
+                    ret.append(identity.merge(obj))
         except DBConnectException as e:
                 logger.debug('Error querying for users: {}\n'
                              'sql: {}'.format(e.message, log_sql))
@@ -177,7 +177,6 @@ class User(object):
     @classmethod
     def find(cls, ids):
         sql = '{} id IN %s;'.format(cls.base_sql)
-        resp = list()
         if not isinstance(ids, list) and not isinstance(ids, int):
             raise UserException("a list of integers, or a single integer, "
                                  "are the only valid arguments for User.find()")
@@ -192,14 +191,20 @@ class User(object):
             _single = True
             ids = [ids]
 
-        with db_instance() as db:
-            db.select(sql, [tuple(ids)])
+        # users already loaded in this session don't need the round trip
+        held = dict((i, identity.get(User, i)) for i in ids)
+        missing = [i for i in ids if held[i] is None]
+
+        if missing:
+            with db_instance() as db:
+                db.select(sql, [tuple(missing)])
 
-        if db:
             for i in db:
-                obj = User(i["username"], i["email"], i["first_name"],
-                               i["last_name"], i["contactid"])
-                resp.append(obj)
+                obj = identity.merge(User(i["username"], i["email"], i["first_name"],
+                                          i["last_name"], i["contactid"]))
+                held[obj.id] = obj
+
+        resp = [held[i] for i in ids if held.get(i) is not None]
 
         if _single:
             return resp[0]
@@ -259,5 +264,6 @@ class User(object):
 
     def active_hadoop_job_names(self):
         order_ids = tuple([o.id for o in Order.where({'status': 'ordered', 'user_id': self.id})])
-        return [s.job_name for s in Scene.where({'status': ('processing', 'queued'), 'order_id': order_ids})]
+        return [s.job_name for s in Scene.where({'status': ('processing', 'queued'), 'order_id': order_ids},
+                                                ['job_name'])]
 
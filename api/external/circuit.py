@@ -0,0 +1,184 @@
+'''
+Purpose: circuit breakers for calls to external services, so a service
+that is down or crawling fails callers fast instead of holding them for
+a full timeout each
+'''
+
+import collections
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from api.providers.configuration.configuration_provider import ConfigurationProvider
+from api.system.logger import ilogger as logger
+
+config = ConfigurationProvider()
+
+
+class CircuitOpenException(Exception):
+    ''' Raised instead of calling a service whose circuit is open '''
+    pass
+
+
+class CircuitBreaker(object):
+    ''' Tracks the outcome of the last window calls to a service
+
+    Closed, calls go through.  Once at least min_calls of the last window
+    calls were made and failure_rate of them raised, the circuit opens and
+    calls fail with CircuitOpenException without being made.  After
+    reset_timeout seconds it is half open, and a single probe call is let
+    through; the circuit closes if it succeeds and opens again if not.
+
+    Wrap each call to the service in call(), anything raised inside the
+    block counts as a failure unless a failure test says otherwise:
+
+        with circuit.breaker('lta').call():
+            client.get_order_status(tid)
+    '''
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, window=20, min_calls=5, failure_rate=0.5,
+                 reset_timeout=60):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.opened_at = None
+        self._outcomes = collections.deque(maxlen=window)
+        self._probing = False
+        self._lock = threading.Lock()
+        self.stats = {'calls': 0, 'failures': 0, 'rejected': 0, 'opened': 0}
+
+    def __repr__(self):
+        return 'CircuitBreaker:{0}:{1}'.format(self.name, self.state)
+
+    def is_open(self):
+        ''' True while calls would be rejected without a probe being let
+        through, used to skip whole stages of work up front '''
+        with self._lock:
+            return (self.state == self.OPEN and
+                    time.time() - self.opened_at < self.reset_timeout)
+
+    def _before(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.time() - self.opened_at < self.reset_timeout:
+                    self.stats['rejected'] += 1
+                    raise CircuitOpenException('{0} circuit is open'.format(self.name))
+                self.state = self.HALF_OPEN
+
+            if self.state == self.HALF_OPEN:
+                if self._probing:
+                    self.stats['rejected'] += 1
+                    raise CircuitOpenException('{0} circuit is half open, '
+                                               'waiting on a probe'.format(self.name))
+                self._probing = True
+                return True
+
+            return False
+
+    def _after(self, probe, failed):
+        with self._lock:
+            self.stats['calls'] += 1
+            self.stats['failures'] += int(failed)
+
+            if probe:
+                self._probing = False
+                self._outcomes.clear()
+                if failed:
+                    self._open()
+                else:
+                    logger.warn('{0} circuit closed'.format(self.name))
+                    self.state = self.CLOSED
+                return
+
+            self._outcomes.append(failed)
+            if (self.state == self.CLOSED and len(self._outcomes) >= self.min_calls and
+                    float(sum(self._outcomes)) / len(self._outcomes) >= self.failure_rate):
+                self._open()
+
+    def _open(self):
+        logger.warn('{0} circuit opened, failing calls for {1} seconds'
+                    .format(self.name, self.reset_timeout))
+        self.state = self.OPEN
+        self.opened_at = time.time()
+        self.stats['opened'] += 1
+        self._outcomes.clear()
+
+    @contextmanager
+    def call(self, failure=None):
+        ''' Guard a call to the service for the duration of the with block
+
+        Raises CircuitOpenException up front if the call shouldn't be made
+
+        Keyword args:
+        failure Callable taking the exception raised, True if it means the
+                service is failing.  Anything else was an answer from the
+                service, like a fault for bad input, and is re-raised
+                without counting against it.  Defaults to all exceptions
+        '''
+        probe = self._before()
+        try:
+            yield
+        except Exception, e:
+            self._after(probe, failure is None or bool(failure(e)))
+            raise
+        self._after(probe, False)
+
+    def statistics(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['state'] = self.state
+        return stats
+
+
+_breakers = {}
+_breakers_pid = None
+_breakers_lock = threading.Lock()
+
+
+def breaker(name):
+    ''' The process wide breaker for a service, configured from
+    ordering_configuration the first time it is asked for:
+
+    circuit.window         calls the failure rate is measured over (default 20)
+    circuit.min_calls      calls needed before the circuit can open (default 5)
+    circuit.failure_rate   share of failed calls that opens it (default 0.5)
+    circuit.reset_timeout  seconds before a probe is let through (default 60)
+
+    Keyword args:
+    name Service name, one of lta, order_wrapper, lpdaac, ers, onlinecache
+
+    Returns:
+    CircuitBreaker
+    '''
+    global _breakers, _breakers_pid
+
+    with _breakers_lock:
+        if _breakers_pid != os.getpid():
+            _breakers = {}
+            _breakers_pid = os.getpid()
+
+        if name not in _breakers:
+            window, min_calls, rate, reset = config.get(['circuit.window',
+                                                         'circuit.min_calls',
+                                                         'circuit.failure_rate',
+                                                         'circuit.reset_timeout'])
+            _breakers[name] = CircuitBreaker(name,
+                                             window=int(window or 20),
+                                             min_calls=int(min_calls or 5),
+                                             failure_rate=float(rate or 0.5),
+                                             reset_timeout=float(reset or 60))
+        return _breakers[name]
+
+
+def statistics():
+    ''' Counters and state for each breaker in this process '''
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return dict((b.name, b.statistics()) for b in breakers)
@@ -3,7 +3,7 @@ Purpose: ERS API client module
 Author: Clay Austin
 '''
 
-import requests
+from api.external import circuit, sessions
 from api.providers.configuration.configuration_provider import ConfigurationProvider
 
 cfg = ConfigurationProvider()
@@ -22,12 +22,14 @@ class ERSApi(object):
     def _api_post(self, url, data):
         # certificate verification fails in dev/tst
         verify = True if cfg.mode == 'ops' else False
-        return requests.post(self._host+url, data=data, verify=verify).json()
+        with circuit.breaker('ers').call():
+            return sessions.session().post(self._host+url, data=data, verify=verify).json()
 
     def _api_get(self, url, header):
         # certificate verification fails in dev/tst
         verify = True if cfg.mode == 'ops' else False
-        return requests.get(self._host+url, headers=header, verify=verify).json()
+        with circuit.breaker('ers').call():
+            return sessions.session().get(self._host+url, headers=header, verify=verify).json()
 
     def get_user_info(self, user, passw):
         auth_resp = self._api_post('/auth', {'username': user, 'password': passw, 'client_secret': self._secret})
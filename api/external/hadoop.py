@@ -30,22 +30,21 @@ class HadoopHandler(object):
 
     def job_names_ids(self):
         cache_key = "jobs_names_cache"
-        resp = cache.get(cache_key)
+        return cache.get_or_compute(cache_key, self._job_names_ids, 180, stale=60)
 
-        if not resp:
-            cmd = "hadoop job -list | egrep '^job' | awk '{print $1}' | " \
-                  "xargs -n 1 -I {} sh -c \"hadoop job -status {} | " \
-                  "egrep '^tracking' | awk '{print \$3}'\" | " \
-                  "xargs -n 1 -I{} sh -c \" echo -n {} | " \
-                  "sed 's/.*jobid=//'; echo -n ' ';curl -s -XGET {} | " \
-                  "grep 'Job Name' | sed 's/.* //' | sed 's/<br>//'\""
-            _stdout = self._remote_cmd(cmd)['stdout']
-            _id_name_list = [str(i).rstrip('\n') for i in _stdout]
-            resp = {}
-            for ids in _id_name_list:
-                ids_list = ids.split(' ')
-                resp[ids_list[1]] = ids_list[0]
-            cache.set(cache_key, resp, 180)
+    def _job_names_ids(self):
+        cmd = "hadoop job -list | egrep '^job' | awk '{print $1}' | " \
+              "xargs -n 1 -I {} sh -c \"hadoop job -status {} | " \
+              "egrep '^tracking' | awk '{print \$3}'\" | " \
+              "xargs -n 1 -I{} sh -c \" echo -n {} | " \
+              "sed 's/.*jobid=//'; echo -n ' ';curl -s -XGET {} | " \
+              "grep 'Job Name' | sed 's/.* //' | sed 's/<br>//'\""
+        _stdout = self._remote_cmd(cmd)['stdout']
+        _id_name_list = [str(i).rstrip('\n') for i in _stdout]
+        resp = {}
+        for ids in _id_name_list:
+            ids_list = ids.split(' ')
+            resp[ids_list[1]] = ids_list[0]
 
         return resp
 
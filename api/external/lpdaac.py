@@ -3,11 +3,12 @@ Purpose: lpdaac services client module
 Author: David V. Hill
 '''
 
-import requests
 import os
 
 from api.domain import sensor
 from api import util as utils
+from api.external import circuit, sessions
+from api.util.parallel import bounded_map
 
 from api.providers.configuration.configuration_provider import ConfigurationProvider
 from api.system.logger import ilogger as logger
@@ -18,19 +19,46 @@ class LPDAACService(object):
 
     def __init__(self):
         self.datapool = config.url_for('modis.datapool')
+        self._path_config = None
 
     def verify_products(self, products):
-        response = {}
-
-        if isinstance(products, str):
+        if isinstance(products, basestring):
             products = [products]
 
-        for product in products:
+        # instances, so the names checked and the keys looked up are the
+        # same product_id whatever form the caller passed them in
+        products = [sensor.instance(p) if isinstance(p, basestring) else p
+                    for p in products]
+        found = self.inputs_exist(products)
 
-            if isinstance(product, basestring):
-                product = sensor.instance(product)
+        return dict((p.product_id, found.get(p.product_id, False)) for p in products)
 
-            response[product.product_id] = self.input_exists(product)
+    def inputs_exist(self, products):
+        '''Checks whether each of a batch of LPDAAC products is available
+        for download, with up to lpdaac.check_workers (default 16) HEAD
+        requests in flight at once over the shared session
+
+        Keyword args:
+        products - list of product names or sensor.Modis instances
+
+        Returns:
+        dict of product name: True/False.  Products whose check didn't
+        finish within lpdaac.check_timeout seconds (default 60) are left
+        out, so callers can try them again later
+        '''
+        workers, timeout = config.get(['lpdaac.check_workers', 'lpdaac.check_timeout'])
+        checks = bounded_map(self.input_exists, products,
+                             workers=int(workers or 16),
+                             timeout=float(timeout or 60))
+
+        response = {}
+        for product, exists, error in checks:
+            name = product if isinstance(product, basestring) else product.product_id
+            if error is not None:
+                logger.warn('Could not check modis input {0}: {1}'
+                            .format(name, error))
+                continue
+            response[name] = exists
 
         return response
 
@@ -59,9 +87,13 @@ class LPDAACService(object):
                 response = None
 
                 try:
-                    response = requests.head(url)
+                    with circuit.breaker('lpdaac').call():
+                        response = sessions.session().head(url)
                     if response.ok is True:
                         result = True
+                except circuit.CircuitOpenException:
+                    # not the same as missing, let the caller try it later
+                    raise
                 except Exception, e:
                     logger.exception('Exception checking modis input {0}\n '
                                      'Exception:{1}'
@@ -120,10 +152,18 @@ class LPDAACService(object):
         if isinstance(product, str) or isinstance(product, unicode):
             product = sensor.instance(product)
 
+        if self._path_config is None:
+            # the same three values for every product, look them up once
+            # per service instance rather than once per product
+            self._path_config = dict(zip(('aqua', 'terra', 'extension'),
+                                         config.get(['path.aqua_base_source',
+                                                     'path.terra_base_source',
+                                                     'file.extension.modis.input.filename'])))
+
         if isinstance(product, sensor.Aqua):
-            base_path = config.get('path.aqua_base_source')
+            base_path = self._path_config['aqua']
         elif isinstance(product, sensor.Terra):
-            base_path = config.get('path.terra_base_source')
+            base_path = self._path_config['terra']
         else:
             msg = "Cant build input file path for unknown LPDAAC product:%s"
             raise Exception(msg % product.product_id)
@@ -134,7 +174,7 @@ class LPDAACService(object):
                                   str(date.month).zfill(2),
                                   str(date.day).zfill(2))
 
-        input_extension = config.get('file.extension.modis.input.filename')
+        input_extension = self._path_config['extension']
 
         parts = product.product_id.split('.')
         prod_id = '.'.join([parts[0].upper(),
@@ -157,6 +197,10 @@ def input_exists(product):
     return LPDAACService().input_exists(product)
 
 
+def inputs_exist(products):
+    return LPDAACService().inputs_exist(products)
+
+
 def verify_products(products):
     return LPDAACService().verify_products(products)
 
@@ -3,15 +3,23 @@ Purpose: lta services client module
 Author: David V. Hill
 '''
 
-import requests
 import collections
+import httplib
+import os
+import socket
+import threading
+import time
+import urllib2
 import xml.etree.ElementTree as xml
+from contextlib import contextmanager
 from cStringIO import StringIO
 
 from suds.client import Client as SoapClient
 from suds.cache import ObjectCache
+from suds.transport import TransportError
 
 from api.domain import sensor
+from api.external import circuit, sessions
 from api.providers.configuration.configuration_provider import ConfigurationProvider
 from api.system.logger import ilogger as logger
 
@@ -45,6 +53,123 @@ class LTASoapService(LTAService):
         return cache
 
 
+def transport_failure(exc):
+    ''' Tells failing to reach an LTA SOAP service apart from a fault it
+    answered with, such as a WebFault for a bad password
+
+    Keyword args:
+    exc Exception raised by a call made with a suds client
+
+    Returns:
+    True if the service couldn't be reached or failed with an HTTP 5xx
+    '''
+    if isinstance(exc, TransportError):
+        return exc.httpcode is None or exc.httpcode >= 500
+    return isinstance(exc, (urllib2.URLError, socket.error, httplib.HTTPException))
+
+
+class SoapClientPool(object):
+    ''' Per process pool of built LTASoapService clients
+
+    Building a SoapClient loads and parses the service WSDL, which costs far
+    more than most calls made with it.  Clients are kept idle per service
+    class and url, and handed to one caller at a time since suds clients
+    are not safe to share between threads.  A client is rebuilt once it is
+    older than soap.client_max_age seconds (default 3600), so WSDL changes
+    are eventually picked up, and is thrown away if a call made with it
+    fails to reach the service.
+    '''
+
+    def __init__(self, max_idle=4):
+        self.max_idle = max_idle
+        self.pid = os.getpid()
+        # (class, url): [(built at, client), ...]
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.stats = {'built': 0, 'reused': 0, 'retired': 0, 'discarded': 0,
+                      'build_time': 0.0, 'calls': 0, 'call_time': 0.0}
+
+    def _count(self, **deltas):
+        with self._lock:
+            for key, delta in deltas.iteritems():
+                self.stats[key] += delta
+
+    def _checkout(self, cls, url):
+        max_age = float(config.get('soap.client_max_age') or 3600)
+        now = time.time()
+
+        with self._lock:
+            if self.pid != os.getpid():
+                # forked, the parent's sockets aren't ours to reuse
+                self._idle = {}
+                self.pid = os.getpid()
+
+            idle = self._idle.get((cls, url), [])
+            while idle:
+                built, client = idle.pop()
+                if now - built < max_age:
+                    self.stats['reused'] += 1
+                    return built, client
+                self.stats['retired'] += 1
+
+        start = time.time()
+        client = cls()
+        elapsed = time.time() - start
+        self._count(built=1, build_time=elapsed)
+        logger.info('Built {0} in {1:.2f} seconds'.format(cls.__name__, elapsed))
+        return time.time(), client
+
+    def _checkin(self, cls, url, built, client):
+        with self._lock:
+            if self.pid != os.getpid():
+                return
+            idle = self._idle.setdefault((cls, url), [])
+            if len(idle) < self.max_idle:
+                idle.append((built, client))
+
+    @contextmanager
+    def client(self, cls):
+        ''' Borrow a built client of class cls for the duration of the
+        with block, calls made with it go through the lta circuit breaker,
+        which only counts transport_failure errors against the service
+
+        Keyword args:
+        cls An LTASoapService subclass
+        '''
+        url = config.url_for(cls.service_name)
+
+        with circuit.breaker('lta').call(failure=transport_failure):
+            built, client = self._checkout(cls, url)
+
+            start = time.time()
+            try:
+                yield client
+            except Exception, e:
+                if transport_failure(e):
+                    # the connection may be broken, don't hand it out again
+                    self._count(calls=1, call_time=time.time() - start, discarded=1)
+                else:
+                    # a fault the service answered with, the client is fine
+                    self._count(calls=1, call_time=time.time() - start)
+                    self._checkin(cls, url, built, client)
+                raise
+
+            self._count(calls=1, call_time=time.time() - start)
+            self._checkin(cls, url, built, client)
+
+    def statistics(self):
+        ''' Counters since the pool was created, build_time is the total
+        seconds spent loading WSDLs and call_time the total seconds clients
+        were in use '''
+        with self._lock:
+            stats = dict(self.stats)
+            stats['idle'] = sum(len(v) for v in self._idle.values())
+        return stats
+
+
+soap_clients = SoapClientPool()
+
+
 class RegistrationServiceClient(LTASoapService):
 
     service_name = 'registration'
@@ -173,9 +298,9 @@ class OrderWrapperServiceClient(LTAService):
 
         #send the request and check return status
         #request = urllib2.Request(request_url, request_body, headers)
-        __response = requests.post(request_url,
-                                   data=request_body,
-                                   headers=headers)
+        __response = sessions.session().post(request_url,
+                                             data=request_body,
+                                             headers=headers)
 
         response = None
 
@@ -306,7 +431,7 @@ class OrderWrapperServiceClient(LTAService):
 
         # send the request and check response
 
-        __response = requests.post(request_url, data=payload, headers=headers)
+        __response = sessions.session().post(request_url, data=payload, headers=headers)
 
         if __response.ok:
             response = __response.content
@@ -534,7 +659,7 @@ class OrderWrapperServiceClient(LTAService):
         # build service url
         request_url = "{0}/{1}".format(self.url, 'getDownloadURL')
         payload = build_request(contact_id, product_list)
-        response = requests.post(request_url, data=payload)
+        response = sessions.session().post(request_url, data=payload)
 
         if response.ok:
             return parse_response(response.text)
@@ -694,9 +819,7 @@ class OrderDeliveryServiceClient(LTASoapService):
                             .format(u.unitNbr,u.orderNbr))
 
                 # we didn't get an email... fail the order
-                resp = OrderUpdateServiceClient().update_order(u.orderNbr,
-                                                               u.unitNbr,
-                                                               "R")
+                resp = update_order_status(u.orderNbr, u.unitNbr, "R")
                 # we didn't get a response from the service
                 if not resp.success:
                     raise Exception('Could not update order[{0}] unit[{1}] '
@@ -718,9 +841,7 @@ class OrderDeliveryServiceClient(LTASoapService):
                             .format(u.unitNbr, u.orderNbr))
 
                 # didn't get an email... fail the order
-                resp = OrderUpdateServiceClient().update_order(u.orderNbr,
-                                                               u.unitNbr,
-                                                               "R")
+                resp = update_order_status(u.orderNbr, u.unitNbr, "R")
                 # didn't get a response from the service
                 if not resp.success:
                     raise Exception('Could not update unit {0} in order {1} '
@@ -751,45 +872,55 @@ class OrderDeliveryServiceClient(LTASoapService):
 
 
 def login_user(username, password):
-    return RegistrationServiceClient().login_user(username, password)
+    with soap_clients.client(RegistrationServiceClient) as client:
+        return client.login_user(username, password)
 
 
 def get_user_info(username, password):
-    return RegistrationServiceClient().get_user_info(username, password)
+    with soap_clients.client(RegistrationServiceClient) as client:
+        return client.get_user_info(username, password)
 
 
 def get_user_name(contactid):
-    return RegistrationServiceClient().get_username(contactid)
+    with soap_clients.client(RegistrationServiceClient) as client:
+        return client.get_username(contactid)
 
 
 def verify_scenes(product_list):
-    return OrderWrapperServiceClient().verify_scenes(product_list)
+    with circuit.breaker('order_wrapper').call():
+        return OrderWrapperServiceClient().verify_scenes(product_list)
 
 
 def input_exists(product, contact_id):
-    return OrderWrapperServiceClient().input_exists(product, contact_id)
+    with circuit.breaker('order_wrapper').call():
+        return OrderWrapperServiceClient().input_exists(product, contact_id)
 
 
 def order_scenes(product_list, contact_id, priority=5):
-    return OrderWrapperServiceClient().order_scenes(product_list,
-                                                    contact_id,
-                                                    priority)
+    with circuit.breaker('order_wrapper').call():
+        return OrderWrapperServiceClient().order_scenes(product_list,
+                                                        contact_id,
+                                                        priority)
 
 
 def get_download_urls(product_list, contact_id):
-    return OrderWrapperServiceClient().get_download_urls(product_list,
-                                                         contact_id)
+    with circuit.breaker('order_wrapper').call():
+        return OrderWrapperServiceClient().get_download_urls(product_list,
+                                                             contact_id)
 
 
 def get_available_orders():
-    return OrderDeliveryServiceClient().get_available_orders()
+    with soap_clients.client(OrderDeliveryServiceClient) as client:
+        return client.get_available_orders()
 
 
 def get_order_status(lta_order_number):
-    return OrderUpdateServiceClient().get_order_status(lta_order_number)
+    with soap_clients.client(OrderUpdateServiceClient) as client:
+        return client.get_order_status(lta_order_number)
 
 
 def update_order_status(lta_order_number, unit_number, new_status):
-    return OrderUpdateServiceClient().update_order(lta_order_number,
-                                                   unit_number,
-                                                   new_status)
+    with soap_clients.client(OrderUpdateServiceClient) as client:
+        return client.update_order(lta_order_number,
+                                   unit_number,
+                                   new_status)
@@ -9,4 +9,10 @@ def input_exists_true(input):
     return True
 
 def input_exists_false(input):
-    return False
\ No newline at end of file
+    return False
+
+def inputs_exist_true(inputs):
+    return dict((i, True) for i in inputs)
+
+def inputs_exist_false(inputs):
+    return dict((i, False) for i in inputs)
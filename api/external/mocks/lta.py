@@ -97,3 +97,7 @@ def get_order_status(tramid):
     else:
         response = {'units': [{'sceneid': sample_scene_names()[0], 'unit_status': 'C'}]}
     return response
+
+
+def get_order_status_fail(tramid):
+    raise Exception('tram order status unavailable')
@@ -4,6 +4,7 @@ cache '''
 import re
 import os
 
+from api.external import circuit
 from api.providers.configuration.configuration_provider import ConfigurationProvider
 from api.util import sshcmd
 from api.system.logger import ilogger as logger
@@ -39,7 +40,8 @@ class OnlineCache(object):
         self.client = sshcmd.RemoteHost(host, user, pw, timeout=5)
 
         try:
-            self.client.execute('ls')
+            with circuit.breaker('onlinecache').call():
+                self.client.execute('ls')
         except Exception as e:
             logger.debug('No connection to OnlineCache host: {}'.format(e))
             raise OnlineCacheException(e)
@@ -117,7 +119,10 @@ class OnlineCache(object):
         :return: results of the command
         """
         try:
-            result = self.client.execute(cmd)
+            # only failing to run the command counts against the circuit,
+            # a command that runs and complains on stderr doesn't
+            with circuit.breaker('onlinecache').call():
+                result = self.client.execute(cmd)
         except Exception, exception:
             logger.debug('Error executing command: {} '
                          'Raised exception: {}'.format(cmd, exception))
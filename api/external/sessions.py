@@ -0,0 +1,133 @@
+'''
+Purpose: shared keep-alive HTTP session for the external service clients
+'''
+
+import cookielib
+import os
+import threading
+import time
+import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+from api.providers.configuration.configuration_provider import ConfigurationProvider
+
+config = ConfigurationProvider()
+
+
+class InstrumentedAdapter(HTTPAdapter):
+    ''' HTTPAdapter applying a default timeout to every request and keeping
+    per host request counts and latency '''
+
+    def __init__(self, timeout=None, *args, **kwargs):
+        self.timeout = timeout
+        self.stats = {}
+        self._stats_lock = threading.Lock()
+        super(InstrumentedAdapter, self).__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+
+        host = urlparse.urlsplit(request.url).netloc
+        start = time.time()
+        failed = True
+        try:
+            response = super(InstrumentedAdapter, self).send(request, **kwargs)
+            failed = False
+            return response
+        finally:
+            elapsed = time.time() - start
+            with self._stats_lock:
+                stats = self.stats.setdefault(host, {'requests': 0, 'failures': 0,
+                                                     'seconds': 0.0, 'max_seconds': 0.0})
+                stats['requests'] += 1
+                stats['failures'] += int(failed)
+                stats['seconds'] += elapsed
+                stats['max_seconds'] = max(stats['max_seconds'], elapsed)
+
+    def statistics(self):
+        ''' Per host counters, connections is how many connections were
+        opened, so requests - connections were served over a kept alive one
+
+        Returns:
+        dict of host: dict of counters
+        '''
+        with self._stats_lock:
+            ret = dict((host, dict(stats)) for host, stats in self.stats.iteritems())
+
+        pools = self.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host = pool.host if pool.port in (None, 80, 443) else '{0}:{1}'.format(pool.host, pool.port)
+            if host in ret:
+                ret[host]['connections'] = ret[host].get('connections', 0) + pool.num_connections
+
+        return ret
+
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def build_session():
+    ''' Build a requests.Session configured from ordering_configuration:
+
+    http.pool_size     connections kept alive per host (default 10)
+    http.timeout       connect,read timeout in seconds (default 10,120)
+    http.retries       retries on connection errors and 5xx responses to
+                       idempotent requests (default 3)
+    http.backoff       backoff factor between retries in seconds (default 0.5)
+    '''
+    pool_size, timeout, retries, backoff = config.get(['http.pool_size',
+                                                       'http.timeout',
+                                                       'http.retries',
+                                                       'http.backoff'])
+    pool_size = int(pool_size or 10)
+    timeout = tuple(float(t) for t in (timeout or '10,120').split(','))
+    if len(timeout) == 1:
+        timeout = timeout[0]
+
+    retry = Retry(total=int(retries if retries is not None else 3),
+                  backoff_factor=float(backoff or 0.5),
+                  status_forcelist=[502, 503, 504])
+
+    adapter = InstrumentedAdapter(timeout=timeout,
+                                  pool_connections=pool_size,
+                                  pool_maxsize=pool_size,
+                                  max_retries=retry)
+
+    session = requests.Session()
+    # the session is shared by every caller in the process, never let one
+    # user's cookies ride along on another's request
+    session.cookies.set_policy(cookielib.DefaultCookiePolicy(allowed_domains=[]))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def session():
+    ''' The process wide session, rebuilt after a fork so a worker never
+    shares sockets with its parent
+
+    Returns:
+    requests.Session
+    '''
+    global _session, _session_pid
+
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            _session = build_session()
+            _session_pid = os.getpid()
+
+        return _session
+
+
+def statistics():
+    ''' Per host request counters for this process's session '''
+    return session().get_adapter('http://').statistics()
@@ -48,9 +48,12 @@ class ConvertProductOptions(object):
         sql = ('select id, product_options, product_opts '
                'from ordering_order')
 
-        self.db.select(sql)
+        # streamed so the orders never sit in memory all at once, the
+        # named cursor stays open while _retrieve_scenes uses the
+        # regular one
+        self.db.select(sql, stream=True)
 
-        return [r for r in self.db]
+        return iter(self.db)
 
     def _retrieve_scenes(self, oid):
         sql = ('select name '
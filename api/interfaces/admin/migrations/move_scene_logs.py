@@ -0,0 +1,67 @@
+import argparse
+
+from api.domain.scene_log import SceneLog
+from api.util.dbconnect import db_instance
+from api.system.logger import ilogger as logger
+
+
+class MoveSceneLogs(object):
+    """
+    Move processing logs out of ordering_scene.log_file_contents into the
+    compressed ordering_scene_log table, a batch of scenes at a time, so
+    the table is never locked up for long and the move can be stopped and
+    started again
+
+    Needs setup/ordering_scene_log.sql applied first.  A log already in
+    ordering_scene_log is newer than the column and is kept
+    """
+
+    def __init__(self, batch=500):
+        self.batch = int(batch)
+
+    def move(self):
+        last_id = 0
+        moved = 0
+
+        while True:
+            rows = self._retrieve_logs(last_id)
+            if not rows:
+                break
+
+            SceneLog.store(dict((r['id'], r['log_file_contents']) for r in rows),
+                           overwrite=False)
+            self._clear_column([r['id'] for r in rows])
+
+            last_id = rows[-1]['id']
+            moved += len(rows)
+            logger.info('Moved {0} scene logs, through scene id {1}'.format(moved, last_id))
+
+        return moved
+
+    def _retrieve_logs(self, last_id):
+        sql = ('select id, log_file_contents '
+               'from ordering_scene '
+               'where id > %s '
+               'and log_file_contents <> \'\' '
+               'order by id limit %s')
+
+        with db_instance() as db:
+            db.select(sql, (last_id, self.batch))
+            return [dict(r) for r in db]
+
+    def _clear_column(self, ids):
+        sql = ('update ordering_scene '
+               'set log_file_contents = \'\' '
+               'where id in %s')
+
+        with db_instance() as db:
+            db.execute(sql, (tuple(ids),))
+            db.commit()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch', type=int, default=500)
+    args = parser.parse_args()
+
+    print 'Moved {0} scene logs'.format(MoveSceneLogs(args.batch).move())
@@ -100,6 +100,40 @@ class API(object):
 
         return response
 
+    def run_stage(self, name):
+        """Run a single stage of order handling now, whatever its cadence
+
+        Args:
+            name (str): pipeline stage name, e.g. 'submitted-modis'
+
+        Returns:
+            dict: result, seconds and items of the run
+        """
+        try:
+            response = self.production.run_stage(name)
+        except:
+            logger.debug("ERR version1 run_stage, name: {0}\ntrace: {1}".format(name, traceback.format_exc()))
+            response = default_error_message
+
+        return response
+
+    def pipeline_status(self):
+        """Configuration and last run of each stage of order handling
+
+        Args:
+            none
+
+        Returns:
+            list: dict per stage
+        """
+        try:
+            response = self.production.pipeline_status()
+        except:
+            logger.debug("ERR version1 pipeline_status. trace: {0}".format(traceback.format_exc()))
+            response = default_error_message
+
+        return response
+
     def queue_products(self, order_name_tuple_list, processing_location, job_name):
         """Place products into queued status in bulk
 
@@ -119,6 +153,33 @@ class API(object):
 
         return response
 
+    def claim_products(self, processing_location, job_name, **params):
+        """Select products ready for production and place them into queued
+        status in one step
+
+        Args:
+            processing_location (str): location of request to queue products
+            job_name (str): name of the job the products are claimed for
+            params (dict): with the following keys:
+                        record_limit (int): max number of products to claim
+                        for_user (str): username on the order
+                        priority (str): 'high' | 'normal' | 'low'
+                        product_types (str): 'modis,landsat'
+                        encode_urls (bool): True | False
+
+        Returns:
+            list: list of products
+        """
+        try:
+            response = self.production.claim_products(processing_location, job_name, **params)
+        except:
+            logger.debug("ERR version1 claim_products"
+                         " params: {0}\ntrace: {1}".format((processing_location, job_name, params),
+                                                           traceback.format_exc()))
+            response = default_error_message
+
+        return response
+
     def get_production_key(self, key):
         """Returns value for given configuration key
 
@@ -134,7 +134,7 @@ class Emails(object):
         m.append("Requested products\n")
         m.append("-------------------------------------------\n")
 
-        scenes = order.scenes()
+        scenes = order.scenes(columns=['name'])
 
         for product in scenes:
             name = product.name
@@ -168,7 +168,7 @@ class Emails(object):
         m.append("Requested products\n")
         m.append("-------------------------------------------\n")
 
-        scenes = order.scenes({"status": "complete"})
+        scenes = order.scenes({"status": "complete"}, ['name', 'sensor_type'])
         pbs = order.products_by_sensor()
 
         for product in scenes:
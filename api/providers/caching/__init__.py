@@ -24,3 +24,65 @@ class CachingProviderInterfaceV0(object):
         :param expirey: time in seconds an object will live in the cache
         :return: True if successful, else False
         """
+
+    @abc.abstractmethod
+    def get_multi(self, keys):
+        """
+        Retrieve several items from the cache in one round trip
+
+        :param keys: list of keys
+        :return: dict of key: object, for the keys that were found
+        """
+
+    @abc.abstractmethod
+    def set_multi(self, mapping, expirey=None):
+        """
+        Place several items into the cache in one round trip
+
+        :param mapping: dict of key: object to store
+        :param expirey: time in seconds the objects will live in the cache
+        :return: True if every item was stored, else False
+        """
+
+    @abc.abstractmethod
+    def add(self, key, value, expirey=None):
+        """
+        Place an item into the cache only if the key isn't already there,
+        atomically across every client of the cache
+
+        :param key: identifying key to the stored object
+        :param value: object to store
+        :param expirey: time in seconds the object will live in the cache
+        :return: True if the item was stored, False if the key was taken
+        """
+
+    @abc.abstractmethod
+    def delete(self, key):
+        """
+        Remove an item from the cache
+
+        :param key: identifying key to the stored object
+        :return: True if successful, else False
+        """
+
+    @abc.abstractmethod
+    def delete_multi(self, keys):
+        """
+        Remove several items from the cache in one round trip
+
+        :param keys: list of identifying keys
+        :return: True if successful, else False
+        """
+
+    @abc.abstractmethod
+    def get_or_compute(self, key, compute, expirey=None):
+        """
+        Retrieve an item from the cache, calling compute() to regenerate
+        and store it when it is missing or expired.  Only one caller at a
+        time should be recomputing a given key
+
+        :param key: identifying key to the stored object
+        :param compute: callable returning the object to cache
+        :param expirey: time in seconds the computed object is fresh for
+        :return: object
+        """
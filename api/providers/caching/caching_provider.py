@@ -1,22 +1,407 @@
 from api.providers.caching import CachingProviderInterfaceV0
+from api.util import api_cfg, api_cfg_set
 
+import bisect
+import hashlib
+import math
 import memcache
+import os
+import random
+import threading
+import time
+
+from collections import OrderedDict
 
 
 class CachingProviderException(Exception):
     pass
 
 
+class HashRing(object):
+    """
+    Consistent hash ring over a set of nodes
+
+    Each node is placed at replicas points on the ring, a key belongs to
+    the first node at or after its own point.  Adding or removing a node
+    only moves the keys that hash next to it, roughly 1/N of them, where
+    modulo hashing would move nearly all of them
+    """
+
+    def __init__(self, nodes, replicas=160):
+        self.nodes = list(nodes)
+        self._points = []
+        self._owners = []
+
+        ring = []
+        for node in self.nodes:
+            for i in range(replicas):
+                ring.append((self.hash('{0}-{1}'.format(node, i)), node))
+        ring.sort()
+
+        self._points = [p for p, _ in ring]
+        self._owners = [n for _, n in ring]
+
+    @staticmethod
+    def hash(key):
+        return int(hashlib.md5(key).hexdigest()[:8], 16)
+
+    def walk(self, point):
+        """
+        Yield each distinct node in ring order, starting with the owner
+        of point
+        """
+        if not self._points:
+            return
+
+        seen = set()
+        start = bisect.bisect_left(self._points, point)
+        for i in range(len(self._owners)):
+            node = self._owners[(start + i) % len(self._owners)]
+            if node not in seen:
+                seen.add(node)
+                yield node
+                if len(seen) == len(self.nodes):
+                    return
+
+    def node(self, key):
+        for node in self.walk(self.hash(key)):
+            return node
+
+
+class ConsistentHashClient(memcache.Client):
+    """
+    memcache.Client that spreads keys over its servers with a HashRing
+    instead of hash modulo server count, falling back to the next server
+    on the ring when the owner is down
+
+    The ring is keyed by each server's configured address, not its place
+    in the list, so adding or removing a server leaves every other
+    server's points, and keys, where they were
+    """
+
+    def set_servers(self, servers):
+        super(ConsistentHashClient, self).set_servers(servers)
+        # servers may be given as (address, weight), one _Host each
+        names = [s if isinstance(s, basestring) else s[0] for s in servers]
+        self.hosts = dict(zip(names, self.servers))
+        self.ring = HashRing(names)
+
+    def _get_server(self, key):
+        if isinstance(key, tuple):
+            point, key = key
+        else:
+            point = HashRing.hash(key)
+
+        for i, name in enumerate(self.ring.walk(point)):
+            if i >= self._SERVER_RETRIES:
+                break
+            server = self.hosts[name]
+            if server.connect():
+                return server, key
+
+        return None, None
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def memcache_client():
+    """
+    Process wide memcache client, shared by the CachingProvider and the
+    transports
+
+    Servers are taken from memcache_servers in .cfgnfo, a comma separated
+    list of host:port, defaulting to the local memcached.  The client keeps
+    one connection per server per thread, and is rebuilt after a fork so a
+    worker never shares sockets with its parent
+
+    :return: ConsistentHashClient
+    """
+    global _client, _client_pid
+
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            servers = sorted(api_cfg_set('memcache_servers')) or ['127.0.0.1:11211']
+            # cache_cas lets lease renewal check-and-set its own lease
+            _client = ConsistentHashClient(servers, debug=0, cache_cas=True)
+            _client_pid = os.getpid()
+
+        return _client
+
+
+class LocalCache(object):
+    """
+    Bounded, in-process LRU cache with a per-key expiry
+
+    Values are held by reference, not copied, so callers should treat
+    anything they get back as read only
+    """
+
+    def __init__(self, max_size=1024, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        # key: (expires at, value), least recently used first
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0,
+                      'expirations': 0}
+
+    def get(self, key):
+        """
+        :return: tuple(found, value)
+        """
+        with self._lock:
+            item = self._data.pop(key, None)
+
+            if item is None:
+                self.stats['misses'] += 1
+                return False, None
+
+            if item[0] <= time.time():
+                self.stats['expirations'] += 1
+                self.stats['misses'] += 1
+                return False, None
+
+            # re-insert to mark it most recently used
+            self._data[key] = item
+            self.stats['hits'] += 1
+            return True, item[1]
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (time.time() + ttl, value)
+
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def statistics(self):
+        with self._lock:
+            ret = dict(self.stats)
+            ret['size'] = len(self._data)
+
+        return ret
+
+
 class CachingProvider(CachingProviderInterfaceV0):
+    """
+    memcache backed cache, optionally fronted by a LocalCache for hot keys
 
-    def __init__(self):
-        self.cache = memcache.Client(['127.0.0.1:11211'], debug=0)
+    Items stay in the local tier for at most cache_local_ttl seconds, and
+    never longer than memcache keeps them, so a worker serves a value at
+    most that long after another worker has replaced it.  memcache doesn't
+    hand back an item's expiry, so the local tier only holds what this
+    worker set itself and, on a read through, items from get_or_compute,
+    which carry their own.  The local tier is sized by cache_local_size in
+    .cfgnfo, 0 turns it off
+    """
+
+    def __init__(self, local_size=None, local_ttl=None):
         self.timeout = 600 # 10 minutes
 
+        cfg = api_cfg()
+        if local_size is None:
+            local_size = int(cfg.get('cache_local_size', 1024))
+        if local_ttl is None:
+            local_ttl = int(cfg.get('cache_local_ttl', 60))
+
+        self.local = LocalCache(local_size, local_ttl) if local_size > 0 else None
+
+    @property
+    def cache(self):
+        return memcache_client()
+
     def get(self, cache_key):
-        return self.cache.get(cache_key)
+        if self.local is not None:
+            found, value = self.local.get(cache_key)
+            if found:
+                return value
+
+        value = self.cache.get(cache_key)
+        self._keep(cache_key, value)
+        return value
 
     def set(self, cache_key, value, expirey=None):
         timeout = expirey or self.timeout
         self.cache.set(cache_key, value, timeout)
+
+        if self.local is not None:
+            self.local.set(cache_key, value, timeout)
+
         return True
+
+    def get_multi(self, cache_keys):
+        ret = {}
+        remaining = []
+
+        for key in cache_keys:
+            if self.local is not None:
+                found, value = self.local.get(key)
+                if found:
+                    ret[key] = value
+                    continue
+            remaining.append(key)
+
+        if remaining:
+            fetched = self.cache.get_multi(remaining)
+            for key, value in fetched.iteritems():
+                self._keep(key, value)
+            ret.update(fetched)
+
+        return ret
+
+    def set_multi(self, mapping, expirey=None):
+        timeout = expirey or self.timeout
+        failed = self.cache.set_multi(mapping, timeout)
+
+        if self.local is not None:
+            for key, value in mapping.iteritems():
+                self.local.set(key, value, timeout)
+
+        return not failed
+
+    def add(self, cache_key, value, expirey=None):
+        # straight to memcache, the local tier can't answer whether some
+        # other worker got there first
+        timeout = expirey or self.timeout
+        return bool(self.cache.add(cache_key, value, timeout))
+
+    def delete(self, cache_key):
+        if self.local is not None:
+            self.local.delete(cache_key)
+
+        return bool(self.cache.delete(cache_key))
+
+    def delete_multi(self, cache_keys):
+        if self.local is not None:
+            for key in cache_keys:
+                self.local.delete(key)
+
+        return bool(self.cache.delete_multi(cache_keys))
+
+    def get_or_compute(self, cache_key, compute, expirey=None, stale=None,
+                       wait=5, beta=1.0):
+        """
+        Retrieve cache_key, calling compute() to regenerate it when it is
+        missing or expired, with only one caller across every worker
+        recomputing at a time
+
+        Computed items are stored as (value, fresh until, seconds compute
+        took) and kept in memcache for stale seconds past their expirey.
+        Once an item expires, or slightly before then at random (sooner
+        for items that are slow to compute, scaled by beta), a caller tries
+        to take a lease on the key with memcache add().  The lease holder
+        recomputes, everyone else keeps serving the stale value, or when
+        there is none polls up to wait seconds for the lease holder to
+        finish before computing it themselves.  When memcache can't be
+        reached there is no lease to wait on, and callers compute at once
+
+        :param cache_key: identifying key to the stored object
+        :param compute: callable returning the object to cache
+        :param expirey: seconds the computed value is fresh for
+        :param stale: seconds an expired value may still be served,
+         defaults to expirey
+        :param wait: seconds to wait on another worker's computation
+        :param beta: > 1 favours refreshing earlier, < 1 later
+        :return: object
+        """
+        expirey = expirey or self.timeout
+        stale = expirey if stale is None else stale
+
+        entry = self._computed(self.get(cache_key))
+        if entry is not None and not self._refresh_due(entry, beta):
+            return entry[0]
+
+        # the local tier may be holding a copy another worker has since
+        # replaced, memcache has the final say before anyone recomputes
+        if entry is not None and self.local is not None:
+            entry = self._computed(self.cache.get(cache_key))
+            if entry is not None:
+                self._keep(cache_key, entry)
+                if not self._refresh_due(entry, beta):
+                    return entry[0]
+
+        lease_key = '{0}.lease'.format(cache_key)
+        lease_ttl = int(max(wait * 2, 30, entry[2] * 2 if entry else 0))
+        owner = '{0}-{1}-{2}'.format(os.getpid(), threading.current_thread().ident,
+                                     random.random())
+
+        if self.cache.add(lease_key, owner, lease_ttl):
+            try:
+                return self._compute(cache_key, compute, expirey, stale)
+            finally:
+                if self.cache.get(lease_key) == owner:
+                    self.cache.delete(lease_key)
+
+        if entry is not None:
+            return entry[0]
+
+        # add() fails the same way when no server can be reached, only
+        # wait while some live server actually holds the lease
+        deadline = time.time() + wait
+        while self.cache.get(lease_key) is not None and time.time() < deadline:
+            time.sleep(0.1)
+            entry = self._computed(self.cache.get(cache_key))
+            if entry is not None:
+                return entry[0]
+
+        # the holder may have finished between looks
+        entry = self._computed(self.cache.get(cache_key))
+        if entry is not None:
+            return entry[0]
+
+        return self._compute(cache_key, compute, expirey, stale)
+
+    def _compute(self, cache_key, compute, expirey, stale):
+        start = time.time()
+        value = compute()
+        now = time.time()
+
+        self.set(cache_key, (value, now + expirey, now - start), expirey + stale)
+        return value
+
+    def _keep(self, cache_key, value):
+        # memcache may drop a plain item any time after the expirey it was
+        # set with, which is unknown here, only items from get_or_compute
+        # say how long they are good for.  Kept until fresh, memcache holds
+        # them stale seconds longer
+        entry = self._computed(value)
+        if entry is None or self.local is None:
+            return
+
+        ttl = entry[1] - time.time()
+        if ttl > 0:
+            self.local.set(cache_key, entry, ttl)
+
+    @staticmethod
+    def _computed(entry):
+        # anything not stored by get_or_compute, e.g. left over from before
+        # a key moved over to it, is treated as missing
+        if isinstance(entry, tuple) and len(entry) == 3:
+            return entry
+        return None
+
+    @staticmethod
+    def _refresh_due(entry, beta):
+        _, fresh_until, delta = entry
+        # log(random()) is negative, so the further delta and beta push
+        # this out the more likely an early refresh becomes
+        return time.time() - delta * beta * math.log(1.0 - random.random()) >= fresh_until
+
+    def statistics(self):
+        """
+        Hit/miss/eviction counters for the local tier of this provider
+        """
+        if self.local is None:
+            return {}
+
+        return self.local.statistics()
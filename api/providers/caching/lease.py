@@ -0,0 +1,190 @@
+"""
+Lease locks held in memcache, so only one worker on any host does a
+piece of work at a time
+
+A lease is taken with memcache add(), which only one client can win, and
+holds the owner's id for ttl seconds.  While held it is renewed in the
+background with check-and-set, so a long running holder keeps it and a
+crashed one loses it within ttl seconds.  Release only deletes the lease
+if it is still ours
+"""
+import os
+import random
+import socket
+import threading
+import time
+
+from api.providers.caching.caching_provider import memcache_client
+from api.system.logger import ilogger as logger
+
+# counters kept for a week, long enough to spot a stage that keeps
+# finding itself locked out
+STATS_TTL = 7 * 24 * 60 * 60
+STATS_FIELDS = ('acquired', 'waited', 'skipped', 'renewed', 'lost', 'released')
+
+
+class LeaseException(Exception):
+    pass
+
+
+class Lease(object):
+    """
+    A named lease lock
+
+        lease = Lease('pipeline.purge-orders', ttl=60, max_hold=3600)
+        if lease.acquire(wait=30):
+            try:
+                purge()
+            finally:
+                lease.release()
+    """
+
+    def __init__(self, name, ttl=60, max_hold=None):
+        """
+        :param name: what the lease guards, leases of the same name
+         exclude each other
+        :param ttl: seconds the lease outlives its holder going away
+        :param max_hold: seconds after which renewal stops and the lease
+         is left to expire, even if the holder is still going.  None to
+         renew for as long as it's held
+        """
+        self.name = name
+        self.key = 'lease.{0}'.format(name)
+        self.ttl = int(ttl)
+        self.max_hold = max_hold
+        self.owner = '{0}-{1}-{2}-{3:08x}'.format(socket.gethostname(), os.getpid(),
+                                                  threading.current_thread().ident,
+                                                  random.getrandbits(32))
+        self.acquired_at = None
+        self.lost = False
+        self._stop = threading.Event()
+        self._renewer = None
+
+    def __repr__(self):
+        return 'Lease: {0} {1}'.format(self.key, self.owner)
+
+    def __enter__(self):
+        if not self.acquire():
+            raise LeaseException('{0} is held by {1}'.format(self.name, self.holder()))
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.release()
+        return False
+
+    def holder(self):
+        """
+        Owner id of whoever holds the lease now, None if nobody does
+        """
+        return memcache_client().get(self.key)
+
+    def acquire(self, wait=0):
+        """
+        Take the lease, waiting up to wait seconds for the holder to
+        release it
+
+        :param wait: seconds to wait on another holder
+        :return: True if the lease is ours
+        """
+        client = memcache_client()
+        start = time.time()
+
+        while not client.add(self.key, self.owner, self.ttl):
+            remaining = wait - (time.time() - start)
+            if remaining <= 0:
+                _count(self.name, 'skipped')
+                return False
+            time.sleep(min(remaining, 0.5))
+
+        if time.time() - start > 0.01:
+            _count(self.name, 'waited')
+        _count(self.name, 'acquired')
+
+        self.acquired_at = time.time()
+        self.lost = False
+        self._stop.clear()
+        self._renewer = threading.Thread(target=self._renew_loop,
+                                         name='lease-{0}'.format(self.name))
+        self._renewer.daemon = True
+        self._renewer.start()
+        return True
+
+    def renew(self):
+        """
+        Extend the lease by ttl seconds, if it is still ours
+
+        :return: True if renewed, False if it has been lost
+        """
+        client = memcache_client()
+        if client.gets(self.key) != self.owner or \
+                not client.cas(self.key, self.owner, self.ttl):
+            if not self.lost:
+                logger.warn('Lost lease {0}'.format(self.key))
+                _count(self.name, 'lost')
+            self.lost = True
+            return False
+
+        _count(self.name, 'renewed')
+        return True
+
+    def _renew_loop(self):
+        # renew well before expiry, so a slow round trip doesn't let it lapse
+        interval = max(self.ttl / 3.0, 1)
+        while not self._stop.wait(interval):
+            if self.max_hold is not None and time.time() - self.acquired_at >= self.max_hold:
+                logger.warn('Held lease {0} for {1}s, leaving it to expire'
+                            .format(self.key, self.max_hold))
+                return
+            if not self.renew():
+                return
+
+    def release(self):
+        """
+        Give up the lease, if it is still ours
+
+        :return: True if it was ours to release
+        """
+        self._stop.set()
+        if self._renewer is not None and self._renewer is not threading.current_thread():
+            self._renewer.join()
+        self._renewer = None
+
+        client = memcache_client()
+        if client.get(self.key) != self.owner:
+            return False
+
+        client.delete(self.key)
+        _count(self.name, 'released')
+        return True
+
+
+def _stats_key(name, field):
+    return 'lease.stats.{0}.{1}'.format(name, field)
+
+
+def _count(name, field):
+    # counters live in memcache so every worker adds to the same ones
+    client = memcache_client()
+    key = _stats_key(name, field)
+    try:
+        if client.incr(key) is None and not client.add(key, 1, STATS_TTL):
+            client.incr(key)
+    except Exception as e:
+        logger.debug('Could not count lease {0} {1}: {2}'.format(name, field, e))
+
+
+def statistics(names):
+    """
+    Lease counters across every worker
+
+    :param names: lease names
+    :return: dict of name: dict of counter: value
+    """
+    keys = dict((_stats_key(n, f), (n, f)) for n in names for f in STATS_FIELDS)
+    found = memcache_client().get_multi(keys.keys())
+
+    ret = dict((n, dict((f, 0) for f in STATS_FIELDS)) for n in names)
+    for key, value in found.iteritems():
+        name, field = keys[key]
+        ret[name][field] = int(value)
+    return ret
@@ -1,8 +1,13 @@
 import os
 import datetime
+import select
+import threading
+import time
 import yaml
 
-from api.util.dbconnect import db_instance
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+from api.util.dbconnect import db_instance, DBConnect
 from api.providers.configuration import ConfigurationProviderInterfaceV0
 from api.util import api_cfg
 
@@ -11,6 +16,92 @@ class ConfigurationProviderException(Exception):
     pass
 
 
+class ConfigurationCache(object):
+    """
+    Process wide snapshot of the ordering_configuration table
+
+    The snapshot is reloaded once it is older than ttl seconds, or right
+    after invalidate() is called.  With listen enabled a daemon thread
+    holds a dedicated connection LISTENing on the channel below and
+    invalidates the snapshot whenever another process changes the table
+    """
+    channel = 'ordering_configuration_changed'
+
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self.listen = False
+        self._values = None
+        self._loaded = 0
+        self._lock = threading.Lock()
+        self._listener_pid = None
+
+    def current(self, loader):
+        """
+        Retrieve the snapshot, calling loader() to rebuild it when stale
+
+        :param loader: callable returning a fresh dict of key: value
+        :return: dict
+        """
+        if self.listen and self._listener_pid != os.getpid():
+            self._start_listener()
+
+        values = self._values
+        if values is None or time.time() - self._loaded >= self.ttl:
+            with self._lock:
+                if self._values is None or time.time() - self._loaded >= self.ttl:
+                    self._values = loader()
+                    self._loaded = time.time()
+                values = self._values
+
+        return values
+
+    def invalidate(self):
+        with self._lock:
+            self._values = None
+
+    def _start_listener(self):
+        # threads do not survive a fork, so this runs once per process
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+
+        listener = threading.Thread(target=self._listen,
+                                    name='configuration-listener')
+        listener.daemon = True
+        listener.start()
+
+    def _listen(self):
+        while True:
+            db = None
+            try:
+                # a dedicated connection, it would otherwise sit checked
+                # out of the pool forever
+                db = DBConnect(**api_cfg('db'))
+                db.conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+                db.cursor.execute('LISTEN {0};'.format(self.channel))
+                # anything could have changed while we were not listening
+                self.invalidate()
+
+                while True:
+                    if select.select([db.conn], [], [], 60) == ([], [], []):
+                        continue
+
+                    db.conn.poll()
+                    if db.conn.notifies:
+                        del db.conn.notifies[:]
+                        self.invalidate()
+            except Exception:
+                # fall back on the ttl until the database is reachable again
+                time.sleep(5)
+            finally:
+                if db is not None:
+                    db.__exit__(None, None, None)
+
+
+_cache = ConfigurationCache()
+
+
 class ConfigurationProvider(ConfigurationProviderInterfaceV0):
 
     def __init__(self):
@@ -18,6 +109,12 @@ class ConfigurationProvider(ConfigurationProviderInterfaceV0):
         for k, v in api_cfg().iteritems():
             self.__setattr__(k, v)
 
+        if hasattr(self, 'config_cache_ttl'):
+            _cache.ttl = float(self.config_cache_ttl)
+
+        if getattr(self, 'config_listen', 'False').lower() == 'true':
+            _cache.listen = True
+
     @property
     def mode(self):
         apimode = 'dev'
@@ -69,8 +166,10 @@ class ConfigurationProvider(ConfigurationProviderInterfaceV0):
 
         with db_instance() as db:
             db.execute(query, (key, value, value))
+            self._notify_change(db)
             db.commit()
 
+        _cache.invalidate()
         return {key: self.get(key)}
 
     def delete(self, key):
@@ -81,8 +180,11 @@ class ConfigurationProvider(ConfigurationProviderInterfaceV0):
 
             with db_instance() as db:
                 db.execute(query, (key,))
+                self._notify_change(db)
                 db.commit()
 
+            _cache.invalidate()
+
         return self.get(key)
 
     def exists(self, key):
@@ -108,8 +210,11 @@ class ConfigurationProvider(ConfigurationProviderInterfaceV0):
 
         with db_instance() as db:
             db.execute(sql)
+            self._notify_change(db)
             db.commit()
 
+        _cache.invalidate()
+
     def dump(self, path=None):
         ts = datetime.datetime.now().strftime('config-%m%d%y-%H%M%S')
 
@@ -167,7 +272,15 @@ class ConfigurationProvider(ConfigurationProviderInterfaceV0):
                                                  ".cfgnfo not found".format(self.explorer_yaml))
 
     @staticmethod
-    def _retrieve_config():
+    def _notify_change(db):
+        """
+        Queue a notification for the other processes caching the
+        configuration, it is only delivered if the transaction commits
+        """
+        db.execute('NOTIFY {0};'.format(ConfigurationCache.channel))
+
+    @staticmethod
+    def _load_config():
         config = {}
         with db_instance() as db:
             con_query = 'select key, value from ordering_configuration'
@@ -176,3 +289,8 @@ class ConfigurationProvider(ConfigurationProviderInterfaceV0):
                 config[i['key']] = i['value']
 
         return config
+
+    @classmethod
+    def _retrieve_config(cls):
+        # callers get their own copy to do with as they please
+        return dict(_cache.current(cls._load_config))
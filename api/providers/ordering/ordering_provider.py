@@ -2,6 +2,7 @@ import datetime
 
 from api.domain import sensor
 from api.domain.order import Order
+from api.domain.scene_log import SceneLog
 from api.domain.user import User
 from api.util.dbconnect import db_instance, DBConnectException
 from api.util import julian_date_check
@@ -149,13 +150,12 @@ class OrderingProvider(ProviderInterfaceV0):
         if 'orders' not in orders.keys():
             return orders
 
-        cache_key = "{0}_feed".format(email)
-        outd = cache.get(cache_key) or {}
-
-        if not outd:
+        def build_feed():
+            outd = {}
             for orderid in orders['orders']:
                 order = Order.find(orderid)
-                scenes = order.scenes({"status": "complete"})
+                scenes = order.scenes({"status": "complete"},
+                                      ['name', 'product_dload_url', 'status'])
                 if scenes:
                     outd[order.orderid] = {'orderdate': str(order.order_date)}
                     scene_list = []
@@ -164,9 +164,10 @@ class OrderingProvider(ProviderInterfaceV0):
                                            'url': scene.product_dload_url,
                                            'status': scene.status})
                     outd[order.orderid]['scenes'] = scene_list
-            cache.set(cache_key, outd)
+            return outd
 
-        return outd
+        cache_key = "{0}_feed".format(email)
+        return cache.get_or_compute(cache_key, build_feed)
 
     def fetch_order(self, ordernum):
         sql = "select * from ordering_order where orderid = %s;"
@@ -238,7 +239,7 @@ class OrderingProvider(ProviderInterfaceV0):
     def item_status(self, orderid, itemid='ALL', username=None):
         response = {}
         sql = "select oo.orderid, os.id scene_id, os.name, os.status, os.completion_date, os.note, " \
-              "os.product_dload_url, os.cksum_download_url, os.log_file_contents " \
+              "os.product_dload_url, os.cksum_download_url " \
               "from ordering_order oo left join ordering_scene os on oo.id = " \
               "os.order_id where oo.orderid = %s"
         user = User.by_username(username)
@@ -257,6 +258,14 @@ class OrderingProvider(ProviderInterfaceV0):
         if items:
             id = items[0]['orderid']
             response['orderid'] = {id: []}
+
+            logs = {}
+            if user and user.is_staff():
+                # only the end of each log, decompressed a chunk at a time
+                tail = int(config.get('log.item_status_max_bytes') or 65536)
+                logs = SceneLog.read([item['scene_id'] for item in items
+                                      if item['scene_id'] is not None], tail=tail)
+
             for item in items:
                 try:
                     ts = item['completion_date'].isoformat()
@@ -273,7 +282,7 @@ class OrderingProvider(ProviderInterfaceV0):
                      'cksum_download_url': item['cksum_download_url']}
 
                 if user and user.is_staff():
-                    i['log_file_contents'] = item['log_file_contents']
+                    i['log_file_contents'] = logs.get(item['scene_id'], '')
 
                 response['orderid'][id].append(i)
         else:
@@ -68,6 +68,18 @@ class ProductionProviderInterfaceV0(object):
         json per the interface description between the web and processing tier'''
         return
 
+    @abc.abstractmethod
+    def claim_products(self, processing_location, job_name,
+                       record_limit=500,
+                       for_user=None,
+                       priority=None,
+                       product_types=['landsat', 'modis'],
+                       encode_urls=False):
+        '''Atomically select oncache products and place them into queued
+        status for job_name, returning them in the same format as
+        get_products_to_process'''
+        return
+
     @abc.abstractmethod
     def load_ee_orders(self):
         ''' Loads all the available orders from lta into
@@ -112,6 +124,12 @@ class ProductionProviderInterfaceV0(object):
         ''' handles all submitted products in the system '''
         return
 
+    @abc.abstractmethod
+    def prefetch_download_urls(self):
+        ''' resolves and caches download urls for oncache products
+        ahead of dispatch '''
+        return
+
     @abc.abstractmethod
     def send_completion_email(order):
         ''' public interface to send the completion email '''
@@ -145,3 +163,13 @@ class ProductionProviderInterfaceV0(object):
     def handle_orders(self):
         '''Logic handler for how we accept orders + products into the system'''
         return
+
+    @abc.abstractmethod
+    def run_stage(self, name):
+        '''Run a single stage of order handling now, whatever its cadence'''
+        return
+
+    @abc.abstractmethod
+    def pipeline_status(self):
+        '''Configuration and last run of each stage of order handling'''
+        return
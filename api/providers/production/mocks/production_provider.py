@@ -64,4 +64,19 @@ class MockProductionProvider(object):
         return {'order_name_tuple_list': order_name_tuple_list,'processing_location': processing_location,
                 'job_name': job_name}
 
+    def run_stage_inputs(self, name):
+        return {'result': 'ok', 'name': name}
 
+    def pipeline_status(self):
+        return [{'name': 'submitted-modis', 'lane': 'lpdaac', 'last': {}},
+                {'name': 'finalize-orders', 'lane': 'db', 'last': {}}]
+
+    def claim_products_inputs(self, processing_location, job_name,
+                              record_limit=500,
+                              for_user=None,
+                              priority=None,
+                              product_types=['landsat', 'modis'],
+                              encode_urls=False):
+        return {'processing_location': processing_location, 'job_name': job_name,
+                'record_limit': record_limit, 'for_user': for_user, 'priority': priority,
+                'product_types': product_types, 'encode_urls': encode_urls}
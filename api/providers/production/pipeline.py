@@ -0,0 +1,298 @@
+"""
+Runs the work behind ProductionProvider.handle_orders as named stages
+
+Each stage has its own cadence, lease and timeout.  Stages are grouped into
+lanes by the external service they lean on; stages in a lane run one after
+another, and the lanes run alongside each other, so a slow LTA doesn't hold
+up the modis checks or the DB only work.  What each stage did last is kept
+in the cache, where any worker can report on it
+"""
+import datetime
+import threading
+import time
+
+from collections import OrderedDict
+
+from api.domain import identity
+from api.external import circuit
+from api.providers.caching import lease
+from api.providers.caching.caching_provider import CachingProvider
+from api.providers.configuration.configuration_provider import ConfigurationProvider
+from api.system.logger import ilogger as logger
+from api.util.parallel import ParallelException, bounded_map
+
+config = ConfigurationProvider()
+# no local tier, every worker has to see the same records
+cache = CachingProvider(local_size=0)
+
+# how long a stage's last run is reported on
+RECORD_TTL = 7 * 24 * 60 * 60
+
+_current = threading.local()
+
+
+class PipelineException(Exception):
+    pass
+
+
+class Stage(object):
+    """
+    A named step of order handling
+    """
+
+    def __init__(self, name, method, lane, services=(), cadence=0, timeout=600,
+                 cadence_key=None, kwargs=None):
+        """
+        :param name: name the production API knows the stage by
+        :param method: ProductionProvider method doing the work
+        :param lane: stages sharing a lane run one after another
+        :param services: external services the stage can't do without
+        :param cadence: least seconds between the starts of two runs
+        :param timeout: seconds a run is waited on, it keeps its lease
+         until it finishes
+        :param cadence_key: configuration key holding the cadence,
+         defaults to pipeline.<name>.cadence
+        :param kwargs: keyword arguments for method
+        """
+        self.name = name
+        self.method = method
+        self.lane = lane
+        self.services = tuple(services)
+        self.cadence = cadence
+        self.timeout = timeout
+        self.cadence_key = cadence_key or 'pipeline.{0}.cadence'.format(name)
+        self.kwargs = kwargs or {}
+
+    def __repr__(self):
+        return 'Stage: {}'.format(self.__dict__)
+
+    def settings(self):
+        """
+        Cadence and timeout, overridden from ordering_configuration by
+        the cadence key and pipeline.<name>.timeout
+        :return: tuple(cadence, timeout) in seconds
+        """
+        cadence, timeout = config.get([self.cadence_key,
+                                       'pipeline.{0}.timeout'.format(self.name)])
+        return (float(cadence) if cadence else self.cadence,
+                float(timeout) if timeout else self.timeout)
+
+    @property
+    def record_key(self):
+        return 'pipeline.{0}'.format(self.name)
+
+    @property
+    def lease_name(self):
+        return 'pipeline.{0}'.format(self.name)
+
+
+STAGES = [Stage('initial-emails', 'send_initial_emails', 'db'),
+          Stage('retry-products', 'handle_retry_products', 'db'),
+          Stage('submitted-plot', 'handle_submitted_plot_products', 'db'),
+          Stage('finalize-orders', 'finalize_orders', 'db'),
+          Stage('onorder-landsat', 'handle_onorder_landsat_products', 'lta',
+                services=('lta',)),
+          Stage('load-ee-orders', 'load_ee_orders', 'lta',
+                services=('lta',)),
+          Stage('failed-ee-updates', 'handle_failed_ee_updates', 'lta',
+                services=('lta',)),
+          Stage('submitted-landsat', 'handle_submitted_landsat_products', 'lta',
+                services=('order_wrapper',)),
+          Stage('prefetch-download-urls', 'prefetch_download_urls', 'lta',
+                services=('order_wrapper',)),
+          Stage('submitted-modis', 'handle_submitted_modis_products', 'lpdaac',
+                services=('lpdaac',)),
+          Stage('purge-orders', 'purge_orders', 'onlinecache',
+                services=('onlinecache',), timeout=3600,
+                cadence_key='system.run_order_purge_every',
+                kwargs={'send_email': True})]
+
+
+def count(items):
+    """
+    Add to the number of items the stage running on this thread has
+    handled, a no-op outside of a pipeline run
+    :param items: number of items
+    """
+    if getattr(_current, 'items', None) is not None:
+        _current.items += items
+
+
+class Pipeline(object):
+    """
+    Runs the stages of order handling against a ProductionProvider
+    """
+
+    def __init__(self, provider, stages=None):
+        self.provider = provider
+        self.stages = OrderedDict((s.name, s) for s in (stages or STAGES))
+
+    def stage(self, name):
+        if name not in self.stages:
+            raise PipelineException('{0} is not a pipeline stage, these are: {1}'
+                                    .format(name, ', '.join(self.stages)))
+        return self.stages[name]
+
+    def run(self, names=None, force=False, budget=None, wait=0):
+        """
+        Run the named stages, or all of them, each lane on its own thread
+
+        A stage is skipped when its cadence hasn't come round yet (unless
+        force is set), when another run of it, on this host or any other,
+        holds its lease past wait seconds, when it needs a service whose
+        circuit is open, or when it needs an external service and its lane
+        has already spent budget seconds
+
+        :param names: stage names to run, defaults to every stage
+        :param force: run regardless of cadence
+        :param budget: seconds each lane may start external stages within,
+         defaults to system.handle_orders_budget or 240
+        :param wait: seconds to wait on a stage's lease
+        :return: dict of stage name: record of its run
+        """
+        stages = [self.stage(n) for n in names] if names else self.stages.values()
+        if budget is None:
+            budget = float(config.get('system.handle_orders_budget') or 240)
+
+        lanes = OrderedDict()
+        for s in stages:
+            lanes.setdefault(s.lane, []).append(s)
+
+        start = time.time()
+        results = bounded_map(lambda lane: self._run_lane(lane, force, start, budget, wait),
+                              lanes.values(), workers=len(lanes) or 1)
+
+        records = OrderedDict()
+        for lane, lane_records, error in results:
+            if error is not None:
+                # _run_lane reports each stage's own failures, this is the
+                # runner itself falling over
+                logger.debug('Pipeline lane {0} failed: {1}'.format(lane[0].lane, error))
+                continue
+            records.update(lane_records)
+
+        logger.warn('Pipeline ran in {0:.1f}s: {1}'
+                    .format(time.time() - start,
+                            ', '.join('{0} {1}'.format(n, r['result'])
+                                      for n, r in records.iteritems())))
+        return records
+
+    def _run_lane(self, stages, force, start, budget, wait):
+        records = OrderedDict()
+        for s in stages:
+            records[s.name] = self._run_stage(s, force, start, budget, wait)
+        return records
+
+    def _run_stage(self, stage, force, start, budget, wait):
+        cadence, timeout = stage.settings()
+        skip = None
+        opened = [n for n in stage.services if circuit.breaker(n).is_open()]
+        if not force and not self._due(stage, cadence):
+            skip = 'not due'
+        elif opened:
+            skip = 'skipped, {0} circuit open'.format(','.join(opened))
+        elif stage.services and time.time() - start >= budget:
+            skip = 'skipped, {0:.0f}s budget spent'.format(budget)
+
+        if skip is not None:
+            return {'result': skip}
+
+        def call(_):
+            # the lease is taken, renewed and released on the thread doing
+            # the work, so it is held for exactly as long as the stage runs,
+            # even past the point the lane stops waiting on it.  A worker
+            # dying mid stage only holds it up for ttl
+            held = lease.Lease(stage.lease_name, ttl=int(config.get('pipeline.lease_ttl') or 60))
+            if not held.acquire(wait):
+                return {'result': 'skipped, already running'}
+
+            try:
+                # another worker may have run the stage between the check
+                # above and the lease coming free
+                if not force and not self._due(stage, cadence):
+                    return {'result': 'not due'}
+                return self._call_stage(stage, held)
+            finally:
+                held.release()
+
+        [(_, record, error)] = bounded_map(call, [stage.name], workers=1,
+                                           timeout=timeout + wait)
+
+        if isinstance(error, ParallelException):
+            # still running, it records how it went once it finishes
+            return {'result': 'timed out, {0}'.format(error)}
+        if error is not None:
+            logger.debug('Pipeline stage {0} failed: {1}'.format(stage.name, error))
+            return {'result': 'failed, {0}'.format(error)}
+        return record
+
+    @staticmethod
+    def _due(stage, cadence):
+        last = cache.get(stage.record_key) or {}
+        return not last.get('started') or \
+            (datetime.datetime.now() - last['started']).total_seconds() >= cadence
+
+    def _call_stage(self, stage, held):
+        record = {'started': datetime.datetime.now(), 'host': held.owner}
+        # recorded up front, so the start counts towards the cadence even
+        # if this worker dies part way through
+        cache.set(stage.record_key, dict(record, result='running'), RECORD_TTL)
+
+        _current.items = 0
+        try:
+            # a stage is one unit of work, rows it loads twice are
+            # shared rather than fetched again
+            with identity.session():
+                getattr(self.provider, stage.method)(**stage.kwargs)
+            record['result'] = 'ok'
+            record['items'] = _current.items
+        except circuit.CircuitOpenException, e:
+            record['result'] = 'stopped, {0}'.format(e)
+        except Exception, e:
+            record['result'] = 'failed, {0}'.format(e)
+            logger.debug('Pipeline stage {0} failed: {1}'.format(stage.name, e))
+        finally:
+            _current.items = None
+
+        record['seconds'] = round((datetime.datetime.now() - record['started']).total_seconds(), 1)
+        if held.lost:
+            # some other run may have taken over part way through
+            record['lease'] = 'lost'
+
+        # recorded while the lease is still ours, so the next run to take
+        # it sees this one's start when checking its cadence
+        cache.set(stage.record_key, record, RECORD_TTL)
+        return record
+
+    def status(self):
+        """
+        Configuration and last run of every stage
+        :return: list of dicts
+        """
+        records = cache.get_multi([s.record_key for s in self.stages.values()])
+        leases = lease.statistics([s.lease_name for s in self.stages.values()])
+
+        ret = []
+        for s in self.stages.values():
+            cadence, timeout = s.settings()
+            ret.append({'name': s.name,
+                        'lane': s.lane,
+                        'services': list(s.services),
+                        'cadence': cadence,
+                        'timeout': timeout,
+                        'running': lease.Lease(s.lease_name).holder(),
+                        'lease': leases[s.lease_name],
+                        'last': self.printable(records.get(s.record_key) or {})})
+        return ret
+
+    @staticmethod
+    def printable(record):
+        """
+        Copy of a stage record that will serialize to json
+        :param record: dict
+        :return: dict
+        """
+        record = dict(record)
+        if 'started' in record:
+            record['started'] = str(record['started'])
+        return record
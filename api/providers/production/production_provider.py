@@ -1,31 +1,47 @@
-from api.domain import sensor
+from api.domain import identity, sensor
 from api.domain.scene import Scene, SceneException
 from api.domain.order import Order, OptionsConversion, OrderException
+from api.domain.tram_poll import TramPoll
 from api.providers.configuration.configuration_provider import ConfigurationProvider
 from api.util.dbconnect import DBConnectException, db_instance
-from api.providers.production import ProductionProviderInterfaceV0
+from api.providers.production import ProductionProviderInterfaceV0, pipeline
 from api.providers.caching.caching_provider import CachingProvider
-from api.external import lpdaac, lta, onlinecache, nlaps, hadoop
+from api.external import circuit, lpdaac, lta, onlinecache, nlaps, hadoop, sessions
 from api.system import errors
 from api.notification import emails
 from api.domain.user import User
 
+import calendar
 import copy
 import datetime
+import itertools
 import urllib
+import urlparse
 import json
 import socket
+import threading
+import time
 import yaml
 
+from collections import OrderedDict
 from cStringIO import StringIO
 
 from api.system.logger import ilogger as logger
+from api.util.parallel import bounded_map
 
 config = ConfigurationProvider()
 cache = CachingProvider()
+# no local tier, a download url evicted by one worker mustn't still be
+# handed out by another
+url_cache = CachingProvider(local_size=0)
 hadoop_handler = hadoop.HadoopHandler()
 
 
+# hits and misses on the landsat download url cache since this process started
+download_url_stats = {'hits': 0, 'misses': 0}
+download_url_stats_lock = threading.Lock()
+
+
 class ProductionProviderException(Exception):
     pass
 
@@ -60,14 +76,15 @@ class ProductionProvider(ProductionProviderInterfaceV0):
             product_tup = tuple(str(p) for p in orders[order])
             order = Order.find(order)
 
-            scenes = Scene.where({'order_id': order.id, 'name': product_tup})
+            scenes = Scene.where({'order_id': order.id, 'name': product_tup}, ['id'])
             updates = {"status": "queued",
                        "processing_location": processing_location,
-                       "log_file_contents": "''",
+                       "log_file_contents": '',
                        "note": "''",
                        "job_name": job_name}
 
             Scene.bulk_update([s.id for s in scenes], updates)
+            self.evict_download_urls(product_tup, User.find(order.user_id).contactid)
 
         return True
 
@@ -189,6 +206,7 @@ class ProductionProvider(ProductionProviderInterfaceV0):
                               {'status': 'unavailable',
                                'completion_date': datetime.datetime.now(),
                                'note': reason})
+            Scene.prefetch_orders(products)
             for p in products:
                 if p.order_attr('order_source') == 'ee':
                     try:
@@ -308,6 +326,8 @@ class ProductionProvider(ProductionProviderInterfaceV0):
         scene.note = note
         scene.save()
 
+        self.evict_download_urls([name], User.find(order.user_id).contactid)
+
         return True
 
     def set_product_error(self, name, orderid, processing_loc, error):
@@ -368,6 +388,43 @@ class ProductionProvider(ProductionProviderInterfaceV0):
 
         return True
 
+    @staticmethod
+    def _products_to_process_filters(for_user=None, priority=None,
+                                     product_types=['landsat', 'modis']):
+        """
+        Build the WHERE clause shared by get_products_to_process and
+        claim_products for oncache scenes on ordered orders
+        :param for_user: the user whose scenes to retrieve
+        :param priority: the priority of scenes to retrieve
+        :param product_types: types of products to retrieve
+        :return: str
+        """
+        buff = StringIO()
+        buff.write('WHERE ')
+        buff.write('o.status = \'ordered\' ')
+        buff.write('AND s.status = \'oncache\' ')
+
+        if product_types and len(product_types) > 0:
+            ptypes = copy.deepcopy(product_types)
+
+            # product_types comes in as a list from the transport layer
+            if isinstance(ptypes, basestring):
+                # ptypes is unicode values of either: u"['plot']" or u"['landsat', 'modis']"
+                ptypes = eval(ptypes)
+
+            type_str = ','.join('\'{0}\''.format(x) for x in ptypes)
+            buff.write('AND s.sensor_type IN ({0}) '.format(type_str))
+
+        if for_user is not None:
+            buff.write('AND u.username = \'{0}\' '.format(for_user))
+
+        if priority is not None:
+            buff.write('AND o.priority = \'{0}\' '.format(priority))
+
+        where = buff.getvalue()
+        buff.close()
+        return where
+
     def get_products_to_process(self, record_limit=500,
                                 for_user=None,
                                 priority=None,
@@ -391,14 +448,6 @@ class ProductionProvider(ProductionProviderInterfaceV0):
         logger.warn('Encode urls:{0}'.format(encode_urls))
 
         buff = StringIO()
-        buff.write('WITH order_queue AS ')
-        buff.write('(SELECT u.email "email", count(name) "running" ')
-        buff.write('FROM ordering_scene s ')
-        buff.write('JOIN ordering_order o ON o.id = s.order_id ')
-        buff.write('JOIN auth_user u ON u.id = o.user_id ')
-        buff.write('WHERE ')
-        buff.write('s.status in (\'queued\', \'processing\') ')
-        buff.write('GROUP BY u.email) ')
         buff.write('SELECT ')
         buff.write('u.contactid, ')
         buff.write('s.name, ')
@@ -411,69 +460,179 @@ class ProductionProvider(ProductionProviderInterfaceV0):
         buff.write('FROM ordering_scene s ')
         buff.write('JOIN ordering_order o ON o.id = s.order_id ')
         buff.write('JOIN auth_user u ON u.id = o.user_id ')
-        buff.write('LEFT JOIN order_queue q ON q.email = u.email ')
-        buff.write('WHERE ')
-        buff.write('o.status = \'ordered\' ')
-        buff.write('AND s.status = \'oncache\' ')
+        buff.write('LEFT JOIN ordering_user_running q ON q.user_id = o.user_id ')
+        buff.write(self._products_to_process_filters(for_user, priority,
+                                                     product_types))
+        buff.write('ORDER BY COALESCE(q.running, 0) ASC, ')
+        buff.write('o.order_date ASC LIMIT {0}'.format(record_limit))
 
-        if product_types and len(product_types) > 0:
-            ptypes = copy.deepcopy(product_types)
+        query = buff.getvalue()
+        buff.close()
+        logger.warn("QUERY:{0}".format(query))
 
-            # product_types comes in as a list from the transport layer
-            if isinstance(ptypes, basestring):
-                # ptypes is unicode values of either: u"['plot']" or u"['landsat', 'modis']"
-                ptypes = eval(ptypes)
+        with db_instance() as db:
+            db.select(query)
 
-            type_str = ','.join('\'{0}\''.format(x) for x in ptypes)
-            buff.write('AND s.sensor_type IN ({0}) '.format(type_str))
+        results, _ = self._format_products(db.fetcharr, encode_urls)
+        return results
 
-        if for_user is not None:
-            buff.write('AND u.username = \'{0}\' '.format(for_user))
+    def claim_products(self, processing_location, job_name,
+                       record_limit=500,
+                       for_user=None,
+                       priority=None,
+                       product_types=['landsat', 'modis'],
+                       encode_urls=False):
+        """
+        Select oncache scenes and mark them queued for job_name in one
+        transaction, returning them formatted as get_products_to_process
+        does.  Rows another caller has already locked are skipped rather
+        than waited on, so concurrent dispatchers never claim the same scene
 
-        if priority is not None:
-            buff.write('AND o.priority = \'{0}\' '.format(priority))
+        Scenes whose download url can't be found are put back to oncache
+        :param processing_location: location of request to queue products
+        :param job_name: name of job
+        :param record_limit: max number of scenes to claim
+        :param for_user: the user whose scenes to claim
+        :param priority: the priority of scenes to claim
+        :param product_types: types of products to claim
+        :param encode_urls: whether to encode the urls
+        :return: list
+        """
+        logger.info('Claiming products to process for {0}...'.format(job_name))
 
-        buff.write('ORDER BY q.running ASC NULLS FIRST, ')
-        buff.write('o.order_date ASC LIMIT {0}'.format(record_limit))
+        buff = StringIO()
+        buff.write('WITH claim AS ')
+        buff.write('(SELECT s.id, COALESCE(q.running, 0) AS running ')
+        buff.write('FROM ordering_scene s ')
+        buff.write('JOIN ordering_order o ON o.id = s.order_id ')
+        buff.write('JOIN auth_user u ON u.id = o.user_id ')
+        buff.write('LEFT JOIN ordering_user_running q ON q.user_id = o.user_id ')
+        buff.write(self._products_to_process_filters(for_user, priority,
+                                                     product_types))
+        buff.write('ORDER BY COALESCE(q.running, 0) ASC, ')
+        buff.write('o.order_date ASC LIMIT {0} '.format(int(record_limit)))
+        buff.write('FOR UPDATE OF s SKIP LOCKED), ')
+        # a claimed scene starts over with no processing log, dropped in
+        # the same statement so a claim never keeps a stale one
+        buff.write('cleared AS ')
+        buff.write('(DELETE FROM ordering_scene_log l USING claim c ')
+        buff.write('WHERE l.scene_id = c.id) ')
+        buff.write('UPDATE ordering_scene s SET ')
+        buff.write('status = \'queued\', ')
+        buff.write('processing_location = %s, ')
+        buff.write('job_name = %s, ')
+        buff.write('note = \'\' ')
+        buff.write('FROM claim c, ordering_order o, auth_user u ')
+        buff.write('WHERE s.id = c.id ')
+        buff.write('AND o.id = s.order_id ')
+        buff.write('AND u.id = o.user_id ')
+        buff.write('RETURNING ')
+        buff.write('c.running, ')
+        buff.write('s.id, ')
+        buff.write('u.contactid, ')
+        buff.write('s.name, ')
+        buff.write('s.sensor_type, ')
+        buff.write('o.orderid, ')
+        buff.write('o.product_opts, ')
+        buff.write('o.priority, ')
+        buff.write('o.order_date')
 
         query = buff.getvalue()
         buff.close()
-        logger.warn("QUERY:{0}".format(query))
+        params = (processing_location, job_name)
 
-        with db_instance() as db:
-            db.select(query)
+        log_sql = ''
+        try:
+            with db_instance() as db:
+                log_sql = db.cursor.mogrify(query, params)
+                logger.warn("QUERY:{0}".format(log_sql))
+                db.select(query, params)
+                db.commit()
+        except DBConnectException as e:
+            logger.debug('Error claiming products: {0}\nSQL: {1}'
+                         .format(e.message, log_sql))
+            raise ProductionProviderException(e)
 
-        query_results = db.fetcharr
+        # RETURNING comes back in no particular order, put it back in the
+        # fair share order the scenes were claimed in.  FOR UPDATE can't be
+        # used with row_number(), so the running count is carried instead
+        claimed = sorted(db.fetcharr, key=lambda r: (r['running'], r['order_date']))
+        logger.warn('Claimed {0} products for {1}'.format(len(claimed), job_name))
+        # claimed in SQL, scenes loaded earlier in the session are stale
+        identity.evict(Scene, [item['id'] for item in claimed])
 
+        results, skipped = self._format_products(claimed, encode_urls)
+
+        skipped_ids = set(item['id'] for item in skipped)
+        for cid, items in itertools.groupby(sorted(claimed, key=lambda r: r['contactid']),
+                                            key=lambda r: r['contactid']):
+            self.evict_download_urls([item['name'] for item in items
+                                      if item['id'] not in skipped_ids], cid)
+
+        if skipped:
+            Scene.bulk_update([item['id'] for item in skipped],
+                              {'status': 'oncache',
+                               'processing_location': '',
+                               'job_name': None})
+
+        return results
+
+    def _format_products(self, items, encode_urls=False):
+        """
+        Retrieve download urls for oncache items and format them per the
+        interface description between the web and processing tier
+        :param items: rows from the products to process query
+        :param encode_urls: whether to encode the urls
+        :return: tuple(list of products, list of items without a download url)
+        """
         # Need the results reorganized by contact id so we can get dload urls from
-        # ee in bulk by id.
-        by_cid = {}
-        for result in query_results:
+        # ee in bulk by id.  Ordered so results come back in query order
+        by_cid = OrderedDict()
+        for result in items:
             cid = result['contactid']
             # ['orderid', 'sensor_type', 'contactid', 'name', 'product_options']
             by_cid.setdefault(cid, []).append(result)
 
-        #this will be returned to the caller
-        results = []
-        for cid in by_cid.keys():
+        def download_urls(cid):
             cid_items = by_cid[cid]
 
             landsat = [item['name'] for item in cid_items if item['sensor_type'] == 'landsat']
-            logger.warn('Retrieving {0} landsat download urls for cid:{1}'
-                         .format(len(landsat), cid))
-
-            start = datetime.datetime.now()
-            landsat_urls = lta.get_download_urls(landsat, cid)
-            stop = datetime.datetime.now()
-            interval = stop - start
-            logger.warn('Retrieving download urls took {0} seconds'
-                         .format(interval.seconds))
-            logger.warn('Retrieved {0} landsat urls for cid:{1}'.format(len(landsat_urls), cid))
+            landsat_urls = self.landsat_download_urls(landsat, cid)
 
             modis = [item['name'] for item in cid_items if item['sensor_type'] == 'modis']
-            modis_urls = lpdaac.get_download_urls(modis)
+            modis_urls = {}
+            if modis:
+                modis_urls = lpdaac.get_download_urls(modis)
+                logger.warn('Retrieved {0} modis urls for cid:{1}'.format(len(modis_urls), cid))
+
+            return landsat_urls, modis_urls
+
+        workers, call_timeout, deadline = config.get(['system.url_lookup_workers',
+                                                      'system.url_lookup_timeout',
+                                                      'system.url_lookup_deadline'])
+        lookups = bounded_map(download_urls, by_cid.keys(),
+                              workers=int(workers or 8),
+                              timeout=float(call_timeout) if call_timeout else 120,
+                              deadline=float(deadline) if deadline else 300)
+
+        logger.warn('Download url cache hits:{hits} misses:{misses} since start'
+                    .format(**download_url_stats))
+
+        #this will be returned to the caller
+        results = []
+        skipped = []
+        for cid, urls, error in lookups:
+            cid_items = by_cid[cid]
+
+            if error is not None:
+                logger.warn('Could not retrieve download urls for cid:{0}, '
+                            'skipping {1} products: {2}'
+                            .format(cid, len(cid_items), error))
+                skipped.extend(cid_items)
+                continue
+
+            landsat_urls, modis_urls = urls
 
-            logger.warn('Retrieved {0} modis urls for cid:{1}'.format(len(modis_urls), cid))
             for item in cid_items:
                 dload_url = None
                 if item['sensor_type'] == 'landsat':
@@ -550,7 +709,176 @@ class ProductionProvider(ProductionProviderInterfaceV0):
                     logger.info('dload_url for {0} in order {0} '
                                 'was None, skipping...'
                                 .format(item['orderid'], item['name']))
-        return results
+                    skipped.append(item)
+        return results, skipped
+
+
+    def landsat_download_urls(self, names, contactid):
+        """
+        Download urls for landsat scenes, from the cache where possible and
+        from LTA for the rest, caching what LTA returns
+        :param names: scene names
+        :param contactid: contact id of the user the scenes are for
+        :return: dict in the format of lta.get_download_urls
+        """
+        landsat_urls = self.cached_download_urls(names, contactid)
+        missing = [name for name in names if name not in landsat_urls]
+        if missing:
+            logger.warn('Retrieving {0} landsat download urls for cid:{1}'
+                        .format(len(missing), contactid))
+
+            start = datetime.datetime.now()
+            retrieved = lta.get_download_urls(missing, contactid)
+            stop = datetime.datetime.now()
+            interval = stop - start
+            logger.warn('Retrieving download urls took {0} seconds'
+                        .format(interval.seconds))
+            logger.warn('Retrieved {0} landsat urls for cid:{1}'.format(len(retrieved), contactid))
+
+            self.cache_download_urls(retrieved, contactid)
+            landsat_urls.update(retrieved)
+
+        return landsat_urls
+
+    def prefetch_download_urls(self):
+        """
+        Resolve and cache download urls for the oncache landsat scenes next
+        in line for dispatch, so get_products_to_process rarely has to wait
+        on LTA.  Covers up to system.prefetch_download_urls_limit scenes
+        (default 1000), in the order they will be dispatched
+        :return: True
+        """
+        limit = int(config.get('system.prefetch_download_urls_limit') or 1000)
+
+        buff = StringIO()
+        buff.write('SELECT ')
+        buff.write('u.contactid, ')
+        buff.write('s.name ')
+        buff.write('FROM ordering_scene s ')
+        buff.write('JOIN ordering_order o ON o.id = s.order_id ')
+        buff.write('JOIN auth_user u ON u.id = o.user_id ')
+        buff.write('LEFT JOIN ordering_user_running q ON q.user_id = o.user_id ')
+        buff.write(self._products_to_process_filters(product_types=['landsat']))
+        buff.write('ORDER BY COALESCE(q.running, 0) ASC, ')
+        buff.write('o.order_date ASC LIMIT {0}'.format(limit))
+
+        query = buff.getvalue()
+        buff.close()
+
+        with db_instance() as db:
+            db.select(query)
+
+        by_cid = OrderedDict()
+        for row in db.fetcharr:
+            by_cid.setdefault(row['contactid'], []).append(row['name'])
+        pipeline.count(sum(len(names) for names in by_cid.values()))
+
+        # only the misses cost an LTA call, landsat_download_urls takes
+        # care of leaving the rest alone
+        workers, call_timeout, deadline = config.get(['system.url_lookup_workers',
+                                                      'system.url_lookup_timeout',
+                                                      'system.url_lookup_deadline'])
+        lookups = bounded_map(lambda cid: self.landsat_download_urls(by_cid[cid], cid),
+                              by_cid.keys(),
+                              workers=int(workers or 8),
+                              timeout=float(call_timeout) if call_timeout else 120,
+                              deadline=float(deadline) if deadline else 300)
+
+        for cid, _, error in lookups:
+            if error is not None:
+                logger.warn('Could not prefetch download urls for cid:{0}: {1}'
+                            .format(cid, error))
+
+        logger.info('Prefetched download urls for {0} scenes, cache hits:{hits} '
+                    'misses:{misses} since start'
+                    .format(sum(len(v) for v in by_cid.values()), **download_url_stats))
+        return True
+
+    @staticmethod
+    def _download_url_key(name, contactid):
+        return 'dload_url-{0}-{1}'.format(contactid, name)
+
+    def cached_download_urls(self, names, contactid):
+        """
+        Look up landsat download urls cached by cache_download_urls
+        :param names: scene names
+        :param contactid: contact id the urls were issued to
+        :return: dict, in the format of lta.get_download_urls, of the names found
+        """
+        if not names:
+            return {}
+
+        keys = dict((self._download_url_key(name, contactid), name) for name in names)
+        found = url_cache.get_multi(keys.keys())
+
+        with download_url_stats_lock:
+            download_url_stats['hits'] += len(found)
+            download_url_stats['misses'] += len(names) - len(found)
+
+        return dict((keys[key], value) for key, value in found.iteritems())
+
+    def cache_download_urls(self, urls, contactid):
+        """
+        Cache available landsat download urls until system.download_url_ttl
+        seconds (default 1800) have passed, the url is a minute from
+        expiring, or the scene is queued or set to retry.  Anything not
+        available isn't cached, so it is checked again on the next call
+        :param urls: dict in the format returned by lta.get_download_urls
+        :param contactid: contact id the urls were issued to
+        :return: True
+        """
+        max_ttl = int(config.get('system.download_url_ttl') or 1800)
+
+        by_ttl = {}
+        for name, value in urls.iteritems():
+            if value.get('status') != 'available' or 'download_url' not in value:
+                continue
+
+            ttl = max_ttl
+            expires_in = self._download_url_expires_in(value['download_url'])
+            if expires_in is not None:
+                # leave the caller time to use it
+                ttl = min(ttl, int(expires_in) - 60)
+            if ttl > 0:
+                by_ttl.setdefault(ttl, {})[self._download_url_key(name, contactid)] = value
+
+        for ttl, mapping in by_ttl.iteritems():
+            url_cache.set_multi(mapping, ttl)
+
+        return True
+
+    @staticmethod
+    def _download_url_expires_in(url):
+        """
+        Seconds left before a signed download url stops working, from its
+        Expires (epoch seconds) or X-Amz-Date and X-Amz-Expires parameters
+        :param url: download url
+        :return: seconds, None if the url doesn't say
+        """
+        params = dict((k.lower(), v[-1]) for k, v in
+                      urlparse.parse_qs(urlparse.urlparse(url).query).iteritems())
+        try:
+            if 'expires' in params:
+                return float(params['expires']) - time.time()
+            if 'x-amz-date' in params and 'x-amz-expires' in params:
+                signed = calendar.timegm(time.strptime(params['x-amz-date'], '%Y%m%dT%H%M%SZ'))
+                return signed + float(params['x-amz-expires']) - time.time()
+        except ValueError:
+            pass
+        return None
+
+    def evict_download_urls(self, names, contactid):
+        """
+        Drop cached download urls for scenes that have been handed off
+        for processing, or that need to be looked up again
+        :param names: scene names
+        :param contactid: contact id the urls were issued to
+        :return: True
+        """
+        if names:
+            url_cache.delete_multi([self._download_url_key(name, contactid) for name in names])
+
+        return True
 
     def load_ee_orders(self):
         """
@@ -565,6 +893,7 @@ class ProductionProvider(ProductionProviderInterfaceV0):
             return
 
         orders = lta.get_available_orders()
+        pipeline.count(len(orders))
 
         # {(order_num, email, contactid): [{sceneid: ,
         #                                   unit_num:}]}
@@ -741,6 +1070,7 @@ class ProductionProvider(ProductionProviderInterfaceV0):
         try:
             now = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
             products = Scene.where({'status': 'retry', 'retry_after <': now})
+            pipeline.count(len(products))
             if len(products) > 0:
                 Scene.bulk_update([p.id for p in products], {'status': 'submitted', 'note': ''})
         except Exception as e:
@@ -755,19 +1085,39 @@ class ProductionProvider(ProductionProviderInterfaceV0):
         """
         products = Scene.where({'status': 'onorder', 'tram_order_id IS NOT': None})
 
-        # lets control how many scenes were going to ping LTA for status updates
-        # every 7 (currently) minutes
-        # tram_order_id is sequential (looks like a timestamp), so we can sort
-        # by that, running with the 'oldest' orders assuming they process FIFO
-        product_tram_ids = set([product.tram_order_id for product in products])
-        sorted_tram_ids = sorted(product_tram_ids)[:500]
-
-        rejected = []
-        available = []
-
-        # converting to a set eliminates duplicate calls to lta
-        for tid in sorted_tram_ids:
-            order_status = lta.get_order_status(tid)
+        # each tram order is polled on its own schedule, backing off while
+        # LTA reports nothing new for it, so the time budget goes to the
+        # orders with the most scenes waiting and the best odds of having
+        # moved.  Duplicate tram ids are polled once
+        waiting = {}
+        for product in products:
+            waiting[product.tram_order_id] = waiting.get(product.tram_order_id, 0) + 1
+        waiting_names = set([product.name for product in products])
+
+        due = TramPoll.due(waiting)
+        due_ids = [poll.tram_order_id for poll in due]
+        pipeline.count(len(due_ids))
+
+        workers, call_timeout, deadline = config.get(['system.tram_poll_workers',
+                                                      'system.tram_poll_timeout',
+                                                      'system.tram_poll_deadline'])
+        polls = bounded_map(lta.get_order_status, due_ids,
+                            workers=int(workers or 8),
+                            timeout=float(call_timeout) if call_timeout else 60,
+                            deadline=float(deadline) if deadline else 300)
+
+        rejected = set()
+        available = set()
+        polled = []
+        failed = 0
+
+        for poll, (tid, order_status, error) in zip(due, polls):
+            if error is not None:
+                # left onorder and still due, it's polled again next time round
+                failed += 1
+                logger.debug('Could not get status for tram order {0}: {1}'
+                             .format(tid, error))
+                continue
 
             # There are a variety of product statuses that come back from tram
             # on this call.  I is inprocess, Q is queued for the backend system,
@@ -775,24 +1125,40 @@ class ProductionProvider(ProductionProviderInterfaceV0):
             # all the statuses except for R and C because we don't care.
             # In the case of D (duplicates), when the first product completes, all
             # duplicates will also be marked C
-            for unit in order_status['units']:
+            statuses = set()
+            for unit in order_status.get('units', []):
+                if unit['sceneid'] in waiting_names:
+                    statuses.add(unit['unit_status'])
                 if unit['unit_status'] == 'R':
-                    rejected.append(unit['sceneid'])
+                    rejected.add(unit['sceneid'])
                 elif unit['unit_status'] == 'C':
-                    available.append(unit['sceneid'])
+                    available.add(unit['sceneid'])
+            polled.append((poll, statuses))
+
+        base, ceiling, age_fraction = config.get(['system.tram_poll_interval',
+                                                  'system.tram_poll_max_interval',
+                                                  'system.tram_poll_age_fraction'])
+        TramPoll.record(polled,
+                        base=float(base) if base else 300,
+                        ceiling=float(ceiling) if ceiling else 21600,
+                        age_fraction=float(age_fraction) if age_fraction else 0.1)
+
+        logger.warn('Polled {0} of {1} tram orders, {2} failed or ran out of time, '
+                    '{3} units rejected, {4} units available'
+                    .format(len(due_ids), len(waiting), failed, len(rejected), len(available)))
 
         # Go find all the tram units that were rejected and mark them
         # unavailable in our database.  Note that we are not looking for
         # specific tram_order_id/sceneids as duplicate tram orders may have been
         # submitted and we want to bulk update all scenes that are onorder but
         # have been rejected
-        if len(rejected) > 0:
+        if rejected:
             rejected_products = [p for p in products if p.name in rejected]
             # scene may not be rejected or complete
             if rejected_products:
                 self.set_products_unavailable(rejected_products, 'Level 1 product could not be produced')
 
-        if len(available) > 0:
+        if available:
             products = Scene.where({'status': 'onorder', 'name': tuple(available)})
             # scene may not be rejected or complete
             if products:
@@ -818,6 +1184,7 @@ class ProductionProvider(ProductionProviderInterfaceV0):
                               'sensor_type': 'landsat'})
 
         if scenes:
+            Scene.prefetch_orders(scenes)
             user_ids = [s.order_attr('user_id') for s in scenes]
             users = User.where({'id': tuple(user_ids)})
             contact_ids = set([user.contactid for user in users])
@@ -891,7 +1258,12 @@ class ProductionProvider(ProductionProviderInterfaceV0):
         # Here's the real logic for this handling submitted landsat products
         self.mark_nlaps_unavailable()
 
+        if circuit.breaker('order_wrapper').is_open():
+            logger.warn('order_wrapper circuit is open, leaving landsat products submitted')
+            return True
+
         contactids = self.get_contactids_for_submitted_landsat_products()
+        pipeline.count(len(contactids))
 
         for contact_id in contactids:
             if contact_id:
@@ -915,13 +1287,23 @@ class ProductionProvider(ProductionProviderInterfaceV0):
         logger.info("Handling submitted modis products...")
         modis_products = Scene.where({'status': 'submitted', 'sensor_type': 'modis'})
         logger.warn("Found {0} submitted modis products".format(len(modis_products)))
+        pipeline.count(len(modis_products))
+
+        if len(modis_products) > 0 and circuit.breaker('lpdaac').is_open():
+            logger.warn('lpdaac circuit is open, leaving modis products submitted')
+            return True
 
         if len(modis_products) > 0:
             lpdaac_ids = []
             nonlp_ids = []
 
+            found = lpdaac.inputs_exist([product.name for product in modis_products])
+
             for product in modis_products:
-                if lpdaac.input_exists(product.name) is True:
+                if product.name not in found:
+                    # check didn't finish, leave it submitted for the next pass
+                    continue
+                elif found[product.name] is True:
                     lpdaac_ids.append(product.id)
                     logger.warn('{0} is on cache'.format(product.name))
                 else:
@@ -944,6 +1326,7 @@ class ProductionProvider(ProductionProviderInterfaceV0):
         logger.info("Handling submitted plot products...")
         plot_scenes = Scene.where({'status': 'submitted', 'sensor_type': 'plot'})
         plot_orders = [Order.find(s.order_id) for s in plot_scenes]
+        pipeline.count(len(plot_scenes))
         logger.info("Found {0} submitted plot orders".format(len(plot_orders)))
 
         for order in plot_orders:
@@ -1006,7 +1389,7 @@ class ProductionProvider(ProductionProviderInterfaceV0):
             raise TypeError(msg)
 
         # find all scenes that are not complete
-        scenes = order.scenes({'status NOT ': ('complete', 'unavailable')})
+        scenes = order.scenes({'status NOT ': ('complete', 'unavailable')}, ['id'])
         if len(scenes) == 0:
             logger.info('Completing order: {0}'.format(order.orderid))
             order.status = 'complete'
@@ -1036,6 +1419,7 @@ class ProductionProvider(ProductionProviderInterfaceV0):
         :return: True
         """
         orders = Order.where({'status': 'ordered'})
+        pipeline.count(len(orders))
         [self.update_order_if_complete(o) for o in orders]
         return True
 
@@ -1049,6 +1433,7 @@ class ProductionProvider(ProductionProviderInterfaceV0):
         days = config.get('policy.purge_orders_after')
         cutoff = datetime.datetime.now() - datetime.timedelta(days=int(days))
         orders = Order.where({'status': 'complete', 'completion_date <': cutoff})
+        pipeline.count(len(orders))
         start_capacity = onlinecache.capacity()
 
         logger.info('Using purge policy of {0} days'.format(days))
@@ -1089,6 +1474,8 @@ class ProductionProvider(ProductionProviderInterfaceV0):
     @staticmethod
     def handle_failed_ee_updates():
         scenes = Scene.where({'failed_lta_status_update IS NOT': None})
+        pipeline.count(len(scenes))
+        Scene.prefetch_orders(scenes)
         for s in scenes:
             try:
                 lta.update_order_status(s.order_attr('ee_order_id'), s.ee_unit_id,
@@ -1105,34 +1492,40 @@ class ProductionProvider(ProductionProviderInterfaceV0):
 
     def handle_orders(self):
         """
-        Logic handler for how we accept orders + products into the system
+        Logic handler for how we accept orders + products into the system,
+        runs each stage of the order pipeline that is due
         :return: True
         """
-        self.send_initial_emails()
-        self.handle_onorder_landsat_products()
-        self.handle_retry_products()
-        self.load_ee_orders()
-        self.handle_failed_ee_updates()
-        self.handle_submitted_products()
-        self.finalize_orders()
+        pipeline.Pipeline(self).run()
 
-        cache_key = 'orders_last_purged'
-        result = cache.get(cache_key)
-
-        # dont run this unless the cached lock has expired
-        if result is None:
-            logger.info('Purge lock expired... running')
-
-            # first thing, populate the cached lock field
-            timeout = int(config.get('system.run_order_purge_every'))
-            cache.set(cache_key, datetime.datetime.now(), timeout)
-
-            #purge the orders from disk now
-            self.purge_orders(send_email=True)
-        else:
-            logger.info('Purge lock detected... skipping')
+        logger.info('Circuits: {0}'.format(circuit.statistics()))
+        logger.info('LTA SOAP clients: {0}'.format(lta.soap_clients.statistics()))
+        logger.info('HTTP sessions: {0}'.format(sessions.statistics()))
         return True
 
+    def run_stage(self, name):
+        """
+        Run a single stage of order handling now, whatever its cadence,
+        waiting up to pipeline.lease_wait seconds (default 30) for a run
+        already in progress to finish
+        :param name: pipeline stage name
+        :return: dict, record of the run
+        """
+        wait = float(config.get('pipeline.lease_wait') or 30)
+        runner = pipeline.Pipeline(self)
+        # a lane that falls over is logged and left out of the records
+        record = runner.run([name], force=True, wait=wait).get(name)
+        if record is None:
+            return {'result': 'failed, lane did not finish'}
+        return runner.printable(record)
+
+    def pipeline_status(self):
+        """
+        Configuration and last run of each stage of order handling
+        :return: list of dicts
+        """
+        return pipeline.Pipeline(self).status()
+
     @staticmethod
     def strip_unrelated(sceneid, opts):
         """
@@ -1154,18 +1547,17 @@ class ProductionProvider(ProductionProviderInterfaceV0):
 
     @staticmethod
     def production_whitelist():
-        cache_key = 'prod_whitelist'
-        prodlist = cache.get(cache_key)
-        if prodlist is None:
+        def build_whitelist():
             logger.info("Regenerating production whitelist...")
-            # timeout in 6 hours
-            timeout = 60 * 60 * 6
             prodlist = list(['127.0.0.1', socket.gethostbyname(socket.gethostname())])
             prodlist.append(hadoop_handler.master_ip())
             prodlist.extend(hadoop_handler.slave_ips())
-            cache.set(cache_key, prodlist, timeout)
+            return prodlist
 
-        return prodlist
+        cache_key = 'prod_whitelist'
+        # timeout in 6 hours
+        timeout = 60 * 60 * 6
+        return cache.get_or_compute(cache_key, build_whitelist, timeout)
 
     @staticmethod
     def catch_orphaned_scenes():
@@ -1173,7 +1565,9 @@ class ProductionProvider(ProductionProviderInterfaceV0):
 
         def find_orphans():
             job_dict = hadoop_handler.job_names_ids()
-            queued_scenes = Scene.where({'status': ('queued', 'processing')})
+            queued_scenes = Scene.where({'status': ('queued', 'processing')},
+                                        ['name', 'job_name', 'orphaned', 'reported_orphan'],
+                                        stream=True)
             return [scene for scene in queued_scenes if scene.job_name not in job_dict]
 
         for scene in find_orphans():
@@ -230,28 +230,19 @@ REPORTS = {
     'scheduling_next_up': {
         'display_name': 'Scheduling - Next Up',
         'description': 'Shows products that will be scheduled to run next',
-        'query': r'''WITH order_queue AS
-                     (SELECT u.email "email", count(name) "running"
-                      FROM ordering_scene s, ordering_order o, auth_user u
-                      WHERE
-                      u.id = o.user_id
-                      AND o.id = s.order_id
-                      AND s.status in ('queued', 'processing')
-                      GROUP BY u.email)
-                     SELECT
+        'query': r'''SELECT
                      s.name "Scene",
                      o.order_date "Date Ordered",
                      o.orderid "Order ID",
                      q.running "Currently Running Count"
                      FROM ordering_scene s,
                           ordering_order o,
-                          auth_user u,
-                          order_queue q
-                     WHERE u.id = o.user_id
-                     AND o.id = s.order_id
+                          ordering_user_running q
+                     WHERE o.id = s.order_id
                      AND o.status = 'ordered'
                      AND s.status = 'oncache'
-                     AND q.email = u.email
+                     AND q.user_id = o.user_id
+                     AND q.running > 0
                      ORDER BY q.running ASC, o.order_date ASC'''
     }
 }
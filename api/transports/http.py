@@ -11,7 +11,8 @@ from api.util import api_cfg
 from http_user import Index, VersionInfo, AvailableProducts, ValidationInfo,\
     ListOrders, Ordering, UserInfo, ItemStatus
 
-from http_production import ProductionVersion, ProductionConfiguration, ProductionOperations, ProductionManagement
+from http_production import ProductionVersion, ProductionConfiguration, ProductionOperations, ProductionManagement,\
+    ProductionPipeline
 
 from http_admin import Reports, SystemStatus, OrderResets
 
@@ -93,11 +94,16 @@ transport_api.add_resource(ProductionOperations,
                            '/production-api/v<version>/products',
                            '/production-api/v<version>/<action>',
                            '/production-api/v<version>/handle-orders',
-                           '/production-api/v<version>/queue-products')
+                           '/production-api/v<version>/queue-products',
+                           '/production-api/v<version>/claim-products')
 
 transport_api.add_resource(ProductionManagement,
                            '/production-api/v<version>/handle-orphans')
 
+transport_api.add_resource(ProductionPipeline,
+                           '/production-api/v<version>/pipeline',
+                           '/production-api/v<version>/pipeline/<stage>')
+
 transport_api.add_resource(ProductionConfiguration,
                            '/production-api/v<version>/configuration/<key>')
 
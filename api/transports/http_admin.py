@@ -1,13 +1,13 @@
 # Contains Admin facing REST functionality
 
 import flask
-import memcache
 import traceback
 
 from api.domain import default_error_message, admin_api_operations
 
 from api.interfaces.admin.version1 import API as APIv1
 from api.system.logger import ilogger as logger
+from api.providers.caching.caching_provider import CachingProvider
 from api.domain.user import User
 
 from flask import jsonify
@@ -19,7 +19,7 @@ from flask.ext.restful import Resource
 
 espa = APIv1()
 auth = HTTPBasicAuth()
-cache = memcache.Client(['127.0.0.1:11211'], debug=0)
+cache = CachingProvider(local_size=0)
 
 
 def whitelist(func):
@@ -90,7 +90,9 @@ class ProductionOperations(Resource):
     @staticmethod
     def post(version, action=None):
         params = request.get_json(force=True)
-        if 'queue-products' in request.url:
+        if 'claim-products' in request.url:
+            resp = espa.claim_products(**params)
+        elif 'queue-products' in request.url:
             resp = espa.queue_products(**params)
         elif action:
             resp = espa.update_product_details(action, params)
@@ -98,6 +100,22 @@ class ProductionOperations(Resource):
         return prep_response(resp)
 
 
+class ProductionPipeline(Resource):
+    decorators = [whitelist, version_filter]
+
+    @staticmethod
+    def get(version, stage=None):
+        resp = espa.pipeline_status()
+        if stage and isinstance(resp, list):
+            resp = [s for s in resp if s['name'] == stage]
+        return prep_response(resp)
+
+    @staticmethod
+    def post(version, stage):
+        resp = espa.run_stage(stage)
+        return prep_response(resp)
+
+
 class ProductionConfiguration(Resource):
     decorators = [whitelist, version_filter]
 
@@ -1,12 +1,12 @@
 # Contains user facing REST functionality
 
 import flask
-import memcache
 
 from api.interfaces.ordering.version1 import API as APIv1
 from api.domain import user_api_operations
 from api.system.logger import ilogger as logger
-from api.util import api_cfg
+from api.providers.caching.caching_provider import CachingProvider
+from api.util import api_cfg_set
 from api.util import lowercase_all
 from api.domain.user import User
 
@@ -22,7 +22,7 @@ from functools import wraps
 
 espa = APIv1()
 auth = HTTPBasicAuth()
-cache = memcache.Client(['127.0.0.1:11211'], debug=0)
+cache = CachingProvider(local_size=0)
 
 
 def greylist(func):
@@ -34,8 +34,8 @@ def greylist(func):
     """
     @wraps(func)
     def decorated(*args, **kwargs):
-        black_ls = api_cfg().get('user_blacklist')
-        white_ls = api_cfg().get('user_whitelist')
+        black_ls = api_cfg_set('user_blacklist')
+        white_ls = api_cfg_set('user_whitelist')
         denied_response = make_response(jsonify({'msg': 'Access Denied'}), 403)
 
         if 'X-Forwarded-For' in request.headers:
@@ -44,13 +44,12 @@ def greylist(func):
             remote_addr = request.remote_addr or 'untrackable'
 
         # prohibited ip's
-        if black_ls:
-            if remote_addr in black_ls.split(','):
-                return denied_response
+        if remote_addr in black_ls:
+            return denied_response
 
         # for when were guarding access
         if white_ls:
-            if remote_addr not in white_ls.split(','):
+            if remote_addr not in white_ls:
                 return denied_response
 
         return func(*args, **kwargs)
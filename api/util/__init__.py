@@ -4,6 +4,67 @@ import ConfigParser
 import os
 import subprocess
 import datetime
+import threading
+import time
+
+# seconds a parsed config file is trusted before its stat() is checked again
+CFG_CHECK_INTERVAL = 5
+
+_cfg_cache = {}
+_cfg_lock = threading.Lock()
+
+
+def _cfg_path(cfgfile):
+    if cfgfile == ".cfgnfo":
+        return os.path.join(os.environ['ESPA_CONFIG_PATH'], '.usgs', cfgfile)
+    else:
+        return cfgfile
+
+
+def _cfg_stamp(cfg_path):
+    try:
+        st = os.stat(cfg_path)
+    except OSError:
+        # ConfigParser quietly reads nothing from a missing file
+        return None
+
+    return st.st_ino, st.st_mtime, st.st_size
+
+
+def _cfg_entry(cfgfile):
+    """
+    Parsed view of a config file, only re-read when the file's inode,
+    mtime or size changes.  The stat() itself happens at most once every
+    CFG_CHECK_INTERVAL seconds per file
+    """
+    cfg_path = _cfg_path(cfgfile)
+    now = time.time()
+
+    entry = _cfg_cache.get(cfg_path)
+    if entry is not None and now - entry['checked'] < CFG_CHECK_INTERVAL:
+        return entry
+
+    stamp = _cfg_stamp(cfg_path)
+
+    with _cfg_lock:
+        entry = _cfg_cache.get(cfg_path)
+        if entry is None or entry['stamp'] != stamp:
+            cfg_info = {}
+            config = ConfigParser.ConfigParser()
+            config.read(cfg_path)
+
+            for sect in config.sections():
+                cfg_info[sect] = {}
+                for opt in config.options(sect):
+                    cfg_info[sect][opt] = config.get(sect, opt)
+
+            entry = {'stamp': stamp, 'info': cfg_info, 'sets': {}}
+            _cfg_cache[cfg_path] = entry
+
+        entry['checked'] = now
+
+    return entry
+
 
 def get_cfg(cfgfile=".cfgnfo"):
     """
@@ -12,26 +73,34 @@ def get_cfg(cfgfile=".cfgnfo"):
 
     :return: dict
     """
-    if cfgfile == ".cfgnfo":
-        cfg_path = os.path.join(os.environ['ESPA_CONFIG_PATH'], '.usgs', cfgfile)
-    else:
-        cfg_path = cfgfile
-
-    cfg_info = {}
-    config = ConfigParser.ConfigParser()
-    config.read(cfg_path)
-
-    for sect in config.sections():
-        cfg_info[sect] = {}
-        for opt in config.options(sect):
-            cfg_info[sect][opt] = config.get(sect, opt)
+    info = _cfg_entry(cfgfile)['info']
+    return dict((sect, dict(opts)) for sect, opts in info.iteritems())
 
-    return cfg_info
 
 def api_cfg(section='config', cfgfile=".cfgnfo"):
-    config = get_cfg(cfgfile)[section]
+    config = dict(_cfg_entry(cfgfile)['info'][section])
     return config
 
+
+def api_cfg_set(option, section='config', cfgfile=".cfgnfo"):
+    """
+    Retrieve a comma separated option as a set, split once per load of
+    the config file rather than on every call
+
+    :return: frozenset, empty if the option is not defined
+    """
+    entry = _cfg_entry(cfgfile)
+    key = (section, option)
+
+    ret = entry['sets'].get(key)
+    if ret is None:
+        value = entry['info'].get(section, {}).get(option) or ''
+        ret = frozenset(v.strip() for v in value.split(',') if v.strip())
+        entry['sets'][key] = ret
+
+    return ret
+
+
 def send_email(sender, recipient, subject, body):
     """
     Send out an email to give notice of success or failure
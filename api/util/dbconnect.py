@@ -1,37 +1,262 @@
 # TODO Look at making an actual sub-class of connect and cursor to open up more
 # TODO built in functionality
 import psycopg2
+import psycopg2.extensions
 import psycopg2.extras as db_extras
 import numbers
 import os
+import threading
+import time
 
 from collections import OrderedDict
-from api.util import api_cfg
+from api.util import api_cfg, get_cfg
 
 def dictfetchall(cursor, fetcharr):
     ''' Returns all rows from a cursor as a dict '''
-    desc = cursor.description
-    return [OrderedDict(zip([col[0] for col in desc], row))
-            for row in fetcharr]
+    return list(iterdicts(cursor, fetcharr))
+
+
+def iterdicts(cursor, fetcharr):
+    '''
+    Yields rows from a cursor as a dict, one at a time.  The column names
+    are read after the first row arrives as named cursors only have a
+    description once something has been fetched
+    '''
+    cols = None
+    for row in fetcharr:
+        if cols is None:
+            cols = [col[0] for col in cursor.description]
+        yield OrderedDict(zip(cols, row))
+
 
 class DBConnectException(Exception):
     pass
 
+
+class ConnectionPool(object):
+    """
+    Thread-safe pool of psycopg2 connections for a single process
+
+    Connections are handed out LIFO so the warmest connection is reused
+    first.  A connection idle for longer than health_check seconds is
+    pinged before being handed out, and one idle for longer than max_idle
+    seconds is closed and replaced.  The pool records the pid it was
+    created in so that db_instance() can rebuild it after a fork
+    """
+    def __init__(self, dbhost, db, dbuser, dbpass, dbport, minconn=1,
+                 maxconn=10, max_idle=300, health_check=30, wait_timeout=30):
+        self.connect_args = dict(host=dbhost, database=db, user=dbuser,
+                                 password=dbpass, port=dbport)
+        self.minconn = int(minconn)
+        self.maxconn = int(maxconn)
+        self.max_idle = float(max_idle)
+        self.health_check = float(health_check)
+        self.wait_timeout = float(wait_timeout)
+        self.pid = os.getpid()
+
+        self._cond = threading.Condition(threading.Lock())
+        # [(connection, time returned to the pool), ...]
+        self._idle = []
+        self._in_use = {}
+        self.stats = {'checkouts': 0, 'waits': 0, 'wait_time': 0.0,
+                      'checkout_time': 0.0, 'created': 0, 'recycled': 0,
+                      'failed_health_checks': 0}
+
+        for _ in range(self.minconn):
+            self._idle.append((self._connect(), time.time()))
+
+    def _connect(self):
+        try:
+            conn = psycopg2.connect(**self.connect_args)
+        except psycopg2.Error as e:
+            raise DBConnectException(e)
+
+        self._count('created')
+        return conn
+
+    def _count(self, key):
+        with self._cond:
+            self.stats[key] += 1
+
+    def _healthy(self, conn, idle_since):
+        if conn.closed:
+            return False
+
+        idle = time.time() - idle_since
+        if idle > self.max_idle:
+            self._count('recycled')
+            return False
+
+        if idle > self.health_check:
+            try:
+                cursor = conn.cursor()
+                cursor.execute('select 1;')
+                cursor.close()
+                conn.rollback()
+            except psycopg2.Error:
+                self._count('failed_health_checks')
+                return False
+
+        return True
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    @classmethod
+    def _detach(cls, conn):
+        # a connection inherited across a fork shares its socket with the
+        # parent, closing it would send the server a terminate down the
+        # parent's connection.  Pointing the child's descriptor at
+        # /dev/null first means only the child's copy goes away
+        devnull = os.open(os.devnull, os.O_RDWR)
+        try:
+            os.dup2(devnull, conn.fileno())
+        except (OSError, psycopg2.Error):
+            pass
+        finally:
+            os.close(devnull)
+
+        cls._discard(conn)
+
+    def abandon(self):
+        """
+        Let go of a pool inherited across a fork, dropping its idle
+        connections without touching the parent's sockets
+        """
+        with self._cond:
+            for conn, _ in self._idle:
+                self._detach(conn)
+            self._idle = []
+
+    def getconn(self):
+        """
+        Borrow a connection, blocking up to wait_timeout seconds when all
+        maxconn connections are checked out
+        """
+        start = time.time()
+        with self._cond:
+            if not self._idle and len(self._in_use) >= self.maxconn:
+                self.stats['waits'] += 1
+
+            while not self._idle and len(self._in_use) >= self.maxconn:
+                remaining = self.wait_timeout - (time.time() - start)
+                if remaining <= 0:
+                    raise DBConnectException('Timed out after {0} seconds '
+                                             'waiting for a pooled db '
+                                             'connection'
+                                             .format(self.wait_timeout))
+                self._cond.wait(remaining)
+
+            if self._idle:
+                conn, idle_since = self._idle.pop()
+            else:
+                conn, idle_since = None, None
+
+            # reserve the slot before leaving the lock
+            token = object()
+            self._in_use[token] = None
+
+        try:
+            if conn is not None and not self._healthy(conn, idle_since):
+                self._discard(conn)
+                conn = None
+
+            if conn is None:
+                conn = self._connect()
+        except Exception:
+            with self._cond:
+                del self._in_use[token]
+                self._cond.notify()
+            raise
+
+        now = time.time()
+        with self._cond:
+            del self._in_use[token]
+            self._in_use[id(conn)] = now
+            self.stats['checkouts'] += 1
+            self.stats['wait_time'] += now - start
+
+        return conn
+
+    def putconn(self, conn):
+        """
+        Return a borrowed connection to the pool.  Broken connections, or
+        those left mid-transaction, are closed instead of being reused
+        """
+        if self.pid != os.getpid():
+            # checked out before a fork, it belongs to the parent
+            self._detach(conn)
+            return
+
+        now = time.time()
+        reusable = (not conn.closed and conn.get_transaction_status() ==
+                    psycopg2.extensions.TRANSACTION_STATUS_IDLE)
+
+        with self._cond:
+            borrowed = self._in_use.pop(id(conn), None)
+            if borrowed is not None:
+                self.stats['checkout_time'] += now - borrowed
+
+            if reusable and len(self._idle) < self.maxconn:
+                self._idle.append((conn, now))
+            else:
+                self._discard(conn)
+
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            for conn, _ in self._idle:
+                self._discard(conn)
+            self._idle = []
+
+    def statistics(self):
+        """
+        Snapshot of the pool counters, wait_time and checkout_time are
+        cumulative seconds
+        """
+        with self._cond:
+            ret = dict(self.stats)
+            ret['idle'] = len(self._idle)
+            ret['in_use'] = len(self._in_use)
+            ret['pid'] = self.pid
+
+        return ret
+
+
 class DBConnect(object):
     """
     Class for connecting to a postgresql database using a single with statement
     """
     def __init__(self, dbhost, db, dbuser, dbpass, dbport, autocommit=False,
-                 cursor_factory=db_extras.DictCursor):
+                 cursor_factory=db_extras.DictCursor, pool=None):
+        self.pool = pool
+        self.conn = None
+        self.cursor = None
+        self.cursor_factory = cursor_factory
+        self._stream = None
+
         try:
-            self.conn = psycopg2.connect(host=dbhost, database=db, user=dbuser,
-                                         password=dbpass, port=dbport)
+            if pool is not None:
+                self.conn = pool.getconn()
+            else:
+                self.conn = psycopg2.connect(host=dbhost, database=db,
+                                             user=dbuser, password=dbpass,
+                                             port=dbport)
             self.cursor = self.conn.cursor(cursor_factory=cursor_factory)
         except psycopg2.Error as e:
+            self._release()
             raise DBConnectException(e)
 
         self.autocommit = autocommit
         self.fetcharr = []
+        self._description = None
+        self._dictfetchall = None
+        self._search_path_set = False
 
         # psycopg2 doesn't allow you to specify a schema when connecting to the database.
         # by modifying search_path for the connection, we can ensure were only working with
@@ -39,6 +264,7 @@ class DBConnect(object):
         if 'espa_api_testing' in os.environ.keys():
             if os.environ["espa_api_testing"] is "True":
                 self.cursor.execute("set search_path = espa_unit_test;")
+                self._search_path_set = True
 
     def execute(self, sql_str, params=None):
         """
@@ -61,22 +287,64 @@ class DBConnect(object):
         if self.autocommit:
             self.commit()
 
-    def select(self, sql_str, params=None):
+    def select(self, sql_str, params=None, stream=False, itersize=2000):
         """
         Used for retrieving information from the database
         Results are stored in self.fetcharr to enable more flexible use
         Each row result is stored as a tuple in the list array
+
+        When stream is True the query is run through a named (server side)
+        cursor and self.fetcharr is an iterator that pulls itersize rows
+        from the server at a time, so large result sets are never held in
+        memory all at once.  A streamed result can be iterated only once,
+        has no len(), and stays open until the next streamed select or
+        until the connection is released
         """
         if params and not self.verify_type(params):
             params = self.conv_totuple(params)
 
+        self._dictfetchall = None
+
         try:
-            self.cursor.execute(sql_str, params)
-            self.fetcharr = self.cursor.fetchall()
-            self.dictfetchall = dictfetchall(self.cursor, self.fetcharr)
+            if stream:
+                self._close_stream()
+                self._stream = self.conn.cursor('dbconnect_{0}'.format(id(self)),
+                                                cursor_factory=self.cursor_factory)
+                self._stream.itersize = int(itersize)
+                self._stream.execute(sql_str, params)
+                self._description = None
+                self.fetcharr = iter(self._stream)
+            else:
+                self.cursor.execute(sql_str, params)
+                self._description = self.cursor.description
+                self.fetcharr = self.cursor.fetchall()
         except psycopg2.Error as e:
             raise DBConnectException(e)
 
+    @property
+    def dictfetchall(self):
+        """
+        Rows from the last select as OrderedDicts, only built when asked for
+        """
+        if self._dictfetchall is None:
+            if self._description is None and self._stream is not None:
+                self._dictfetchall = dictfetchall(self._stream, self.fetcharr)
+            else:
+                cols = [col[0] for col in self._description or []]
+                self._dictfetchall = [OrderedDict(zip(cols, row))
+                                      for row in self.fetcharr]
+
+        return self._dictfetchall
+
+    def _close_stream(self):
+        stream, self._stream = self._stream, None
+        if stream is not None and not stream.closed:
+            try:
+                stream.close()
+            except psycopg2.Error:
+                # the transaction holding the cursor is already gone
+                pass
+
     def commit(self):
         try:
             self.conn.commit()
@@ -112,13 +380,50 @@ class DBConnect(object):
         else:
             return False
 
+    def _release(self):
+        """
+        Close the cursor and hand the connection back to the pool, or close
+        it outright when not pooled.  Safe to call more than once
+        """
+        conn, self.conn = self.conn, None
+        cursor, self.cursor = self.cursor, None
+
+        try:
+            if getattr(self, '_stream', None) is not None:
+                self._close_stream()
+
+            if cursor is not None:
+                cursor.close()
+        finally:
+            # the connection goes back even when its cursor won't close
+            if conn is not None:
+                self._putconn(conn)
+
+    def _putconn(self, conn):
+        if self.pool is None:
+            conn.close()
+            return
+
+        try:
+            # match the old close() behaviour, anything not committed is
+            # thrown away before the connection is reused.  Not after a
+            # fork though, the parent's transaction isn't ours to end
+            if not conn.closed and self.pool.pid == os.getpid():
+                conn.rollback()
+                if getattr(self, '_search_path_set', False):
+                    reset = conn.cursor()
+                    reset.execute('reset search_path;')
+                    reset.close()
+                    conn.commit()
+        finally:
+            self.pool.putconn(conn)
+
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         try:
-            self.cursor.close()
-            self.conn.close()
+            self._release()
         except psycopg2.Error as e:
             raise DBConnectException(e)
 
@@ -136,14 +441,56 @@ class DBConnect(object):
 
     def __del__(self):
         try:
-            self.cursor.close()
-            self.conn.close()
-
-            del self.cursor
-            del self.conn
+            self._release()
         except Exception as e:
             raise DBConnectException(e)
 
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def connection_pool():
+    """
+    Retrieve the connection pool for this process, building it on first use
+    and again in any child process forked (e.g. by uwsgi) after it was built
+
+    Pool sizing is read from the optional [db_pool] section of .cfgnfo:
+    minconn, maxconn, max_idle, health_check, wait_timeout
+
+    :return: ConnectionPool
+    """
+    global _pool
+
+    pool = _pool
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+
+    with _pool_lock:
+        if _pool is not None and _pool.pid != os.getpid():
+            _pool.abandon()
+            _pool = None
+
+        if _pool is None:
+            opts = dict(get_cfg().get('db_pool', {}))
+            opts.update(api_cfg('db'))
+            _pool = ConnectionPool(**opts)
+
+        return _pool
+
+
+def pool_stats():
+    """
+    Connection pool counters for this process
+
+    :return: dict
+    """
+    if _pool is None or _pool.pid != os.getpid():
+        return {}
+
+    return _pool.statistics()
+
+
 def db_instance():
-    return DBConnect(**api_cfg('db'))
+    return DBConnect(pool=connection_pool(), **api_cfg('db'))
 
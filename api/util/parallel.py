@@ -0,0 +1,169 @@
+"""
+Bounded fan-out of blocking calls, such as lookups against external
+services, over a small pool of threads
+
+Worker threads are shared across calls and kept once idle,
+so the connections they hold in thread locals (memcache, the database
+pool's checkouts, http sessions) are reused rather than opened again
+for every batch
+"""
+import math
+import os
+import sys
+import threading
+import time
+import Queue
+
+
+class ParallelException(Exception):
+    pass
+
+
+class _Workers(object):
+    """
+    Threads that run submitted functions, started as needed whenever no
+    thread is idle, so nested fan-outs never wait on each other for a
+    thread.  Threads are kept for the life of the process, there are only
+    ever as many as were once busy at the same time
+    """
+
+    def __init__(self):
+        self._tasks = Queue.Queue()
+        self._lock = threading.Lock()
+        self._idle = 0
+        self._threads = 0
+
+    def submit(self, fn):
+        with self._lock:
+            if self._idle > 0:
+                self._idle -= 1
+            else:
+                self._threads += 1
+                thread = threading.Thread(target=self._run,
+                                          name='bounded-map-{0}'.format(self._threads))
+                thread.daemon = True
+                thread.start()
+        self._tasks.put(fn)
+
+    def _run(self):
+        while True:
+            # an untimed get, python 2 polls for timed ones
+            fn = self._tasks.get()
+            try:
+                fn()
+            except Exception:
+                pass
+            with self._lock:
+                self._idle += 1
+
+
+_workers = None
+_workers_pid = None
+_workers_lock = threading.Lock()
+
+
+def _shared_workers():
+    global _workers, _workers_pid
+
+    with _workers_lock:
+        # threads don't survive a fork
+        if _workers_pid != os.getpid():
+            _workers = _Workers()
+            _workers_pid = os.getpid()
+        return _workers
+
+
+class _Result(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+
+    def set(self, value):
+        self.value = value
+        self.done.set()
+
+
+def bounded_map(func, items, workers=8, timeout=None, deadline=None):
+    """
+    Call func(item) for each of items on at most workers threads
+
+    A call still running timeout seconds after it started, or when
+    deadline seconds have passed since bounded_map was called, is given
+    up on and reported as a ParallelException.  With a timeout and no
+    deadline, the deadline is however long every call would take one
+    after another on each thread at their full timeout, so calls stuck
+    behind hung ones aren't waited on forever.  Calls that haven't
+    started by the deadline are never made.  Python threads can't be
+    killed, so an abandoned call keeps running in the background until
+    it returns on its own, func should carry its own socket timeouts
+
+    :param func: callable taking a single item
+    :param items: iterable of arguments for func
+    :param workers: max number of concurrent calls
+    :param timeout: seconds each call is allowed, None for no limit
+    :param deadline: seconds all calls are allowed, None for no limit
+    :return: list of tuple(item, result, exception) in the order of items,
+     exception is None when func returned normally
+    """
+    items = list(items)
+    if not items:
+        return []
+
+    workers = min(workers, len(items))
+    if deadline is None and timeout is not None:
+        deadline = timeout * math.ceil(len(items) / float(workers))
+
+    give_up_at = time.time() + deadline if deadline is not None else None
+    started = {}
+    results = [_Result() for _ in items]
+    indexes = iter(range(len(items)))
+    next_lock = threading.Lock()
+
+    def call(idx):
+        started[idx] = time.time()
+        if give_up_at is not None and started[idx] >= give_up_at:
+            # already reported as given up on, don't spend a call on it
+            return None, ParallelException('deadline passed before the call started')
+        try:
+            return func(items[idx]), None
+        except Exception:
+            return None, sys.exc_info()[1]
+
+    def runner():
+        # each runner takes the next item until there are none left, so
+        # no more than workers calls are ever made at once
+        while True:
+            with next_lock:
+                idx = next(indexes, None)
+            if idx is None:
+                return
+            results[idx].set(call(idx))
+
+    pool = _shared_workers()
+    for _ in range(workers):
+        pool.submit(runner)
+
+    return [(items[idx],) + _wait(results[idx], idx, started, timeout, give_up_at)
+            for idx in range(len(items))]
+
+
+def _wait(result, idx, started, timeout, give_up_at):
+    while True:
+        now = time.time()
+
+        limit = give_up_at
+        if timeout is not None and idx in started:
+            call_limit = started[idx] + timeout
+            limit = call_limit if limit is None else min(limit, call_limit)
+
+        if limit is not None and now >= limit:
+            if idx not in started:
+                return None, ParallelException('deadline passed before the call started')
+            return None, ParallelException('gave up after {0:.1f} seconds'
+                                           .format(now - started[idx]))
+
+        # wake up at least every half second to check whether the call has
+        # started, and so whether its own timeout applies yet
+        wait = 0.5 if limit is None else min(limit - now, 0.5)
+        if result.done.wait(wait):
+            return result.value
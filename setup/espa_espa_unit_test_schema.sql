@@ -12,6 +12,62 @@ SET client_min_messages = warning;
 
 SET search_path = espa_unit_test;
 
+--
+-- Name: ordering_scene_running(); Type: FUNCTION; Schema: espa_unit_test; Owner: espa
+--
+
+CREATE FUNCTION ordering_scene_running() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    -- one row per user per statement, however many of their scenes the
+    -- statement changed, applied in user_id order so statements touching
+    -- the same users lock their rows in the same order and can't deadlock
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO ordering_user_running AS r (user_id, running)
+            SELECT o.user_id, count(*)
+            FROM new_scenes s
+            JOIN ordering_order o ON o.id = s.order_id
+            WHERE s.status IN ('queued', 'processing')
+            GROUP BY o.user_id
+            ORDER BY o.user_id
+            ON CONFLICT (user_id) DO UPDATE SET running = r.running + EXCLUDED.running;
+
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO ordering_user_running AS r (user_id, running)
+            SELECT o.user_id, -count(*)
+            FROM old_scenes s
+            JOIN ordering_order o ON o.id = s.order_id
+            WHERE s.status IN ('queued', 'processing')
+            GROUP BY o.user_id
+            ORDER BY o.user_id
+            ON CONFLICT (user_id) DO UPDATE SET running = r.running + EXCLUDED.running;
+
+    ELSE
+        INSERT INTO ordering_user_running AS r (user_id, running)
+            SELECT d.user_id, sum(d.running)
+            FROM (SELECT o.user_id, 1 AS running
+                  FROM new_scenes s
+                  JOIN ordering_order o ON o.id = s.order_id
+                  WHERE s.status IN ('queued', 'processing')
+                  UNION ALL
+                  SELECT o.user_id, -1
+                  FROM old_scenes s
+                  JOIN ordering_order o ON o.id = s.order_id
+                  WHERE s.status IN ('queued', 'processing')) d
+            GROUP BY d.user_id
+            HAVING sum(d.running) <> 0
+            ORDER BY d.user_id
+            ON CONFLICT (user_id) DO UPDATE SET running = r.running + EXCLUDED.running;
+    END IF;
+
+    RETURN NULL;
+END;
+$$;
+
+
+ALTER FUNCTION espa_unit_test.ordering_scene_running() OWNER TO espa;
+
 --
 -- Name: auth_group_id_seq; Type: SEQUENCE; Schema: espa_unit_test; Owner: espa
 --
@@ -380,6 +436,21 @@ CREATE TABLE ordering_scene (
 
 ALTER TABLE espa_unit_test.ordering_scene OWNER TO espa;
 
+--
+-- Name: ordering_scene_log; Type: TABLE; Schema: espa_unit_test; Owner: espa; Tablespace: 
+--
+
+CREATE TABLE ordering_scene_log (
+    scene_id integer NOT NULL,
+    log bytea NOT NULL,
+    size integer NOT NULL,
+    truncated boolean DEFAULT false NOT NULL,
+    updated timestamp without time zone NOT NULL
+);
+
+
+ALTER TABLE espa_unit_test.ordering_scene_log OWNER TO espa;
+
 --
 -- Name: ordering_tag_id_seq; Type: SEQUENCE; Schema: espa_unit_test; Owner: espa
 --
@@ -394,6 +465,34 @@ CREATE SEQUENCE ordering_tag_id_seq
 
 ALTER TABLE espa_unit_test.ordering_tag_id_seq OWNER TO espa;
 
+--
+-- Name: ordering_tram_poll; Type: TABLE; Schema: espa_unit_test; Owner: espa; Tablespace: 
+--
+
+CREATE TABLE ordering_tram_poll (
+    tram_order_id character varying(13) NOT NULL,
+    first_seen timestamp without time zone NOT NULL,
+    last_polled timestamp without time zone,
+    polls integer DEFAULT 0 NOT NULL,
+    quiet_polls integer DEFAULT 0 NOT NULL,
+    next_poll_at timestamp without time zone NOT NULL
+);
+
+
+ALTER TABLE espa_unit_test.ordering_tram_poll OWNER TO espa;
+
+--
+-- Name: ordering_user_running; Type: TABLE; Schema: espa_unit_test; Owner: espa; Tablespace: 
+--
+
+CREATE TABLE ordering_user_running (
+    user_id integer NOT NULL,
+    running integer DEFAULT 0 NOT NULL
+);
+
+
+ALTER TABLE espa_unit_test.ordering_user_running OWNER TO espa;
+
 --
 -- Name: ordering_userprofile_id_seq; Type: SEQUENCE; Schema: espa_unit_test; Owner: espa
 --
@@ -532,6 +631,30 @@ ALTER TABLE ONLY ordering_scene
     ADD CONSTRAINT ordering_scene_id_pkey PRIMARY KEY (id);
 
 
+--
+-- Name: ordering_scene_log_pkey; Type: CONSTRAINT; Schema: espa_unit_test; Owner: espa; Tablespace: 
+--
+
+ALTER TABLE ONLY ordering_scene_log
+    ADD CONSTRAINT ordering_scene_log_pkey PRIMARY KEY (scene_id);
+
+
+--
+-- Name: ordering_tram_poll_pkey; Type: CONSTRAINT; Schema: espa_unit_test; Owner: espa; Tablespace: 
+--
+
+ALTER TABLE ONLY ordering_tram_poll
+    ADD CONSTRAINT ordering_tram_poll_pkey PRIMARY KEY (tram_order_id);
+
+
+--
+-- Name: ordering_user_running_pkey; Type: CONSTRAINT; Schema: espa_unit_test; Owner: espa; Tablespace: 
+--
+
+ALTER TABLE ONLY ordering_user_running
+    ADD CONSTRAINT ordering_user_running_pkey PRIMARY KEY (user_id);
+
+
 --
 -- Name: ordering_userprofile_id_pkey; Type: CONSTRAINT; Schema: espa_unit_test; Owner: espa; Tablespace: 
 --
@@ -765,6 +888,13 @@ CREATE INDEX ordering_scene_sensor_type ON ordering_scene USING btree (sensor_ty
 CREATE INDEX ordering_scene_status ON ordering_scene USING btree (status);
 
 
+--
+-- Name: ordering_tram_poll_next_poll_at; Type: INDEX; Schema: espa_unit_test; Owner: espa; Tablespace: 
+--
+
+CREATE INDEX ordering_tram_poll_next_poll_at ON ordering_tram_poll USING btree (next_poll_at);
+
+
 --
 -- Name: ordering_userprofile_user_id; Type: INDEX; Schema: espa_unit_test; Owner: espa; Tablespace: 
 --
@@ -814,6 +944,27 @@ CREATE INDEX trans_etl_layer_trigger_date_trigger_read ON trans_etl_layer USING
 CREATE INDEX trans_etl_layer_trigger_read ON trans_etl_layer USING btree (trigger_read);
 
 
+--
+-- Name: ordering_scene_running_delete; Type: TRIGGER; Schema: espa_unit_test; Owner: espa
+--
+
+CREATE TRIGGER ordering_scene_running_delete AFTER DELETE ON ordering_scene REFERENCING OLD TABLE AS old_scenes FOR EACH STATEMENT EXECUTE PROCEDURE ordering_scene_running();
+
+
+--
+-- Name: ordering_scene_running_insert; Type: TRIGGER; Schema: espa_unit_test; Owner: espa
+--
+
+CREATE TRIGGER ordering_scene_running_insert AFTER INSERT ON ordering_scene REFERENCING NEW TABLE AS new_scenes FOR EACH STATEMENT EXECUTE PROCEDURE ordering_scene_running();
+
+
+--
+-- Name: ordering_scene_running_update; Type: TRIGGER; Schema: espa_unit_test; Owner: espa
+--
+
+CREATE TRIGGER ordering_scene_running_update AFTER UPDATE ON ordering_scene REFERENCING OLD TABLE AS old_scenes NEW TABLE AS new_scenes FOR EACH STATEMENT EXECUTE PROCEDURE ordering_scene_running();
+
+
 --
 -- Name: auth_group_permissions_group_id_fkey; Type: FK CONSTRAINT; Schema: espa_unit_test; Owner: espa
 --
@@ -878,6 +1029,14 @@ ALTER TABLE ONLY ordering_order
     ADD CONSTRAINT ordering_order_user_id_4c883492162df004_fk_auth_user_id FOREIGN KEY (user_id) REFERENCES auth_user(id) DEFERRABLE INITIALLY DEFERRED;
 
 
+--
+-- Name: ordering_scene_log_scene_id_fkey; Type: FK CONSTRAINT; Schema: espa_unit_test; Owner: espa
+--
+
+ALTER TABLE ONLY ordering_scene_log
+    ADD CONSTRAINT ordering_scene_log_scene_id_fkey FOREIGN KEY (scene_id) REFERENCES ordering_scene(id) ON DELETE CASCADE;
+
+
 --
 -- Name: ordering_scene_order_id_fkey; Type: FK CONSTRAINT; Schema: espa_unit_test; Owner: espa
 --
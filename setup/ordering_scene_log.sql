@@ -0,0 +1,28 @@
+--
+-- Processing logs, zlib compressed and kept apart from ordering_scene so
+-- the hadoop logs don't bloat the table every dispatch query scans
+--
+-- Names are unqualified, apply with the target schema on the search_path:
+--   psql -d espa -f ordering_scene_log.sql
+--   PGOPTIONS='-c search_path=espa_unit_test' psql -d espa -f ordering_scene_log.sql
+--
+-- Requires PostgreSQL 9.5 or later (INSERT ... ON CONFLICT)
+--
+-- Existing logs are moved over, in batches, by
+--   python -m api.interfaces.admin.migrations.move_scene_logs
+--
+
+BEGIN;
+
+CREATE TABLE ordering_scene_log (
+    scene_id integer NOT NULL,
+    log bytea NOT NULL,
+    size integer NOT NULL,
+    truncated boolean DEFAULT false NOT NULL,
+    updated timestamp without time zone NOT NULL,
+    CONSTRAINT ordering_scene_log_pkey PRIMARY KEY (scene_id),
+    CONSTRAINT ordering_scene_log_scene_id_fkey FOREIGN KEY (scene_id)
+        REFERENCES ordering_scene (id) ON DELETE CASCADE
+);
+
+COMMIT;
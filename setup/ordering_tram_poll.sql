@@ -0,0 +1,28 @@
+--
+-- When each outstanding tram order is next due to be asked about, so
+-- handle_onorder_landsat_products spends its time on the orders most
+-- likely to have moved instead of re-polling every order every cycle
+--
+-- Names are unqualified, apply with the target schema on the search_path:
+--   psql -d espa -f ordering_tram_poll.sql
+--   PGOPTIONS='-c search_path=espa_unit_test' psql -d espa -f ordering_tram_poll.sql
+--
+-- Rows are added and dropped by the poller itself, nothing to backfill
+--
+
+BEGIN;
+
+CREATE TABLE ordering_tram_poll (
+    tram_order_id character varying(13) NOT NULL,
+    first_seen timestamp without time zone NOT NULL,
+    last_polled timestamp without time zone,
+    polls integer DEFAULT 0 NOT NULL,
+    quiet_polls integer DEFAULT 0 NOT NULL,
+    next_poll_at timestamp without time zone NOT NULL,
+    CONSTRAINT ordering_tram_poll_pkey PRIMARY KEY (tram_order_id)
+);
+
+CREATE INDEX ordering_tram_poll_next_poll_at
+    ON ordering_tram_poll (next_poll_at);
+
+COMMIT;
@@ -0,0 +1,96 @@
+--
+-- Per user count of scenes in queued or processing status, kept current by
+-- statement level triggers on ordering_scene so dispatch can order users by
+-- their running work without counting the whole active backlog on every poll
+--
+-- Names are unqualified, apply with the target schema on the search_path:
+--   psql -d espa -f ordering_user_running.sql
+--   PGOPTIONS='-c search_path=espa_unit_test' psql -d espa -f ordering_user_running.sql
+--
+-- Requires PostgreSQL 10 or later (trigger transition tables)
+--
+
+BEGIN;
+
+CREATE TABLE ordering_user_running (
+    user_id integer NOT NULL,
+    running integer DEFAULT 0 NOT NULL,
+    CONSTRAINT ordering_user_running_pkey PRIMARY KEY (user_id)
+);
+
+
+CREATE FUNCTION ordering_scene_running() RETURNS trigger AS $$
+BEGIN
+    -- one row per user per statement, however many of their scenes the
+    -- statement changed, applied in user_id order so statements touching
+    -- the same users lock their rows in the same order and can't deadlock
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO ordering_user_running AS r (user_id, running)
+            SELECT o.user_id, count(*)
+            FROM new_scenes s
+            JOIN ordering_order o ON o.id = s.order_id
+            WHERE s.status IN ('queued', 'processing')
+            GROUP BY o.user_id
+            ORDER BY o.user_id
+            ON CONFLICT (user_id) DO UPDATE SET running = r.running + EXCLUDED.running;
+
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO ordering_user_running AS r (user_id, running)
+            SELECT o.user_id, -count(*)
+            FROM old_scenes s
+            JOIN ordering_order o ON o.id = s.order_id
+            WHERE s.status IN ('queued', 'processing')
+            GROUP BY o.user_id
+            ORDER BY o.user_id
+            ON CONFLICT (user_id) DO UPDATE SET running = r.running + EXCLUDED.running;
+
+    ELSE
+        INSERT INTO ordering_user_running AS r (user_id, running)
+            SELECT d.user_id, sum(d.running)
+            FROM (SELECT o.user_id, 1 AS running
+                  FROM new_scenes s
+                  JOIN ordering_order o ON o.id = s.order_id
+                  WHERE s.status IN ('queued', 'processing')
+                  UNION ALL
+                  SELECT o.user_id, -1
+                  FROM old_scenes s
+                  JOIN ordering_order o ON o.id = s.order_id
+                  WHERE s.status IN ('queued', 'processing')) d
+            GROUP BY d.user_id
+            HAVING sum(d.running) <> 0
+            ORDER BY d.user_id
+            ON CONFLICT (user_id) DO UPDATE SET running = r.running + EXCLUDED.running;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- hold off scene status changes until the backfill below is committed
+LOCK TABLE ordering_scene IN SHARE MODE;
+
+-- a trigger with transition tables handles a single event
+CREATE TRIGGER ordering_scene_running_insert
+    AFTER INSERT ON ordering_scene
+    REFERENCING NEW TABLE AS new_scenes
+    FOR EACH STATEMENT EXECUTE PROCEDURE ordering_scene_running();
+
+CREATE TRIGGER ordering_scene_running_delete
+    AFTER DELETE ON ordering_scene
+    REFERENCING OLD TABLE AS old_scenes
+    FOR EACH STATEMENT EXECUTE PROCEDURE ordering_scene_running();
+
+CREATE TRIGGER ordering_scene_running_update
+    AFTER UPDATE ON ordering_scene
+    REFERENCING OLD TABLE AS old_scenes NEW TABLE AS new_scenes
+    FOR EACH STATEMENT EXECUTE PROCEDURE ordering_scene_running();
+
+INSERT INTO ordering_user_running (user_id, running)
+    SELECT o.user_id, count(*)
+    FROM ordering_scene s
+    JOIN ordering_order o ON o.id = s.order_id
+    WHERE s.status IN ('queued', 'processing')
+    GROUP BY o.user_id;
+
+COMMIT;
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""
+Time download url lookups for a batch of products spread over many contact
+ids, one contact id after another as get_products_to_process used to, and
+fanned out with bounded_map
+
+Uses the api.external.mocks.lta stand-in with latency injected per call
+
+    python -m test.bench_download_urls --cids 100 --latency 0.2 --workers 8
+"""
+import argparse
+import time
+
+from api.external.mocks import lta
+from api.util.parallel import bounded_map
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cids', type=int, default=100)
+    parser.add_argument('--per-cid', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    by_cid = dict((cid, ['LC8{0:06d}{1:03d}LGN00'.format(cid, n)
+                         for n in range(args.per_cid)])
+                  for cid in range(args.cids))
+
+    def lookup(cid):
+        time.sleep(args.latency)
+        return lta.get_download_urls(by_cid[cid], cid)
+
+    start = time.time()
+    sequential = [lookup(cid) for cid in sorted(by_cid)]
+    seq_time = time.time() - start
+
+    start = time.time()
+    fanned = bounded_map(lookup, sorted(by_cid), workers=args.workers)
+    par_time = time.time() - start
+
+    assert [r for _, r, _ in fanned] == sequential
+
+    print '{0} cids, {1}s latency per call'.format(args.cids, args.latency)
+    print 'sequential:             {0:.2f}s'.format(seq_time)
+    print 'bounded_map {0} workers: {1:.2f}s ({2:.1f}x)'.format(
+        args.workers, par_time, seq_time / par_time)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+Time LPDAAC availability checks for a batch of MODIS products, one HEAD
+after another as handle_submitted_modis_products used to, and batched
+through LPDAACService.inputs_exist
+
+The datapool is a local HTTP server answering HEAD requests after a
+delay, failing a fraction of them with a 404
+
+    python -m test.bench_lpdaac --products 200 --latency 0.05 --fail 0.1
+"""
+import argparse
+import random
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+from mock import patch
+
+
+class DatapoolServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def handler(latency, fail):
+    class Datapool(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_HEAD(self):
+            time.sleep(latency)
+            self.send_response(404 if random.random() < fail else 200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    return Datapool
+
+
+def config_get(key):
+    values = {'path.aqua_base_source': '/MOLA',
+              'path.terra_base_source': '/MOLT',
+              'file.extension.modis.input.filename': '.hdf',
+              'lpdaac.check_workers': args.workers}
+    if isinstance(key, list):
+        return [values.get(k) for k in key]
+    return values.get(key)
+
+
+def main():
+    server = DatapoolServer(('127.0.0.1', 0), handler(args.latency, args.fail))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    products = ['MOD09A1.A2000{0:03d}.h{1:02d}v11.005.2007042201314'.format(doy, h)
+                for doy in range(1, 366, 8) for h in range(36)][:args.products]
+
+    with patch('api.external.lpdaac.config') as config, \
+            patch('api.external.sessions.config') as session_config:
+        config.url_for.return_value = '127.0.0.1:{0}'.format(server.server_port)
+        config.get.side_effect = config_get
+        session_config.get.return_value = (args.workers, None, 0, None)
+
+        from api.external import lpdaac, sessions
+
+        start = time.time()
+        service = lpdaac.LPDAACService()
+        sequential = dict((p, service.input_exists(p)) for p in products)
+        seq_time = time.time() - start
+
+        start = time.time()
+        batched = lpdaac.LPDAACService().inputs_exist(products)
+        batch_time = time.time() - start
+
+        # close kept alive connections so the server's handler threads end
+        sessions.session().close()
+
+    server.shutdown()
+    server.server_close()
+
+    print '{0} products, {1}s latency, {2:.0%} missing'.format(len(products), args.latency, args.fail)
+    print 'sequential:                {0:.2f}s, {1} found'.format(
+        seq_time, sum(sequential.values()))
+    print 'inputs_exist {0} workers: {1:.2f}s, {2} found ({3:.1f}x)'.format(
+        args.workers, batch_time, sum(batched.values()), seq_time / batch_time)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--fail', type=float, default=0.1)
+    parser.add_argument('--workers', type=int, default=16)
+    args = parser.parse_args()
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""
+Compare cache hit ratios for several API hosts each talking to their own
+memcached against the same hosts sharing a consistent hash ring, and how
+many keys move when a node is added under modulo and ring hashing
+
+No memcached is needed, the caches are simulated in process
+
+    python -m test.bench_memcache --hosts 4 --requests 200000
+"""
+import argparse
+import random
+
+import memcache
+
+from api.providers.caching.caching_provider import HashRing
+
+
+def zipf_keys(count, requests, s=1.1):
+    weights = [1.0 / (i ** s) for i in range(1, count + 1)]
+    total = sum(weights)
+    cumulative = []
+    acc = 0.0
+    for w in weights:
+        acc += w / total
+        cumulative.append(acc)
+
+    keys = []
+    for _ in range(requests):
+        r = random.random()
+        lo, hi = 0, count - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if cumulative[mid] < r:
+                lo = mid + 1
+            else:
+                hi = mid
+        keys.append('user{0}-credentials'.format(lo))
+    return keys
+
+
+def hit_ratio(keys, hosts, route):
+    stores = {}
+    hits = 0
+    for i, key in enumerate(keys):
+        # requests are spread round robin over the API hosts
+        store = stores.setdefault(route(i % hosts, key), set())
+        if key in store:
+            hits += 1
+        else:
+            store.add(key)
+    return float(hits) / len(keys)
+
+
+def moved(keys, before, after):
+    return float(sum(1 for k in keys if before(k) != after(k))) / len(keys)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hosts', type=int, default=4)
+    parser.add_argument('--keys', type=int, default=50000)
+    parser.add_argument('--requests', type=int, default=200000)
+    args = parser.parse_args()
+
+    random.seed(0)
+    keys = zipf_keys(args.keys, args.requests)
+    nodes = ['10.0.0.{0}:11211'.format(i) for i in range(args.hosts)]
+    ring = HashRing(nodes)
+
+    print 'hit ratio, memcached per host: {0:.3f}'.format(
+        hit_ratio(keys, args.hosts, lambda host, key: host))
+    print 'hit ratio, shared ring:        {0:.3f}'.format(
+        hit_ratio(keys, args.hosts, lambda host, key: ring.node(key)))
+
+    unique = list(set(keys))
+    grown = HashRing(nodes + ['10.0.0.{0}:11211'.format(args.hosts)])
+    print 'keys moved adding a node, modulo: {0:.3f}'.format(
+        moved(unique,
+              lambda k: memcache.cmemcache_hash(k) % args.hosts,
+              lambda k: memcache.cmemcache_hash(k) % (args.hosts + 1)))
+    print 'keys moved adding a node, ring:   {0:.3f}'.format(
+        moved(unique, ring.node, grown.node))
+
+
+if __name__ == '__main__':
+    main()
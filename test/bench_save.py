@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+Time Scene.save the way it used to work, writing every column and reading
+the whole row back, against writing only the changed columns and taking
+them back from UPDATE ... RETURNING
+
+Each scene is saved twice per run, once with a changed note and once with
+it put back, so run it against a test database with scenes in it
+
+    python -m test.bench_save --scenes 500
+"""
+import argparse
+import time
+
+import psycopg2.extensions as db_extns
+
+from api.domain.scene import Scene
+from api.util.dbconnect import db_instance
+
+
+def legacy_save(scene):
+    # Scene.save before it tracked changes.  log_file_contents lives in
+    # ordering_scene_log now, writing or reading it back here would time
+    # a SceneLog query the old save never made
+    sql = 'UPDATE ordering_scene SET %s = %s WHERE id = %s'
+    cols = [c for c in Scene.save_columns if c != 'log_file_contents']
+    vals = tuple(getattr(scene, c) for c in cols)
+
+    with db_instance() as db:
+        db.execute(sql, (db_extns.AsIs('({})'.format(','.join(cols))),
+                         vals, scene.id))
+        db.commit()
+
+    new = Scene.where({'id': scene.id})[0]
+    for col in cols:
+        setattr(scene, col, getattr(new, col))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenes', type=int, default=500)
+    args = parser.parse_args()
+
+    with db_instance() as db:
+        db.select('SELECT id FROM ordering_scene ORDER BY id LIMIT %s', (args.scenes,))
+        ids = [row['id'] for row in db]
+    if not ids:
+        raise SystemExit('no scenes to save')
+
+    scenes = Scene.find(ids)
+
+    start = time.time()
+    for s in scenes:
+        note = s.note
+        s.note = (note or '') + ' bench'
+        legacy_save(s)
+        s.note = note
+        legacy_save(s)
+    legacy_time = time.time() - start
+
+    scenes = Scene.find(ids)
+
+    start = time.time()
+    for s in scenes:
+        note = s.note
+        s.note = (note or '') + ' bench'
+        s.save()
+        s.note = note
+        s.save()
+    dirty_time = time.time() - start
+
+    saves = 2 * len(scenes)
+    print '{0} saves'.format(saves)
+    print 'all columns + re-read: {0:.2f}s, {1:.1f}ms/save'.format(
+        legacy_time, 1000 * legacy_time / saves)
+    print 'changed + RETURNING:   {0:.2f}s, {1:.1f}ms/save ({2:.1f}x)'.format(
+        dirty_time, 1000 * dirty_time / saves, legacy_time / dirty_time)
+
+
+if __name__ == '__main__':
+    main()
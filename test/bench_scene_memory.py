@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+Memory and build time for materialising a large number of Scene objects,
+as slot backed Scene against the plain __dict__ objects Scene used to be
+
+Rows are made up, nothing is read from the database.  Each variant is
+built in its own forked process so one doesn't skew the other's size
+
+    python -m test.bench_scene_memory --scenes 1000000
+"""
+import argparse
+import datetime
+import os
+import time
+
+from api.domain.scene import Scene
+
+
+class DictScene(object):
+    # Scene as it was, every column in the instance __dict__, plus the
+    # saved values kept alongside to find what changed
+    def __init__(self, **row):
+        self.__dict__.update(row)
+        self._saved = dict((c, row[c]) for c in Scene.save_columns)
+
+
+def rss():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def rows(count):
+    now = datetime.datetime.now()
+    for i in xrange(1, count + 1):
+        row = dict((c, None) for c in Scene.columns)
+        row.update({'id': i, 'name': 'LC8{0:013d}LGN00'.format(i), 'order_id': i // 1000 + 1,
+                    'status': 'queued', 'sensor_type': 'landsat', 'note': '',
+                    'completion_date': now, 'retry_count': 0, 'retry_limit': 5})
+        yield row
+
+
+def measure(build, count):
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        before = rss()
+        start = time.time()
+        held = [build(row) for row in rows(count)]
+        took = time.time() - start
+        os.write(write, '{0} {1}'.format(rss() - before, took))
+        os._exit(0 if held else 1)
+
+    os.close(write)
+    grown, took = os.read(read, 100).split()
+    os.waitpid(pid, 0)
+    return int(grown), float(took)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenes', type=int, default=1000000)
+    args = parser.parse_args()
+
+    print '{0} scenes'.format(args.scenes)
+    for label, build in (('__dict__', lambda row: DictScene(**row)),
+                         ('__slots__', lambda row: Scene(**row))):
+        grown, took = measure(build, args.scenes)
+        print '{0:10} {1:8.1f}MB {2:5.0f} bytes/scene {3:6.2f}s'.format(
+            label, grown / 1e6, float(grown) / args.scenes, took)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+import threading
+import time
+import unittest
+
+import memcache
+from mock import patch, MagicMock
+
+from api.providers.caching.caching_provider import (CachingProvider, ConsistentHashClient,
+                                                   HashRing, LocalCache)
+from api.providers.caching import lease
+
+
+class TestLocalCache(unittest.TestCase):
+    def test_lru_eviction(self):
+        local = LocalCache(max_size=2, ttl=60)
+        local.set('a', 1)
+        local.set('b', 2)
+        local.get('a')
+        local.set('c', 3)
+
+        self.assertEqual(local.get('a'), (True, 1))
+        self.assertEqual(local.get('b'), (False, None))
+        self.assertEqual(local.statistics()['evictions'], 1)
+
+    def test_expiry(self):
+        local = LocalCache(max_size=2, ttl=60)
+        local.set('a', 1, ttl=0)
+
+        self.assertEqual(local.get('a'), (False, None))
+        self.assertEqual(local.statistics()['expirations'], 1)
+
+
+class TestHashRing(unittest.TestCase):
+    def test_few_keys_move(self):
+        keys = ['key{0}'.format(i) for i in range(2000)]
+        before = HashRing(['a', 'b', 'c'])
+        after = HashRing(['a', 'b', 'c', 'd'])
+
+        moved = [k for k in keys if before.node(k) != after.node(k)]
+
+        self.assertTrue(all(after.node(k) == 'd' for k in moved))
+        self.assertLess(len(moved), len(keys) / 2)
+
+    def test_client_few_keys_move(self):
+        keys = ['key{0}'.format(i) for i in range(2000)]
+        servers = ['10.0.0.1:11211', '10.0.0.3:11211', '10.0.0.4:11211']
+        # sorted in among the others, as memcache_client orders them
+        added = sorted(servers + ['10.0.0.2:11211'])
+
+        def owners(client):
+            with patch.object(memcache._Host, 'connect', return_value=1):
+                return dict((k, client._get_server(k)[0].address) for k in keys)
+
+        before = owners(ConsistentHashClient(servers))
+        after = owners(ConsistentHashClient(added))
+
+        moved = [k for k in keys if before[k] != after[k]]
+        self.assertTrue(all(after[k] == ('10.0.0.2', 11211) for k in moved))
+        self.assertLess(len(moved), len(keys) * 0.35)
+
+    def test_failover(self):
+        client = ConsistentHashClient(['127.0.0.1:11211', '127.0.0.1:11212'])
+        owner = client.hosts[client.ring.node('prod_whitelist')]
+        other = [s for s in client.servers if s is not owner][0]
+
+        with patch.object(owner, 'connect', return_value=0), \
+                patch.object(other, 'connect', return_value=1):
+            server, key = client._get_server('prod_whitelist')
+
+        self.assertIs(server, other)
+        self.assertEqual(key, 'prod_whitelist')
+
+
+class TestCachingProvider(unittest.TestCase):
+    def setUp(self):
+        patcher = patch('api.providers.caching.caching_provider.memcache_client')
+        self.client = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+
+        with patch('api.providers.caching.caching_provider.api_cfg', return_value={}):
+            self.cache = CachingProvider(local_size=10, local_ttl=60)
+
+    def test_local_tier(self):
+        self.client.get.return_value = (['127.0.0.1'], time.time() + 60, 0)
+        self.cache.get('prod_whitelist')
+        self.cache.get('prod_whitelist')
+
+        self.assertEqual(self.client.get.call_count, 1)
+        self.assertEqual(self.cache.statistics()['hits'], 1)
+
+    def test_local_tier_expiry(self):
+        # a plain item's memcache expiry is unknown, it isn't kept
+        self.client.get.return_value = {'password': 'secret'}
+        self.cache.get('alice-credentials')
+        self.cache.get('alice-credentials')
+        self.assertEqual(self.client.get.call_count, 2)
+
+        # a computed one is kept only until it stops being fresh
+        self.client.get.return_value = (['127.0.0.1'], time.time() + 0.2, 0)
+        self.cache.get('prod_whitelist')
+        time.sleep(0.3)
+        self.cache.get('prod_whitelist')
+        self.assertEqual(self.client.get.call_count, 4)
+
+    def test_get_multi(self):
+        self.cache.set('a', 1)
+        self.client.get_multi.return_value = {'b': 2}
+
+        self.assertEqual(self.cache.get_multi(['a', 'b', 'c']), {'a': 1, 'b': 2})
+        self.client.get_multi.assert_called_once_with(['b', 'c'])
+
+
+class TestGetOrCompute(unittest.TestCase):
+    def setUp(self):
+        patcher = patch('api.providers.caching.caching_provider.memcache_client')
+        self.client = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+
+        store = {}
+        self.client.get.side_effect = store.get
+        self.client.set.side_effect = lambda k, v, t=0: store.__setitem__(k, v) or True
+        self.client.add.side_effect = lambda k, v, t=0: store.setdefault(k, v) is v
+        self.client.delete.side_effect = lambda k: store.pop(k, None) is not None
+        self.store = store
+
+        with patch('api.providers.caching.caching_provider.api_cfg', return_value={}):
+            self.cache = CachingProvider(local_size=0)
+
+        self.compute = MagicMock(return_value=['127.0.0.1'])
+
+    def test_computed_once(self):
+        self.cache.get_or_compute('prod_whitelist', self.compute, 60)
+        value = self.cache.get_or_compute('prod_whitelist', self.compute, 60)
+
+        self.assertEqual(value, ['127.0.0.1'])
+        self.assertEqual(self.compute.call_count, 1)
+        self.assertNotIn('prod_whitelist.lease', self.store)
+
+    def test_stale_served_while_leased(self):
+        self.store['prod_whitelist'] = (['10.0.0.1'], time.time() - 1, 0)
+        self.store['prod_whitelist.lease'] = 'another worker'
+
+        value = self.cache.get_or_compute('prod_whitelist', self.compute, 60)
+
+        self.assertEqual(value, ['10.0.0.1'])
+        self.assertFalse(self.compute.called)
+
+    def test_expired_recomputed(self):
+        self.store['prod_whitelist'] = (['10.0.0.1'], time.time() - 1, 0)
+
+        value = self.cache.get_or_compute('prod_whitelist', self.compute, 60)
+
+        self.assertEqual(value, ['127.0.0.1'])
+        self.assertEqual(self.store['prod_whitelist'][0], ['127.0.0.1'])
+
+
+    def test_waits_on_live_lease(self):
+        self.store['prod_whitelist.lease'] = 'another worker'
+        timer = threading.Timer(0.2, self.store.__setitem__,
+                                ['prod_whitelist', (['10.0.0.1'], time.time() + 60, 0)])
+        timer.start()
+
+        value = self.cache.get_or_compute('prod_whitelist', self.compute, 60, wait=5)
+
+        self.assertEqual(value, ['10.0.0.1'])
+        self.assertFalse(self.compute.called)
+
+    def test_memcache_down_computes_at_once(self):
+        self.client.add.side_effect = None
+        self.client.add.return_value = 0
+        self.client.get.side_effect = None
+        self.client.get.return_value = None
+
+        start = time.time()
+        value = self.cache.get_or_compute('prod_whitelist', self.compute, 60, wait=5)
+
+        self.assertEqual(value, ['127.0.0.1'])
+        self.assertLess(time.time() - start, 1)
+
+
+class TestLease(unittest.TestCase):
+    def setUp(self):
+        patcher = patch('api.providers.caching.lease.memcache_client')
+        self.client = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+
+        store = {}
+        self.client.get.side_effect = store.get
+        self.client.gets.side_effect = store.get
+        self.client.cas.side_effect = lambda k, v, t=0: store.__setitem__(k, v) or True
+        self.client.add.side_effect = lambda k, v, t=0: store.setdefault(k, v) is v
+        self.client.delete.side_effect = lambda k: store.pop(k, None) is not None
+        def incr(key):
+            if key in store:
+                store[key] += 1
+                return store[key]
+
+        self.client.incr.side_effect = incr
+        self.client.get_multi.side_effect = lambda keys: dict((k, store[k]) for k in keys if k in store)
+        self.store = store
+
+    def test_exclusive(self):
+        first = lease.Lease('pipeline.finalize-orders')
+        second = lease.Lease('pipeline.finalize-orders')
+
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire())
+        self.assertEqual(second.holder(), first.owner)
+
+        first.release()
+        self.assertTrue(second.acquire())
+        second.release()
+        self.assertNotIn(first.key, self.store)
+
+        stats = lease.statistics(['pipeline.finalize-orders'])['pipeline.finalize-orders']
+        self.assertEqual((stats['acquired'], stats['skipped'], stats['released']), (2, 1, 2))
+
+    def test_release_leaves_other_owners_lease(self):
+        held = lease.Lease('pipeline.purge-orders')
+        self.assertTrue(held.acquire())
+        # expired and taken by someone else
+        self.store[held.key] = 'another worker'
+
+        self.assertFalse(held.release())
+        self.assertEqual(self.store[held.key], 'another worker')
+
+    def test_renewal_notices_loss(self):
+        held = lease.Lease('pipeline.purge-orders')
+        self.assertTrue(held.acquire())
+        self.assertTrue(held.renew())
+
+        self.store[held.key] = 'another worker'
+        self.assertFalse(held.renew())
+        self.assertTrue(held.lost)
+        held.release()
+
+    def test_wait(self):
+        first = lease.Lease('pipeline.submitted-modis')
+        self.assertTrue(first.acquire())
+        timer = threading.Timer(0.2, first.release)
+        timer.start()
+
+        second = lease.Lease('pipeline.submitted-modis')
+        self.assertTrue(second.acquire(wait=2))
+        second.release()
+
+        stats = lease.statistics(['pipeline.submitted-modis'])['pipeline.submitted-modis']
+        self.assertEqual(stats['waited'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+import unittest
+
+import psycopg2.extensions
+from mock import patch, MagicMock
+
+from api.util import dbconnect
+from api.util.dbconnect import ConnectionPool, DBConnect, DBConnectException
+
+
+def mock_connection(*args, **kwargs):
+    conn = MagicMock()
+    conn.closed = 0
+    conn.get_transaction_status.return_value = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    return conn
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        patcher = patch('psycopg2.connect', side_effect=mock_connection)
+        self.connect = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.pool = ConnectionPool('localhost', 'espa', 'espa', 'pass', 5432,
+                                   minconn=1, maxconn=2, wait_timeout=0.1)
+
+    def test_connection_reused(self):
+        conn = self.pool.getconn()
+        self.pool.putconn(conn)
+
+        self.assertIs(conn, self.pool.getconn())
+        self.assertEqual(self.connect.call_count, 1)
+
+    def test_pool_exhausted(self):
+        self.pool.getconn()
+        self.pool.getconn()
+
+        with self.assertRaises(DBConnectException):
+            self.pool.getconn()
+
+        self.assertEqual(self.pool.statistics()['waits'], 1)
+
+    def test_broken_connection_discarded(self):
+        conn = self.pool.getconn()
+        conn.closed = 1
+        self.pool.putconn(conn)
+
+        self.assertIsNot(conn, self.pool.getconn())
+
+    def test_rebuilt_after_fork(self):
+        self.addCleanup(setattr, dbconnect, '_pool', None)
+
+        with patch('api.util.dbconnect.api_cfg') as cfg, \
+                patch('api.util.dbconnect.get_cfg', return_value={}):
+            cfg.return_value = {'dbhost': 'localhost', 'db': 'espa',
+                                'dbuser': 'espa', 'dbpass': 'pass',
+                                'dbport': 5432}
+            parent = dbconnect.connection_pool()
+            [(inherited, _)] = parent._idle
+            inherited.fileno.return_value = 99
+
+            with patch('os.getpid', return_value=parent.pid + 1), \
+                    patch('os.dup2') as dup2:
+                child = dbconnect.connection_pool()
+
+        self.assertIsNot(parent, child)
+        # the parent's socket is swapped out before the connection closes
+        self.assertEqual(dup2.call_args[0][1], 99)
+        self.assertTrue(inherited.close.called)
+        self.assertEqual(parent._idle, [])
+
+    def test_released_when_cursor_close_fails(self):
+        db = DBConnect('localhost', 'espa', 'espa', 'pass', 5432, pool=self.pool)
+        conn = db.conn
+        db.cursor.close.side_effect = psycopg2.InterfaceError('cursor already closed')
+
+        with self.assertRaises(DBConnectException):
+            with db:
+                pass
+
+        self.assertIs(conn, self.pool.getconn())
+
+
+class TestDBConnectSelect(unittest.TestCase):
+    def setUp(self):
+        patcher = patch('psycopg2.connect', side_effect=mock_connection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.db = DBConnect('localhost', 'espa', 'espa', 'pass', 5432)
+        self.rows = [(1, 'LE70290302003142EDC00'), (2, 'LT50290302002123EDC00')]
+        self.description = (('id',), ('name',))
+
+    def test_dictfetchall_lazy(self):
+        self.db.cursor.description = self.description
+        self.db.cursor.fetchall.return_value = self.rows
+        self.db.select('select id, name from ordering_scene')
+
+        self.assertIsNone(self.db._dictfetchall)
+        self.assertEqual(self.db.dictfetchall[1]['name'], 'LT50290302002123EDC00')
+
+    def test_select_stream(self):
+        named = MagicMock()
+        named.closed = False
+        named.description = self.description
+        named.__iter__.return_value = iter(self.rows)
+        self.db.conn.cursor.return_value = named
+
+        self.db.select('select id, name from ordering_scene', stream=True, itersize=1)
+
+        self.assertEqual(named.itersize, 1)
+        self.assertEqual([r['id'] for r in self.db.dictfetchall], [1, 2])
+        self.assertFalse(self.db.cursor.fetchall.called)
+
+        self.db._release()
+        self.assertTrue(named.close.called)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
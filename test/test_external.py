@@ -1,10 +1,17 @@
+import socket
+import threading
+import time
 import unittest
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
 from mock import patch
 
 from api.external.nlaps import products_are_nlaps
 from api.external import onlinecache
 from api.external.mocks import onlinecache as mockonlinecache
+from api.external import lpdaac
 from api.external import lta
+from api.external import sessions
+from api.external import circuit
 from api.external.mocks import lta as mocklta
 from api.external.hadoop import HadoopHandler
 
@@ -29,6 +36,187 @@ class TestLTA(unittest.TestCase):
         #print resp
 
 
+class TestSoapClientPool(unittest.TestCase):
+    class Service(object):
+        service_name = 'orderupdate'
+
+    def setUp(self):
+        patcher = patch('api.external.lta.config')
+        config = patcher.start()
+        self.addCleanup(patcher.stop)
+        config.url_for.return_value = 'http://localhost/orderupdate?wsdl'
+        config.get.return_value = 3600
+
+        patcher = patch('api.external.circuit.breaker')
+        breaker = patcher.start()
+        self.addCleanup(patcher.stop)
+        breaker.return_value = circuit.CircuitBreaker('lta')
+
+        self.pool = lta.SoapClientPool()
+
+    def test_client_reused(self):
+        with self.pool.client(self.Service) as first:
+            pass
+        with self.pool.client(self.Service) as second:
+            pass
+
+        self.assertIs(first, second)
+        self.assertEqual(self.pool.statistics()['built'], 1)
+        self.assertEqual(self.pool.statistics()['calls'], 2)
+
+    def test_client_discarded_on_error(self):
+        with self.assertRaises(socket.error):
+            with self.pool.client(self.Service) as first:
+                raise socket.error('connection reset by peer')
+
+        with self.pool.client(self.Service) as second:
+            pass
+
+        self.assertIsNot(first, second)
+        self.assertEqual(self.pool.statistics()['discarded'], 1)
+
+    def test_client_kept_after_fault(self):
+        with self.assertRaises(ValueError):
+            with self.pool.client(self.Service) as first:
+                raise ValueError('service fault')
+
+        with self.pool.client(self.Service) as second:
+            pass
+
+        self.assertIs(first, second)
+        self.assertEqual(self.pool.statistics()['discarded'], 0)
+
+    def test_fault_not_counted_against_circuit(self):
+        for _ in range(10):
+            with self.assertRaises(ValueError):
+                with self.pool.client(self.Service):
+                    raise ValueError('invalid username or password')
+
+        breaker = circuit.breaker('lta')
+        self.assertFalse(breaker.is_open())
+        self.assertEqual(breaker.statistics()['failures'], 0)
+
+    def test_concurrent_callers_get_own_client(self):
+        with self.pool.client(self.Service) as first:
+            with self.pool.client(self.Service) as second:
+                self.assertIsNot(first, second)
+
+
+class TestSessions(unittest.TestCase):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_HEAD(self):
+            self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), self.Handler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.shutdown)
+
+        patcher = patch('api.external.sessions.config')
+        config = patcher.start()
+        self.addCleanup(patcher.stop)
+        config.get.return_value = (None, None, None, None)
+
+    def test_connection_reused(self):
+        session = sessions.build_session()
+        url = 'http://127.0.0.1:{0}/MOD09A1.A2000073.h12v11.005'.format(self.server.server_port)
+
+        self.assertTrue(session.head(url).ok)
+        self.assertTrue(session.head(url).ok)
+
+        stats = session.get_adapter(url).statistics()['127.0.0.1:{0}'.format(self.server.server_port)]
+        self.assertEqual(stats['requests'], 2)
+        self.assertEqual(stats['connections'], 1)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.breaker = circuit.CircuitBreaker('lta', window=4, min_calls=4,
+                                              failure_rate=0.5, reset_timeout=0.1)
+
+    def call(self, fail=False):
+        with self.breaker.call():
+            if fail:
+                raise IOError('service unavailable')
+
+    def test_opens_on_failure_rate(self):
+        self.call()
+        self.call()
+        self.assertRaises(IOError, self.call, True)
+        self.assertFalse(self.breaker.is_open())
+        self.assertRaises(IOError, self.call, True)
+
+        self.assertTrue(self.breaker.is_open())
+        self.assertRaises(circuit.CircuitOpenException, self.call)
+        self.assertEqual(self.breaker.statistics()['rejected'], 1)
+
+    def test_half_open_probe(self):
+        for _ in range(4):
+            self.assertRaises(IOError, self.call, True)
+        time.sleep(0.15)
+
+        # the probe fails, so the circuit opens again
+        self.assertFalse(self.breaker.is_open())
+        self.assertRaises(IOError, self.call, True)
+        self.assertTrue(self.breaker.is_open())
+
+        time.sleep(0.15)
+        self.call()
+        self.assertEqual(self.breaker.state, circuit.CircuitBreaker.CLOSED)
+
+    def test_failure_test(self):
+        def transport(e):
+            return isinstance(e, IOError)
+
+        for _ in range(4):
+            with self.assertRaises(ValueError):
+                with self.breaker.call(failure=transport):
+                    raise ValueError('fault')
+
+        self.assertFalse(self.breaker.is_open())
+        self.assertEqual(self.breaker.statistics()['failures'], 0)
+
+    def test_one_probe_at_a_time(self):
+        for _ in range(4):
+            self.assertRaises(IOError, self.call, True)
+        time.sleep(0.15)
+
+        with self.breaker.call():
+            self.assertRaises(circuit.CircuitOpenException, self.call)
+
+
+class TestLPDAAC(unittest.TestCase):
+    def setUp(self):
+        patcher = patch('api.external.lpdaac.config')
+        config = patcher.start()
+        self.addCleanup(patcher.stop)
+        config.get.return_value = (None, None)
+
+    def test_verify_products_keyed_by_product_id(self):
+        products = ['MOD09A1.A2000073.h12v11.005.2008238080250',
+                    'MOD09A1.A2000073.h12v12.005.2008238080250']
+        checked = []
+
+        def input_exists(product):
+            checked.append(product)
+            return product.product_id == products[0]
+
+        with patch.object(lpdaac.LPDAACService, 'input_exists', side_effect=input_exists):
+            response = lpdaac.LPDAACService().verify_products(products)
+
+        self.assertTrue(all(not isinstance(p, basestring) for p in checked))
+        self.assertEqual(response, {products[0]: True, products[1]: False})
+
+
 class TestNLAPS(unittest.TestCase):
     """
     Provide testing for sorting out NLAPS products
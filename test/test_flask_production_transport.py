@@ -164,6 +164,37 @@ class ProductionTransportTestCase(unittest.TestCase):
         response_data = json.loads(response.get_data())
         assert response_data == data_dict
 
+    @patch('api.providers.production.production_provider.ProductionProvider.claim_products',
+           production_provider.claim_products_inputs)
+    @patch('api.interfaces.production.version1.API.get_production_whitelist', api.get_production_whitelist)
+    def test_post_production_api_claim_products(self):
+        url = "/production-api/v1/claim-products"
+        data_dict = {'processing_location': 'processing_location',
+                     'job_name': 'job_name',
+                     'record_limit': 10}
+        response = self.app.post(url, data=json.dumps(data_dict), environ_base={'REMOTE_ADDR': '127.0.0.1'})
+        response_data = json.loads(response.get_data())
+        assert response_data['job_name'] == 'job_name'
+        assert response_data['record_limit'] == 10
+
+    @patch('api.providers.production.production_provider.ProductionProvider.run_stage',
+           production_provider.run_stage_inputs)
+    @patch('api.interfaces.production.version1.API.get_production_whitelist', api.get_production_whitelist)
+    def test_post_production_api_run_stage(self):
+        url = "/production-api/v1/pipeline/submitted-modis"
+        response = self.app.post(url, data=json.dumps({}), environ_base={'REMOTE_ADDR': '127.0.0.1'})
+        response_data = json.loads(response.get_data())
+        assert response_data == {'result': 'ok', 'name': 'submitted-modis'}
+
+    @patch('api.providers.production.production_provider.ProductionProvider.pipeline_status',
+           production_provider.pipeline_status)
+    @patch('api.interfaces.production.version1.API.get_production_whitelist', api.get_production_whitelist)
+    def test_get_production_api_pipeline_stage(self):
+        url = "/production-api/v1/pipeline/submitted-modis"
+        response = self.app.get(url, environ_base={'REMOTE_ADDR': '127.0.0.1'})
+        response_data = json.loads(response.get_data())
+        assert [s['name'] for s in response_data] == ['submitted-modis']
+
     @patch('api.interfaces.production.version1.API.get_production_whitelist', api.get_production_whitelist)
     def test_get_production_api_configurations(self):
         url = "/production-api/v1/configuration/system_message_title"
@@ -3,17 +3,25 @@ import datetime
 import unittest
 
 import os
+import pickle
+import time
+import zlib
+from api.domain import identity
 from api.domain.mocks.order import MockOrder
 from api.domain.mocks.user import MockUser
 from api.domain.order import Order
 from api.domain.scene import Scene
+from api.domain.scene_log import SceneLog
+from api.domain.tram_poll import TramPoll
 from api.domain.user import User
 from api.external.mocks import lta, lpdaac, onlinecache, nlaps, hadoop
 from api.interfaces.production.version1 import API
 from api.notification import emails
 from api.providers.production.mocks.production_provider import MockProductionProvider
+from api.providers.production import pipeline
 from api.providers.production.production_provider import ProductionProvider
 from api.system.mocks import errors
+from api.util.dbconnect import db_instance
 from mock import patch
 
 api = API()
@@ -34,6 +42,10 @@ class TestProductionAPI(unittest.TestCase):
         self.mock_order.tear_down_testing_orders()
         # clean up users
         self.mock_user.cleanup()
+        # clean up the tram poll schedule
+        with db_instance() as db:
+            db.execute('DELETE FROM ordering_tram_poll')
+            db.commit()
         os.environ['espa_api_testing'] = ''
 
     @patch('api.external.lpdaac.get_download_urls', lpdaac.get_download_urls)
@@ -60,6 +72,81 @@ class TestProductionAPI(unittest.TestCase):
         response = api.fetch_production_products(params)
         self.assertTrue('bilbo' in response[0]['orderid'])
 
+    @patch('api.providers.production.production_provider.ProductionProvider.set_product_retry',
+           mock_production_provider.set_product_retry)
+    def test_fetch_production_products_cached_urls(self):
+        order_id = self.mock_order.generate_testing_order(self.user_id)
+        self.mock_order.update_scenes(order_id, 'status', ['oncache'])
+        user = User.find(self.user_id)
+        params = {'for_user': user.username, 'product_types': ['landsat']}
+
+        with patch('api.external.lta.get_download_urls', side_effect=lta.get_download_urls) as urls:
+            first = api.fetch_production_products(params)
+            second = api.fetch_production_products(params)
+
+        self.assertEqual(urls.call_count, 1)
+        self.assertEqual(sorted(r['scene'] for r in first), sorted(r['scene'] for r in second))
+
+        names = [r['scene'] for r in first]
+        production_provider.evict_download_urls(names, user.contactid)
+        self.assertEqual(production_provider.cached_download_urls(names, user.contactid), {})
+
+    @patch('api.providers.production.production_provider.ProductionProvider.set_product_retry',
+           mock_production_provider.set_product_retry)
+    def test_prefetch_download_urls(self):
+        order_id = self.mock_order.generate_testing_order(self.user_id)
+        self.mock_order.update_scenes(order_id, 'status', ['oncache'])
+        user = User.find(self.user_id)
+        params = {'for_user': user.username, 'product_types': ['landsat']}
+
+        with patch('api.external.lta.get_download_urls', side_effect=lta.get_download_urls) as urls:
+            self.assertTrue(production_provider.prefetch_download_urls())
+            prefetched = urls.call_count
+            response = api.fetch_production_products(params)
+
+        self.assertTrue(prefetched > 0)
+        self.assertEqual(urls.call_count, prefetched)
+        self.assertTrue('bilbo' in response[0]['orderid'])
+
+    @patch('api.providers.production.production_provider.url_cache')
+    def test_download_url_ttl_capped_at_expiry(self, url_cache):
+        expires = int(time.time()) + 600
+        urls = {'LC80380292014211LGN00': {'status': 'available',
+                                          'download_url': 'http://one_time_use.tar.gz?Expires={0}'
+                                                          .format(expires)},
+                'LC80380292014212LGN00': {'status': 'available',
+                                          'download_url': 'http://one_time_use.tar.gz?Expires={0}'
+                                                          .format(expires - 590)},
+                'LC80380292014213LGN00': {'status': 'unavailable'}}
+
+        production_provider.cache_download_urls(urls, 'contact1')
+
+        [((mapping, ttl), _)] = url_cache.set_multi.call_args_list
+        self.assertEqual(mapping.keys(), ['dload_url-contact1-LC80380292014211LGN00'])
+        self.assertTrue(530 <= ttl <= 540)
+
+    @patch('api.external.lta.get_download_urls', lta.get_download_urls)
+    @patch('api.providers.production.production_provider.ProductionProvider.set_product_retry',
+           mock_production_provider.set_product_retry)
+    def test_claim_production_products(self):
+        order_id = self.mock_order.generate_testing_order(self.user_id)
+        self.mock_order.update_scenes(order_id, 'status', ['oncache'])
+        user = User.find(self.user_id)
+        params = {'for_user': user.username, 'product_types': ['landsat']}
+        SceneLog.store(dict((s.id, 'last run') for s in Order.find(order_id).scenes()))
+        response = api.claim_products('dispatcher1', 'jobname49', **params)
+        self.assertTrue('bilbo' in response[0]['orderid'])
+
+        claimed = Scene.where({'order_id': Order.find(order_id).id,
+                               'name': tuple(r['scene'] for r in response)})
+        self.assertTrue(all(s.status == 'queued' for s in claimed))
+        self.assertTrue(all(s.job_name == 'jobname49' for s in claimed))
+        self.assertEqual(set(SceneLog.read([s.id for s in claimed]).values()), set(['']))
+
+        # a second dispatcher gets nothing already claimed
+        again = api.claim_products('dispatcher2', 'jobname50', **params)
+        self.assertFalse(set(r['scene'] for r in again) & set(r['scene'] for r in response))
+
     def test_fetch_production_products_plot(self):
         order_id = self.mock_order.generate_testing_order(self.user_id)
         self.mock_order.update_scenes(order_id, 'status', ['complete'])
@@ -209,7 +296,15 @@ class TestProductionAPI(unittest.TestCase):
            mock_production_provider.respond_true)
     @patch('api.providers.production.production_provider.ProductionProvider.load_ee_orders',
            mock_production_provider.respond_true)
-    @patch('api.providers.production.production_provider.ProductionProvider.handle_submitted_products',
+    @patch('api.providers.production.production_provider.ProductionProvider.handle_failed_ee_updates',
+           mock_production_provider.respond_true)
+    @patch('api.providers.production.production_provider.ProductionProvider.handle_submitted_landsat_products',
+           mock_production_provider.respond_true)
+    @patch('api.providers.production.production_provider.ProductionProvider.handle_submitted_modis_products',
+           mock_production_provider.respond_true)
+    @patch('api.providers.production.production_provider.ProductionProvider.handle_submitted_plot_products',
+           mock_production_provider.respond_true)
+    @patch('api.providers.production.production_provider.ProductionProvider.prefetch_download_urls',
            mock_production_provider.respond_true)
     @patch('api.providers.production.production_provider.ProductionProvider.finalize_orders',
            mock_production_provider.respond_true)
@@ -251,6 +346,55 @@ class TestProductionAPI(unittest.TestCase):
             scene.update('name', scene_names[idx])
             scene.save()
         self.assertTrue(production_provider.handle_onorder_landsat_products())
+        statuses = [Scene.find(s.id).status for s in scenes]
+        self.assertEqual(statuses, ['unavailable', 'oncache', 'unavailable'])
+
+    @patch('api.external.lta.get_order_status', lta.get_order_status_fail)
+    def test_production_handle_onorder_landsat_products_poll_fails(self):
+        tram_order_ids = lta.sample_tram_order_ids()[0:3]
+        order = Order.find(self.mock_order.generate_testing_order(self.user_id))
+        scenes = order.scenes()[0:3]
+        for idx, scene in enumerate(scenes):
+            scene.tram_order_id = tram_order_ids[idx]
+            scene.status = 'onorder'
+            scene.save()
+        self.assertTrue(production_provider.handle_onorder_landsat_products())
+        for s in scenes:
+            self.assertEqual(Scene.find(s.id).status, 'onorder')
+
+    def test_production_handle_onorder_landsat_products_schedule(self):
+        tram_order_id = lta.sample_tram_order_ids()[0]
+        order = Order.find(self.mock_order.generate_testing_order(self.user_id))
+        scene = order.scenes()[0]
+        scene.tram_order_id = tram_order_id
+        scene.status = 'onorder'
+        scene.save()
+
+        polled = []
+
+        def get_order_status(tid):
+            polled.append(tid)
+            return {'units': [{'sceneid': scene.name, 'unit_status': 'Q'}]}
+
+        with patch('api.external.lta.get_order_status', get_order_status):
+            production_provider.handle_onorder_landsat_products()
+            # not due again until the poll interval has passed
+            production_provider.handle_onorder_landsat_products()
+        self.assertEqual(polled, [tram_order_id])
+
+        later = datetime.datetime.now() + datetime.timedelta(hours=1)
+        [poll] = TramPoll.due({tram_order_id: 1}, now=later)
+        self.assertEqual(poll.polls, 1)
+        self.assertEqual(poll.quiet_polls, 1)
+
+    def test_tram_poll_interval(self):
+        # backs off with each quiet poll
+        self.assertEqual(TramPoll.interval(0, 0), 300)
+        self.assertEqual(TramPoll.interval(0, 3), 2400)
+        # old orders wait at least a share of their age
+        self.assertEqual(TramPoll.interval(86400, 0), 8640)
+        # never more than the ceiling
+        self.assertEqual(TramPoll.interval(0, 20), 21600)
 
     def test_production_handle_retry_products(self):
         prev = datetime.datetime.now() - datetime.timedelta(hours=1)
@@ -330,6 +474,112 @@ class TestProductionAPI(unittest.TestCase):
         order = Order.find(self.mock_order.generate_testing_order(self.user_id))
         self.assertTrue(production_provider.set_products_unavailable(order.scenes(), "you want a reason?"))
 
+    def test_production_save_writes_changed_columns(self):
+        order = Order.find(self.mock_order.generate_testing_order(self.user_id))
+        scene = order.scenes()[0]
+        self.assertEqual(scene.changed(), [])
+
+        scene.status = 'queued'
+        scene.note = 'saved'
+        self.assertEqual(sorted(scene.changed()), ['note', 'status'])
+        scene.save()
+        self.assertEqual(scene.changed(), [])
+        self.assertEqual(Scene.find(scene.id).note, 'saved')
+
+        # nothing changed, nothing to write
+        with patch('api.domain.scene.db_instance') as db:
+            scene.save()
+            self.assertFalse(db.called)
+
+        order.note = 'saved'
+        order.product_opts['note'] = 'edited in place'
+        self.assertEqual(sorted(order.changed()), ['note', 'product_opts'])
+        order.save()
+        self.assertEqual(order.changed(), [])
+        self.assertEqual(Order.find(order.id).product_opts['note'], 'edited in place')
+
+    def test_production_scene_slots(self):
+        order = Order.find(self.mock_order.generate_testing_order(self.user_id))
+        scene = order.scenes()[0]
+        self.assertFalse(hasattr(scene, '__dict__'))
+        with self.assertRaises(AttributeError):
+            scene.not_a_column = 1
+
+        scene.note = 'pickled'
+        copied = pickle.loads(pickle.dumps(scene))
+        self.assertEqual(copied.as_dict(), scene.as_dict())
+        self.assertEqual(copied.changed(), ['note'])
+
+    def test_production_scene_columns(self):
+        order = Order.find(self.mock_order.generate_testing_order(self.user_id))
+        scene = order.scenes()[0]
+        scene.update('log_file_contents', 'a long log')
+
+        # log_file_contents is left out unless asked for
+        scene = Scene.find(scene.id)
+        self.assertFalse(scene.loaded('log_file_contents'))
+        self.assertEqual(scene.log_file_contents, 'a long log')
+
+        scene = order.scenes({'id': scene.id}, ['status'])[0]
+        self.assertEqual(sorted(scene.as_dict()), ['id', 'status'])
+        self.assertEqual(scene.name, Scene.find(scene.id).name)
+        self.assertFalse(scene.loaded('log_file_contents'))
+        self.assertEqual(scene.changed(), [])
+
+    def test_production_scene_log_round_trip(self):
+        order = Order.find(self.mock_order.generate_testing_order(self.user_id))
+        scene = order.scenes()[0]
+
+        scene.log_file_contents = 'processing log ' * 1000
+        scene.save()
+        self.assertEqual(SceneLog.get(scene.id), 'processing log ' * 1000)
+        self.assertEqual(Scene.find(scene.id).log_file_contents, 'processing log ' * 1000)
+
+        with db_instance() as db:
+            db.select('select size, length(log) stored from ordering_scene_log '
+                      'where scene_id = %s', (scene.id,))
+            self.assertEqual(db[0]['size'], 15000)
+            self.assertTrue(db[0]['stored'] < 1000)
+
+        Scene.bulk_update([scene.id], {'log_file_contents': ''})
+        self.assertEqual(SceneLog.get(scene.id), '')
+
+    def test_production_prefetch_orders(self):
+        order = Order.find(self.mock_order.generate_testing_order(self.user_id))
+        with identity.session():
+            scenes = Scene.where({'order_id': order.id})
+            orders = Scene.prefetch_orders(scenes)
+            self.assertEqual(orders.keys(), [order.id])
+
+            # the prefetched order answers, with no further query
+            with patch('api.domain.scene.db_instance') as db:
+                for s in scenes:
+                    self.assertEqual(s.order_attr('ee_order_id'), order.ee_order_id)
+                    self.assertEqual(s.order_attr('user_id'), order.user_id)
+                self.assertFalse(db.called)
+
+            # and is the one object for its row for the whole session
+            self.assertIs(Order.find(order.id), orders[order.id])
+            self.assertIs(Scene.find(scenes[0].id), scenes[0])
+            self.assertIs(Scene.where({'id': scenes[0].id})[0], scenes[0])
+
+        self.assertIsNot(Order.find(order.id), orders[order.id])
+
+    def test_production_session_refreshed(self):
+        order = Order.find(self.mock_order.generate_testing_order(self.user_id))
+        with identity.session():
+            first, second = Scene.where({'order_id': order.id})[:2]
+
+            # a bulk update is seen by the next find
+            Scene.bulk_update([first.id], {'note': 'bulk updated'})
+            self.assertEqual(Scene.find(first.id).note, 'bulk updated')
+
+            # reloading the row doesn't lose changes not yet saved
+            second.note = 'not saved yet'
+            Scene.where({'id': second.id})
+            self.assertEqual(second.note, 'not saved yet')
+            self.assertEqual(second.changed(), ['note'])
+
     @patch('api.external.lta.order_scenes', lta.order_scenes)
     @patch('api.providers.production.production_provider.ProductionProvider.set_products_unavailable',
            mock_production_provider.respond_true)
@@ -351,7 +601,7 @@ class TestProductionAPI(unittest.TestCase):
         self.assertIsInstance(response, set)
         self.assertTrue(len(response) > 0)
 
-    @patch('api.external.lpdaac.input_exists', lpdaac.input_exists_true)
+    @patch('api.external.lpdaac.inputs_exist', lpdaac.inputs_exist_true)
     def test_production_handle_submitted_modis_products_input_exists(self):
         # handle oncache scenario
         order = Order.find(self.mock_order.generate_testing_order(self.user_id))
@@ -363,7 +613,7 @@ class TestProductionAPI(unittest.TestCase):
         self.assertTrue(production_provider.handle_submitted_modis_products())
         self.assertEquals(Scene.find(sid).status, "oncache")
 
-    @patch('api.external.lpdaac.input_exists', lpdaac.input_exists_false)
+    @patch('api.external.lpdaac.inputs_exist', lpdaac.inputs_exist_false)
     def test_production_handle_submitted_modis_products_input_missing(self):
         # handle unavailable scenario
         order = Order.find(self.mock_order.generate_testing_order(self.user_id))
@@ -426,6 +676,18 @@ class TestProductionAPI(unittest.TestCase):
         response = api.queue_products(*params)
         self.assertTrue(response)
 
+    def test_production_queue_products_running_count(self):
+        order_id = self.mock_order.generate_testing_order(self.user_id)
+        self.mock_order.update_scenes(order_id, 'status', ['oncache'])
+        order = Order.find(order_id)
+        names_tuple = [(order.orderid, s.name) for s in order.scenes()][:3]
+        api.queue_products(names_tuple, 'get_products_to_process', 'jobname49')
+
+        with db_instance() as db:
+            db.select('select running from ordering_user_running where user_id = %s',
+                      (self.user_id,))
+            self.assertEqual(db[0]['running'], len(names_tuple))
+
     def test_production_get_key(self):
         key = 'system_message_title'
         response = api.get_production_key(key)
@@ -458,5 +720,130 @@ class TestProductionAPI(unittest.TestCase):
         for s in Scene.where({'order_id': order_id}):
             self.assertTrue(s.orphaned)
 
+
+class TestPipeline(unittest.TestCase):
+    class Provider(object):
+        def __init__(self):
+            self.ran = []
+
+        def poll_lta(self):
+            self.ran.append('poll_lta')
+            pipeline.count(3)
+
+        def finalize(self):
+            self.ran.append('finalize')
+
+        def slow(self):
+            # past the half second bounded_map polls a call's timeout at
+            time.sleep(1)
+            self.ran.append('slow')
+
+    stages = [pipeline.Stage('poll-lta', 'poll_lta', 'lta', services=('lta',), cadence=60),
+              pipeline.Stage('finalize', 'finalize', 'db')]
+
+    def setUp(self):
+        for target in ('config', 'cache', 'lease'):
+            patcher = patch('api.providers.production.pipeline.{0}'.format(target))
+            setattr(self, target, patcher.start())
+            self.addCleanup(patcher.stop)
+        self.config.get.side_effect = lambda key: (None,) * len(key) if isinstance(key, list) else None
+        self.cache.get.return_value = None
+        self.lease.Lease.return_value.acquire.return_value = True
+        self.lease.Lease.return_value.lost = False
+
+        patcher = patch('api.external.circuit.breaker')
+        self.breaker = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker.return_value.is_open.return_value = False
+
+        self.provider = self.Provider()
+        self.pipeline = pipeline.Pipeline(self.provider, self.stages)
+
+    def test_run_counts_items(self):
+        records = self.pipeline.run(budget=240)
+        self.assertEqual(sorted(self.provider.ran), ['finalize', 'poll_lta'])
+        self.assertEqual(records['poll-lta']['result'], 'ok')
+        self.assertEqual(records['poll-lta']['items'], 3)
+        self.assertEqual(records['finalize']['items'], 0)
+
+    def test_open_circuit_skipped(self):
+        self.breaker.return_value.is_open.return_value = True
+        records = self.pipeline.run(budget=240)
+        self.assertEqual(self.provider.ran, ['finalize'])
+        self.assertEqual(records['poll-lta']['result'], 'skipped, lta circuit open')
+
+    def test_budget_spent(self):
+        self.pipeline.run(budget=0)
+        self.assertEqual(self.provider.ran, ['finalize'])
+
+    def test_lock_held(self):
+        self.lease.Lease.return_value.acquire.return_value = False
+        records = self.pipeline.run(budget=240)
+        self.assertEqual(self.provider.ran, [])
+        self.assertEqual(records['finalize']['result'], 'skipped, already running')
+
+    def test_cadence(self):
+        self.cache.get.return_value = {'started': datetime.datetime.now()}
+        records = self.pipeline.run(['poll-lta'], budget=240)
+        self.assertEqual(records['poll-lta']['result'], 'not due')
+
+        self.pipeline.run(['poll-lta'], force=True, budget=240)
+        self.assertEqual(self.provider.ran, ['poll_lta'])
+
+    def test_cadence_checked_under_lease(self):
+        # another worker ran the stage while this one waited on its lease
+        self.cache.get.side_effect = [None, {'started': datetime.datetime.now()}]
+        records = self.pipeline.run(['poll-lta'], budget=240)
+
+        self.assertEqual(records['poll-lta']['result'], 'not due')
+        self.assertEqual(self.provider.ran, [])
+        self.lease.Lease.return_value.release.assert_called_once_with()
+
+    def test_started_recorded_first(self):
+        self.pipeline.run(['finalize'], budget=240)
+
+        first, last = [c[0][1] for c in self.cache.set.call_args_list]
+        self.assertEqual(first['result'], 'running')
+        self.assertEqual(first['started'], last['started'])
+
+    def test_unknown_stage(self):
+        self.assertRaises(pipeline.PipelineException, self.pipeline.run, ['nope'])
+
+    def test_timed_out_stage_keeps_lease(self):
+        stage = pipeline.Stage('slow', 'slow', 'db', timeout=0.1)
+        held = self.lease.Lease.return_value
+
+        records = pipeline.Pipeline(self.provider, [stage]).run(budget=240)
+        self.assertTrue(records['slow']['result'].startswith('timed out'))
+        self.assertFalse(held.release.called)
+
+        # the stage carries on, and gives up its lease once it finishes
+        time.sleep(1)
+        self.assertEqual(self.provider.ran, ['slow'])
+        held.release.assert_called_once_with()
+        self.assertEqual(self.cache.set.call_args[0][1]['result'], 'ok')
+
+
+class TestSceneLog(unittest.TestCase):
+    def test_truncate_keeps_head_and_tail(self):
+        text = 'head' + 'x' * 1000 + 'tail'
+        kept, truncated = SceneLog.truncate(text, 100)
+        self.assertTrue(truncated)
+        self.assertTrue(kept.startswith('head'))
+        self.assertTrue(kept.endswith('tail'))
+        self.assertIn('[... 908 bytes of log dropped ...]', kept)
+        self.assertEqual(SceneLog.truncate('short', 100), ('short', False))
+
+    def test_stream_and_tail(self):
+        text = ''.join('line {0}\n'.format(i) for i in range(10000))
+        compressed = zlib.compress(text)
+        chunks = list(SceneLog.stream(compressed, chunk_size=1024))
+        self.assertTrue(len(chunks) > 1)
+        self.assertEqual(''.join(chunks), text)
+
+        with patch.object(SceneLog, '_compressed', return_value=iter([(1, compressed)])):
+            self.assertEqual(SceneLog.read([1, 2], tail=10), {1: text[-10:], 2: ''})
+
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
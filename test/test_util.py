@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+import ConfigParser
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from mock import patch
+
+from api import util
+from api.util import parallel
+from api.util.parallel import bounded_map, ParallelException
+
+
+class TestCfgCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.cfgfile = os.path.join(self.tmpdir, 'cfgnfo')
+        self.write_cfg('10.0.0.1, 10.0.0.2')
+
+    def write_cfg(self, blacklist):
+        with open(self.cfgfile, 'w') as f:
+            f.write('[config]\nuser_blacklist = {0}\n'.format(blacklist))
+
+    def test_parsed_once(self):
+        with patch.object(ConfigParser.ConfigParser, 'read', autospec=True,
+                          side_effect=ConfigParser.ConfigParser.read) as read:
+            util.api_cfg(cfgfile=self.cfgfile)
+            util.api_cfg(cfgfile=self.cfgfile)
+
+        self.assertEqual(read.call_count, 1)
+
+    def test_reloaded_on_change(self):
+        self.assertEqual(util.api_cfg_set('user_blacklist', cfgfile=self.cfgfile),
+                         frozenset(['10.0.0.1', '10.0.0.2']))
+
+        self.write_cfg('10.0.0.3')
+        os.utime(self.cfgfile, (0, 0))
+
+        with patch('api.util.CFG_CHECK_INTERVAL', 0):
+            self.assertEqual(util.api_cfg_set('user_blacklist', cfgfile=self.cfgfile),
+                             frozenset(['10.0.0.3']))
+
+    def test_copies_returned(self):
+        util.api_cfg(cfgfile=self.cfgfile)['user_blacklist'] = ''
+        self.assertTrue(util.api_cfg(cfgfile=self.cfgfile)['user_blacklist'])
+
+
+class TestBoundedMap(unittest.TestCase):
+    def test_input_order(self):
+        def slow_square(n):
+            time.sleep(0.01 * (5 - n))
+            return n * n
+
+        results = bounded_map(slow_square, range(5), workers=5)
+        self.assertEqual([r for _, r, _ in results], [0, 1, 4, 9, 16])
+
+    def test_errors_returned(self):
+        def fail(n):
+            raise ValueError(n)
+
+        [(item, result, error)] = bounded_map(fail, ['LE70290302003142EDC00'])
+        self.assertIsNone(result)
+        self.assertIsInstance(error, ValueError)
+
+    def test_timeout(self):
+        results = bounded_map(time.sleep, [0, 2], workers=2, timeout=0.2)
+
+        self.assertIsNone(results[0][2])
+        self.assertIsInstance(results[1][2], ParallelException)
+
+    def test_deadline(self):
+        start = time.time()
+        results = bounded_map(time.sleep, [2, 2, 2], workers=1, deadline=0.2)
+
+        self.assertLess(time.time() - start, 1)
+        self.assertTrue(all(isinstance(e, ParallelException) for _, _, e in results))
+
+    def test_deadline_skips_unstarted_calls(self):
+        calls = []
+
+        def poll(n):
+            calls.append(n)
+            time.sleep(0.3)
+
+        bounded_map(poll, range(5), workers=1, deadline=0.1)
+        # let the first call finish so the pool picks up the rest
+        time.sleep(0.5)
+        self.assertEqual(calls, [0])
+
+    def test_timeout_bounds_unstarted_calls(self):
+        start = time.time()
+        # the one thread hangs on the first call, the rest never start
+        results = bounded_map(time.sleep, [5, 0, 0], workers=1, timeout=0.2)
+
+        self.assertLess(time.time() - start, 2)
+        self.assertTrue(all(isinstance(e, ParallelException) for _, _, e in results))
+
+    def test_threads_reused(self):
+        def thread_id(n):
+            time.sleep(0.05)
+            return threading.current_thread().ident
+
+        # start from no threads, earlier tests leave abandoned calls running
+        parallel._workers_pid = None
+        first = set(r for _, r, _ in bounded_map(thread_id, range(4), workers=4))
+        second = set(r for _, r, _ in bounded_map(thread_id, range(4), workers=4))
+        self.assertEqual(len(first), 4)
+        self.assertEqual(first, second)
+
+    def test_workers_bound(self):
+        running = []
+        most = []
+        lock = threading.Lock()
+
+        def count(n):
+            with lock:
+                running.append(n)
+                most.append(len(running))
+            time.sleep(0.02)
+            with lock:
+                running.remove(n)
+
+        bounded_map(count, range(10), workers=3)
+        self.assertEqual(max(most), 3)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)